@@ -6,8 +6,18 @@ import os
 import contextlib
 import signal
 import random
+from core.warmup import configure_kernel_cache
+
+# Persist compiled XPU kernels across restarts; must happen before torch loads.
+configure_kernel_cache()
 import torch
-from helpers.cli_manager import setup_logging, log_system_info, APP_LOGGER_NAME
+from helpers.cli_manager import (
+    setup_logging,
+    log_system_info,
+    ProgressLogger,
+    APP_LOGGER_NAME,
+)
+from core.settings import settings, update_settings
 from core.logic import (
     SCHEDULER_MAP,
     get_available_models,
@@ -38,12 +48,200 @@ parser.add_argument(
     action="store_true",
     help="Enable Gradio sharing (only works with --ui gradio).",
 )
+parser.add_argument(
+    "--queue-size",
+    type=int,
+    default=None,
+    help="Maximum number of generation jobs that can wait in the queue.",
+)
+
+parser.add_argument(
+    "--output-format",
+    type=str,
+    default=None,
+    choices=["png", "webp", "jpeg"],
+    help="File format of generated images (default: png).",
+)
+parser.add_argument(
+    "--png-compress-level",
+    type=int,
+    default=None,
+    choices=range(10),
+    help="PNG compression level, 0 (fastest) to 9 (smallest). Default: 6.",
+)
+parser.add_argument(
+    "--jpeg-quality", type=int, default=None, help="JPEG quality (default: 95)."
+)
+parser.add_argument(
+    "--webp-quality", type=int, default=None, help="Lossy WebP quality (default: 90)."
+)
+parser.add_argument(
+    "--webp-lossless",
+    action="store_true",
+    default=None,
+    help="Write lossless WebP files (with --output-format webp).",
+)
+parser.add_argument(
+    "--conversion-cache-gb",
+    type=float,
+    default=None,
+    help="Disk budget in GB for cached diffusers conversions of checkpoints (default: 40).",
+)
+parser.add_argument(
+    "--no-conversion-cache",
+    action="store_false",
+    dest="conversion_cache",
+    default=None,
+    help="Always convert single-file checkpoints on load instead of caching the result.",
+)
+parser.add_argument(
+    "--load-mode",
+    choices=["lazy", "eager"],
+    default=None,
+    help="Load models component by component onto the device (lazy, default) or all at once in RAM (eager).",
+)
+parser.add_argument(
+    "--no-warmup",
+    action="store_false",
+    dest="warmup",
+    default=None,
+    help="Skip the short warmup generation after a model is loaded.",
+)
+parser.add_argument(
+    "--snap-resolutions",
+    action="store_true",
+    default=None,
+    help="Round requested sizes to the nearest standard resolution so compiled kernels are reused.",
+)
+parser.add_argument(
+    "--preview-interval",
+    type=int,
+    default=None,
+    help="Stream a latent preview every N sampling steps in the web UI (0 disables).",
+)
+parser.add_argument(
+    "--max-batch-size",
+    type=int,
+    default=None,
+    help="Run up to N compatible queued generations as one batch (1 disables batching).",
+)
+parser.add_argument(
+    "--batch-window-ms",
+    type=float,
+    default=None,
+    help="How long a generation waits for compatible requests to batch with.",
+)
+parser.add_argument(
+    "--embedding-cache-mb",
+    type=int,
+    default=None,
+    help="Memory for cached prompt embeddings in MB (0 disables the cache).",
+)
+parser.add_argument(
+    "--no-result-cache",
+    action="store_false",
+    dest="result_cache",
+    default=None,
+    help="Always regenerate, even when an image with identical parameters exists.",
+)
+parser.add_argument(
+    "--device",
+    type=str,
+    default=None,
+    help="Device backend: auto (default), xpu, cpu, or another torch device such as cuda.",
+)
+parser.add_argument(
+    "--cpu-threads",
+    type=int,
+    default=None,
+    help="Intra-op threads for the CPU backend (default: one per physical core).",
+)
+parser.add_argument(
+    "--workers",
+    type=str,
+    default=None,
+    help="Serve the web UI from N worker processes, or one per listed device, e.g. xpu:0,xpu:1 or cpu:0-15,cpu:16-31.",
+)
+parser.add_argument(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="Port for /metrics with --ui gradio (default: --port + 1). The custom UI serves it on its own port.",
+)
+parser.add_argument(
+    "--profile-every",
+    type=int,
+    default=None,
+    help="Profile 1 in N generations and model loads with torch.profiler; traces go to profiles/.",
+)
+parser.add_argument(
+    "--batch",
+    type=str,
+    default=None,
+    metavar="JOBS.jsonl",
+    help="Run the generation jobs in a JSONL file headlessly, then exit. Resumable.",
+)
+parser.add_argument(
+    "--batch-results",
+    type=str,
+    default=None,
+    help="Results JSONL for --batch (default: next to the job file).",
+)
+parser.add_argument(
+    "--backfill-thumbnails",
+    action="store_true",
+    help="Create missing gallery thumbnails, remove orphaned ones, then exit.",
+)
+parser.add_argument(
+    "--vram-budget",
+    type=float,
+    default=None,
+    help="VRAM (GB) cached pipelines may keep on the GPU (default: 80%% of VRAM).",
+)
+parser.add_argument(
+    "--ram-budget",
+    type=float,
+    default=None,
+    help="Host RAM (GB) for pipelines parked off the GPU (default: 50%% of RAM).",
+)
+parser.add_argument(
+    "--max-cached-models",
+    type=int,
+    default=None,
+    help="Maximum number of pipelines kept loaded at once (default: 3).",
+)
 
 args = parser.parse_args()
 
 # --- Initial Setup ---
 setup_logging(disable_filters=args.disable_filters)
 logger = logging.getLogger(APP_LOGGER_NAME)
+update_settings(
+    queue_size=args.queue_size,
+    vram_budget_gb=args.vram_budget,
+    ram_budget_gb=args.ram_budget,
+    max_cached_pipelines=args.max_cached_models,
+    output_format=args.output_format,
+    png_compress_level=args.png_compress_level,
+    jpeg_quality=args.jpeg_quality,
+    webp_quality=args.webp_quality,
+    webp_lossless=args.webp_lossless,
+    preview_interval=args.preview_interval,
+    conversion_cache=args.conversion_cache,
+    conversion_cache_gb=args.conversion_cache_gb,
+    load_mode=args.load_mode,
+    warmup=args.warmup,
+    snap_resolutions=args.snap_resolutions,
+    max_batch_size=args.max_batch_size,
+    batch_window_ms=args.batch_window_ms,
+    embedding_cache_mb=args.embedding_cache_mb,
+    result_cache=args.result_cache,
+    device=args.device,
+    cpu_threads=args.cpu_threads,
+    workers=args.workers,
+    metrics_port=args.metrics_port,
+    profile_every=args.profile_every,
+)
 
 
 # --- Graceful Shutdown ---
@@ -62,8 +260,38 @@ def launch_gradio():
     import gradio as gr
     from ui import create_ui
     from core import logic as core
+    from core.events import event_bus
+    from core.jobs import job_queue, new_job_id
 
     logger.info("Launching Gradio UI...")
+    if settings["workers"]:
+        logger.warning("--workers only applies to the custom web UI; Gradio runs in this process.")
+
+    def run_on_worker(kind, func, *args, progress=None, **kwargs):
+        """Runs a core function on the generation worker, mirroring progress to Gradio."""
+        job_id = new_job_id()
+        token = None
+        if progress is not None:
+            token = event_bus.subscribe(
+                lambda e: (
+                    progress(e.data["progress"], desc=e.data["description"])
+                    if e.kind == "progress"
+                    else None
+                ),
+                job_id=job_id,
+            )
+        try:
+            return job_queue.submit(
+                kind,
+                func,
+                *args,
+                job_id=job_id,
+                progress_callback=event_bus.progress_reporter(job_id),
+                **kwargs,
+            ).future.result()
+        finally:
+            if token is not None:
+                event_bus.unsubscribe(token)
 
     # Wrapper functions (handlers) that adapt core logic for Gradio
     def load_model_handler_gr(
@@ -75,13 +303,16 @@ def launch_gradio():
         progress=gr.Progress(),  # NEW: Added lora_name
     ):
         try:
-            result = core.load_model(
+            # All pipeline work runs on the shared generation worker.
+            result = run_on_worker(
+                "load_model",
+                core.load_model,
                 model_name,
                 scheduler_name,
                 vae_tiling,
                 cpu_offload,
                 lora_name,  # NEW: Pass lora_name
-                progress_callback=lambda p, d: progress(p, desc=d),
+                progress=progress,
             )
             return (
                 result["status_message"],
@@ -100,12 +331,16 @@ def launch_gradio():
         width,
         height,
         lora_weight,  # NEW: Added lora_weight
+        lora_name,
+        scheduler_name,
         progress=gr.Progress(),
     ):
         if not core.app_state["is_model_loaded"]:
             raise gr.Error("No model is loaded.")
         try:
-            result = core.generate_image(
+            result = run_on_worker(
+                "generate_image",
+                core.generate_image,
                 prompt,
                 negative_prompt,
                 steps,
@@ -114,15 +349,25 @@ def launch_gradio():
                 width,
                 height,
                 lora_weight,  # NEW: Pass lora_weight
-                progress_callback=lambda p, d: progress(p, desc=d),
+                progress=progress,
+                return_image=True,
+                # LoRAs are hot-swapped per generation; no reload needed.
+                loras=[{"name": lora_name, "weight": lora_weight}],
+                scheduler_name=scheduler_name,
             )
-            # Gradio's gr.Image needs a file path or PIL image
-            image_path = os.path.join("./outputs", result["image_filename"])
-            return image_path, result["info"]
+            # Gradio's gr.Image accepts the PIL image directly, no need to wait for the file
+            return result["image"], result["info"]
         except Exception as e:
             logger.error(f"Image generation failed: {e}", exc_info=True)
             raise gr.Error(str(e))
 
+    def get_gallery_handler_gr():
+        core.image_writer.flush()  # Include images still being written
+        return [
+            core.thumbnail_service.path_or_original(f, 512)
+            for f in core.get_output_images()
+        ]
+
     def refresh_models_handler_gr():
         logger.info("Refreshing model list...")
         return gr.Dropdown(choices=core.get_available_models())
@@ -133,7 +378,7 @@ def launch_gradio():
         return gr.Dropdown(choices=["None"] + core.get_available_loras())
 
     def unload_model_handler_gr():
-        result = core.unload_model()
+        result = run_on_worker("unload_model", core.unload_model)
         return result["status_message"]
 
     def swap_dimensions_handler_gr(w, h):
@@ -142,18 +387,20 @@ def launch_gradio():
     def randomize_seed_handler_gr():
         return random.randint(0, 2**32 - 1)
 
+    def recommended_steps_handler_gr(scheduler_name):
+        return gr.Slider(value=core.recommended_steps(scheduler_name))
+
     # Gradio doesn't need a VAE tiling handler, it's passed at load time.
     # We pass a dummy lambda to prevent errors.
     handlers = {
         "load_model": load_model_handler_gr,
         "generate_image": generate_image_handler_gr,
-        "get_gallery": lambda: [
-            os.path.join("./outputs", f) for f in core.get_output_images()
-        ],
+        "get_gallery": get_gallery_handler_gr,
         "refresh_models": refresh_models_handler_gr,
         "refresh_loras": refresh_loras_handler_gr,  # NEW
         "randomize_seed": randomize_seed_handler_gr,
         "swap_dims": swap_dimensions_handler_gr,
+        "recommended_steps": recommended_steps_handler_gr,
         "unload_model": unload_model_handler_gr,
         "toggle_vae_tiling": lambda: None,
     }
@@ -166,6 +413,11 @@ def launch_gradio():
         handlers,
     )
 
+    # Gradio owns its server, so metrics get a small one of their own.
+    from core.metrics import metrics
+
+    metrics.serve(args.host, settings["metrics_port"] or args.port + 1)
+
     logger.info("UI is ready. Launching Gradio server...")
     logger.info(
         "Access ArtTic-LAB via the URLs below. Press Ctrl+C in this terminal to shutdown."
@@ -184,6 +436,11 @@ def launch_web_ui():
         logger.error("Please run the installer (install.bat or install.sh) again.")
         sys.exit(1)
 
+    if settings["workers"]:
+        from core.worker_pool import worker_pool, parse_worker_specs
+
+        worker_pool.start(parse_worker_specs(settings["workers"]))
+
     logger.info("Launching custom web UI...")
     logger.info(f"Access ArtTic-LAB at http://{args.host}:{args.port}")
     logger.info("Press Ctrl+C in this terminal to shutdown.")
@@ -203,6 +460,23 @@ if __name__ == "__main__":
     # Log system info once at the start
     log_system_info()
 
+    # Mirror job progress from the event bus to the terminal
+    from core.events import event_bus
+
+    event_bus.subscribe(ProgressLogger())
+
+    if args.backfill_thumbnails:
+        from core.logic import backfill_thumbnails
+
+        backfill_thumbnails()
+        sys.exit(0)
+
+    if args.batch:
+        from core.batch_runner import run_batch
+
+        summary = run_batch(args.batch, results_path=args.batch_results)
+        sys.exit(1 if summary["failed"] else 0)
+
     # Launch the selected UI
     if args.ui == "gradio":
         launch_gradio()
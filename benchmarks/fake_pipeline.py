@@ -0,0 +1,128 @@
+# benchmarks/fake_pipeline.py
+"""
+A pipeline that sleeps instead of computing, for exercising the server, the
+job queue and the event bus independent of device speed.
+
+`install()` makes `core.logic.load_model` return a `FakePipeline` for model
+names starting with `FAKE_MODEL_PREFIX`; everything around the pipeline
+(pipeline cache, embedding cache, batching, progress events, live previews,
+the image writer and the gallery) is the real code.
+"""
+import glob
+import logging
+import os
+import time
+from types import SimpleNamespace
+
+import torch
+from PIL import Image
+
+from pipelines import MODELS_DIR
+from pipelines.base_pipeline import ArtTicPipeline
+
+logger = logging.getLogger("arttic_lab")
+
+FAKE_MODEL_PREFIX = "loadtest-fake"
+
+
+class _FakeDiffusersPipe:
+    """Stands in for the diffusers pipeline where `core.logic` touches it directly."""
+
+    components = {}
+
+    def to(self, *args, **kwargs):
+        return self
+
+
+class FakePipeline(ArtTicPipeline):
+    """SD1.5-shaped pipeline whose load, text encoding, steps and decode are sleeps."""
+
+    scheduler_swappable = False
+    default_steps = 20
+    # Seconds; see `install`.
+    load_seconds = 2.0
+    encode_seconds = 0.02
+    step_seconds = 0.05
+    decode_seconds = 0.2
+
+    def load_pipeline(self, progress):
+        progress(0.2, desc="Loading fake pipeline...")
+        time.sleep(self.load_seconds)
+        self.pipe = _FakeDiffusersPipe()
+
+    def place_on_device(self, use_cpu_offload=False):
+        self.is_offloaded = False
+
+    def optimize_with_ipex(self, progress, force=False):
+        self.is_optimized = True
+
+    def _run_text_encoders(self, text):
+        time.sleep(self.encode_seconds)
+        return {"prompt_embeds": torch.zeros(1, 77, 8)}
+
+    def generate(
+        self,
+        prompt_embeds=None,
+        num_inference_steps=20,
+        width=512,
+        height=512,
+        generator=None,
+        callback_on_step_end=None,
+        **kwargs,
+    ):
+        batch_size = len(prompt_embeds) if prompt_embeds is not None else 1
+        if isinstance(generator, list):
+            generator = generator[0]
+        # Real latents so live previews are computed and sent as usual.
+        latents = torch.randn(batch_size, 4, height // 8, width // 8, generator=generator)
+        for step in range(num_inference_steps):
+            time.sleep(self.step_seconds)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, 0, {"latents": latents})
+        time.sleep(self.decode_seconds)
+        # Noise encodes about as slowly as a detailed image.
+        images = [Image.effect_noise((width, height), 64).convert("RGB") for _ in range(batch_size)]
+        return SimpleNamespace(images=images)
+
+
+def install(**timings):
+    """
+    Routes model names starting with `FAKE_MODEL_PREFIX` to `FakePipeline`,
+    overriding its `load_seconds`, `encode_seconds`, `step_seconds` and
+    `decode_seconds` with `timings`. Only affects this process.
+    """
+    from core import logic as core
+
+    for name, seconds in timings.items():
+        if not hasattr(FakePipeline, name):
+            raise KeyError(f"Unknown fake pipeline timing: {name}")
+        setattr(FakePipeline, name, float(seconds))
+
+    get_pipeline_for_model = core.get_pipeline_for_model
+
+    def get_pipeline(model_name):
+        if model_name.startswith(FAKE_MODEL_PREFIX):
+            return FakePipeline(os.path.join(MODELS_DIR, f"{model_name}.safetensors"))
+        return get_pipeline_for_model(model_name)
+
+    core.get_pipeline_for_model = get_pipeline
+
+
+def remove_outputs():
+    """Deletes the images generated by fake pipelines and their gallery entries."""
+    from core.gallery import gallery_index, OUTPUTS_DIR
+    from core.image_writer import image_writer
+    from core.thumbnails import thumbnail_service
+
+    image_writer.flush()
+    paths = glob.glob(os.path.join(OUTPUTS_DIR, f"*_{FAKE_MODEL_PREFIX}*"))
+    for path in paths:
+        filename = os.path.basename(path)
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        gallery_index.remove(filename)
+        thumbnail_service.invalidate(filename)
+    if paths:
+        logger.info(f"Removed {len(paths)} load-test image(s) from the outputs.")
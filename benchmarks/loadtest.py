@@ -0,0 +1,581 @@
+# benchmarks/loadtest.py
+"""
+Load test of the FastAPI/WebSocket server with a fake pipeline, so results
+reflect the server, the job queue and the event fan-out rather than the GPU.
+
+    python -m benchmarks.loadtest --clients 200 --duration 60
+    python -m benchmarks.loadtest --clients 500 --step-ms 20 --width 1024 --height 1024
+    python -m benchmarks.loadtest --serve --port 7860    # only the server, test it by hand
+
+It starts `web.server` in a child process with `benchmarks.fake_pipeline`
+installed, connects simulated clients that send `load_model`,
+`generate_image` and `unload_model` actions over `/ws`, and reports
+throughput, p50/p95/p99 latency per action, messages and bytes per client,
+the cost and skew of gallery broadcasts, and the event loop lag of the
+server. Reports go to `benchmarks/results/`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import Counter, defaultdict
+
+from core.settings import update_settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+STATS_PATH = "/api/loadtest"
+# How often the event loops are checked for late wake-ups.
+LAG_INTERVAL = 0.02
+# Client loop lag above this means the load generator, not the server, is the limit.
+CLIENT_LAG_WARNING = 0.05
+SERVER_START_TIMEOUT = 120
+
+# Action -> message type of its result.
+ACTION_RESULTS = {
+    "load_model": "model_loaded",
+    "generate_image": "generation_complete",
+    "unload_model": "model_unloaded",
+}
+DEFAULT_MIX = "generate_image=90,load_model=8,unload_model=2"
+PROMPTS = [
+    "a photo of an astronaut riding a horse on mars",
+    "oil painting of a castle in a forest at sunset",
+    "portrait of a woman, studio lighting, sharp focus",
+    "city street at night in the rain, cinematic lighting",
+]
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+    }
+
+
+class LoopLagMonitor:
+    """Samples how much later than asked the running event loop wakes from a sleep."""
+
+    def __init__(self, interval=LAG_INTERVAL):
+        self.interval = interval
+        self.samples = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+
+# --- Server side ---
+def serve(args):
+    """Runs the web server with the fake pipeline installed, plus the lag monitor."""
+    import uvicorn
+
+    from benchmarks.fake_pipeline import install, remove_outputs
+
+    update_settings(
+        device="cpu",
+        result_cache=False,
+        warmup=False,
+        queue_size=args.queue_size,
+        preview_interval=args.preview_interval,
+    )
+    install(
+        load_seconds=args.load_ms / 1000,
+        encode_seconds=args.encode_ms / 1000,
+        step_seconds=args.step_ms / 1000,
+        decode_seconds=args.decode_ms / 1000,
+    )
+    # Leftovers of a run that was killed before it could clean up.
+    remove_outputs()
+
+    from core.image_writer import image_writer
+    from core.jobs import job_queue
+    from core.metrics import metrics
+    from pipelines.loading import current_rss
+    from web.server import app, manager
+
+    lag = LoopLagMonitor()
+
+    def get_stats(reset: bool = False):
+        """Server-side measurements since the last reset."""
+        broadcast_count, broadcast_seconds = metrics.totals("websocket_broadcast_seconds").get(
+            (), (0, 0.0)
+        )
+        stats = {
+            "loop_lag": summarize(lag.samples),
+            "broadcasts": broadcast_count,
+            "broadcast_seconds": broadcast_seconds,
+            "connections": len(manager.active_connections),
+            "queue_depth": job_queue.depth(),
+            "image_writer": image_writer.stats(),
+            "rss_bytes": current_rss(),
+        }
+        if reset:
+            lag.samples = []
+        return stats
+
+    app.add_api_route(STATS_PATH, get_stats, methods=["GET"])
+
+    async def main():
+        config = uvicorn.Config(app, host=args.host, port=args.port, log_level="warning")
+        monitor = asyncio.create_task(lag.run())
+        try:
+            await uvicorn.Server(config).serve()
+        finally:
+            monitor.cancel()
+
+    logger.info(f"Load-test server with a fake pipeline on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(main())
+    finally:
+        remove_outputs()
+
+
+def start_server(args, port):
+    """Starts `serve` in a child process and waits until it answers."""
+    command = [
+        sys.executable, "-m", "benchmarks.loadtest", "--serve",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--queue-size", str(args.queue_size or max(args.clients, 16)),
+        "--preview-interval", str(args.preview_interval),
+        "--load-ms", str(args.load_ms),
+        "--encode-ms", str(args.encode_ms),
+        "--step-ms", str(args.step_ms),
+        "--decode-ms", str(args.decode_ms),
+    ]
+    process = subprocess.Popen(command)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The load-test server exited with code {process.returncode}.")
+        try:
+            fetch_stats(f"http://127.0.0.1:{port}")
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("The load-test server did not start in time.")
+
+
+def stop_server(process):
+    # SIGINT lets uvicorn shut down and the server remove its images; on
+    # Windows they are removed when the next server starts.
+    if os.name == "nt":
+        process.terminate()
+    else:
+        process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def fetch_stats(base_url, reset=False):
+    url = f"{base_url}{STATS_PATH}" + ("?reset=true" if reset else "")
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Client side ---
+class Recorder:
+    """What all simulated clients observed during the measured phase."""
+
+    def __init__(self):
+        self.connect_seconds = []
+        self.connect_failures = 0
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.rejected = Counter()
+        self.timeouts = Counter()
+        self.error_messages = Counter()
+        self.messages = Counter()
+        self.message_bytes = 0
+        # Gallery image -> times each client received its broadcast.
+        self.broadcasts = defaultdict(list)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        action, _, weight = part.partition("=")
+        if action.strip() not in ACTION_RESULTS:
+            raise ValueError(f"Unknown action in --mix: {action}")
+        mix[action.strip()] = float(weight or 1)
+    return mix
+
+
+def action_payload(action, rng, args):
+    if action == "load_model":
+        return {
+            "model_name": rng.choice(args.model_names),
+            "scheduler_name": "Euler",
+            "vae_tiling": False,
+            "cpu_offload": False,
+            "lora_name": "None",
+        }
+    if action == "generate_image":
+        return {
+            "prompt": rng.choice(PROMPTS),
+            "negative_prompt": "",
+            "steps": args.steps,
+            "guidance": 7.0,
+            "seed": rng.randrange(2**32),
+            "width": args.width,
+            "height": args.height,
+            "lora_weight": 1.0,
+        }
+    return {}
+
+
+async def run_client(index, url, args, recorder, deadline, start_delay):
+    """One browser tab: sends an action, waits for its result, thinks, repeats."""
+    import websockets
+
+    await asyncio.sleep(start_delay)
+    rng = random.Random(args.seed * 100003 + index)
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        websocket = await websockets.connect(url, max_size=None, ping_interval=None, open_timeout=60)
+    except Exception as e:
+        recorder.connect_failures += 1
+        logger.debug(f"Client {index} could not connect: {e}")
+        return
+    recorder.connect_seconds.append(time.perf_counter() - start)
+
+    waiting = {"future": None, "types": ()}
+
+    async def read():
+        try:
+            async for message in websocket:
+                recorder.message_bytes += len(message)
+                if isinstance(message, bytes):
+                    recorder.messages["preview_frame"] += 1
+                    continue
+                message = json.loads(message)
+                kind = message.get("type")
+                recorder.messages[kind] += 1
+                if kind == "gallery_item_added":
+                    recorder.broadcasts[message["data"]["image"]].append(time.perf_counter())
+                future = waiting["future"]
+                if kind in waiting["types"] and future is not None and not future.done():
+                    future.set_result(message)
+        finally:
+            # Do not leave the sender waiting for a reply on a closed socket.
+            future = waiting["future"]
+            if future is not None and not future.done():
+                future.set_exception(ConnectionError("The server closed the connection."))
+
+    reader = asyncio.create_task(read())
+    actions, weights = zip(*args.mix.items())
+    needs_model = False
+    try:
+        while time.perf_counter() < deadline:
+            action = "load_model" if needs_model else rng.choices(actions, weights)[0]
+            waiting["future"] = loop.create_future()
+            waiting["types"] = (ACTION_RESULTS[action], "error")
+            sent = time.perf_counter()
+            await websocket.send(
+                json.dumps({"action": action, "payload": action_payload(action, rng, args)})
+            )
+            try:
+                message = await asyncio.wait_for(waiting["future"], args.timeout)
+            except asyncio.TimeoutError:
+                recorder.timeouts[action] += 1
+                continue
+            if message["type"] == "error":
+                error = message["data"]["message"]
+                if "queue is full" in error:
+                    recorder.rejected[action] += 1
+                else:
+                    recorder.errors[action] += 1
+                    recorder.error_messages[error] += 1
+                # Someone unloaded the model; load it again like a user would.
+                needs_model = "no model is loaded" in error
+            else:
+                recorder.latencies[action].append(time.perf_counter() - sent)
+                needs_model = action == "unload_model"
+            if args.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+    except Exception as e:
+        logger.debug(f"Client {index} stopped: {e}")
+    finally:
+        reader.cancel()
+        await websocket.close()
+
+
+async def load_initial_model(url, args):
+    """Loads the first fake model before the clock starts."""
+    import websockets
+
+    async with websockets.connect(url, max_size=None, ping_interval=None) as websocket:
+        await websocket.send(
+            json.dumps(
+                {"action": "load_model", "payload": action_payload("load_model", random.Random(0), args)}
+            )
+        )
+        async for message in websocket:
+            if isinstance(message, str) and json.loads(message)["type"] in ("model_loaded", "error"):
+                return
+
+
+async def run_clients(url, args):
+    recorder = Recorder()
+    lag = LoopLagMonitor()
+    monitor = asyncio.create_task(lag.run())
+    start = time.perf_counter()
+    deadline = start + args.ramp + args.duration
+    await asyncio.gather(
+        *(
+            run_client(i, url, args, recorder, deadline, args.ramp * i / args.clients)
+            for i in range(args.clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    return recorder, elapsed, lag.samples
+
+
+def build_report(args, recorder, elapsed, client_lag, server):
+    connected = len(recorder.connect_seconds)
+    actions = {}
+    for action in ACTION_RESULTS:
+        latencies = recorder.latencies.get(action, [])
+        actions[action] = {
+            "completed": len(latencies),
+            "per_second": len(latencies) / elapsed,
+            "errors": recorder.errors[action],
+            "rejected": recorder.rejected[action],
+            "timeouts": recorder.timeouts[action],
+            "latency": summarize(latencies),
+        }
+    generated = len(recorder.latencies.get("generate_image", []))
+    total_messages = sum(recorder.messages.values())
+    # Time between the first and the last client receiving the same broadcast.
+    skews = [max(t) - min(t) for t in recorder.broadcasts.values() if len(t) > 1]
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "clients": args.clients,
+            "duration": args.duration,
+            "ramp": args.ramp,
+            "mix": args.mix,
+            "models": args.model_names,
+            "steps": args.steps,
+            "width": args.width,
+            "height": args.height,
+            "think_ms": args.think_ms,
+            "preview_interval": args.preview_interval,
+            "fake_ms": {
+                "load": args.load_ms,
+                "encode": args.encode_ms,
+                "step": args.step_ms,
+                "decode": args.decode_ms,
+            },
+        },
+        "elapsed_seconds": elapsed,
+        "connections": {
+            "connected": connected,
+            "failed": recorder.connect_failures,
+            "connect_seconds": summarize(recorder.connect_seconds),
+        },
+        "actions": actions,
+        "images_per_second": generated / elapsed,
+        "errors": dict(recorder.error_messages.most_common(5)),
+        "messages": {
+            "total": total_messages,
+            "bytes": recorder.message_bytes,
+            "by_type": dict(recorder.messages),
+            "per_client_per_second": total_messages / max(connected, 1) / elapsed,
+            "per_generation": total_messages / generated if generated else None,
+        },
+        "fan_out": {
+            "broadcasts": len(recorder.broadcasts),
+            "receivers": summarize([len(t) for t in recorder.broadcasts.values()]),
+            "delivery_skew_seconds": summarize(skews),
+            "server_seconds_per_broadcast": (
+                server["broadcast_seconds"] / server["broadcasts"]
+                if server and server["broadcasts"]
+                else None
+            ),
+        },
+        "server": server,
+        "client_loop_lag_seconds": summarize(client_lag),
+    }
+
+
+def _ms(value):
+    return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+
+def print_report(report):
+    connections = report["connections"]
+    print(
+        f"\n{connections['connected']} clients connected ({connections['failed']} failed) "
+        f"in {report['elapsed_seconds']:.1f}s; {report['images_per_second']:.2f} images/s."
+    )
+    print(f"{'action':<16}{'done':>7}{'per s':>8}{'err':>6}{'rej':>6}{'t/o':>6}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for action, stats in report["actions"].items():
+        latency = stats["latency"]
+        print(
+            f"{action:<16}{stats['completed']:>7}{stats['per_second']:>8.2f}{stats['errors']:>6}"
+            f"{stats['rejected']:>6}{stats['timeouts']:>6}  {_ms(latency.get('p50'))}"
+            f"  {_ms(latency.get('p95'))}  {_ms(latency.get('p99'))}"
+        )
+    messages, fan_out = report["messages"], report["fan_out"]
+    print(
+        f"Messages: {messages['total']} ({messages['bytes'] / 2**20:.1f} MiB), "
+        f"{messages['per_client_per_second']:.1f}/s per client"
+        + (
+            f", {messages['per_generation']:.1f} per generation."
+            if messages["per_generation"] is not None
+            else "."
+        )
+    )
+    skew = fan_out["delivery_skew_seconds"]
+    print(
+        f"Gallery broadcasts: {fan_out['broadcasts']}, server "
+        f"{_ms(fan_out['server_seconds_per_broadcast']).strip()} ms each, "
+        f"delivery skew p50 {_ms(skew.get('p50')).strip()} / p99 {_ms(skew.get('p99')).strip()} ms."
+    )
+    if report["server"]:
+        lag = report["server"]["loop_lag"]
+        print(
+            f"Server event loop lag: p50 {_ms(lag.get('p50')).strip()} / p95 "
+            f"{_ms(lag.get('p95')).strip()} / p99 {_ms(lag.get('p99')).strip()} / max "
+            f"{_ms(lag.get('max')).strip()} ms."
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ArtTic-LAB WebSocket load test with a fake pipeline.")
+    parser.add_argument("--serve", action="store_true", help="Only run the server with the fake pipeline.")
+    parser.add_argument("--url", default=None,
+                        help="Base URL of a running `--serve` server to test, e.g. http://127.0.0.1:7860.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of full load after the ramp.")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds over which clients connect.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weighted actions (default: {DEFAULT_MIX}).")
+    parser.add_argument("--models", type=int, default=2, help="Fake models load_model picks from.")
+    parser.add_argument("--think-ms", type=float, default=500, help="Mean pause between a client's actions.")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for an action's result.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--load-ms", type=float, default=2000, help="Fake model load time.")
+    parser.add_argument("--encode-ms", type=float, default=20, help="Fake text encoding time per prompt.")
+    parser.add_argument("--step-ms", type=float, default=50, help="Fake time per sampling step.")
+    parser.add_argument("--decode-ms", type=float, default=200, help="Fake VAE decode time.")
+    parser.add_argument("--preview-interval", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Server queue size (default: one slot per client).")
+    parser.add_argument("--output", default=None, help="Report path (default: benchmarks/results/).")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-job server logs.")
+    args = parser.parse_args(argv)
+    args.model_names = [f"loadtest-fake-{i}" for i in range(max(args.models, 1))]
+
+    from helpers.cli_manager import setup_logging
+
+    setup_logging()
+    if not args.verbose:
+        # Hundreds of clients would bury the report in per-job lines.
+        logger.setLevel(logging.WARNING)
+
+    if args.serve:
+        args.queue_size = args.queue_size or max(args.clients, 16)
+        serve(args)
+        return 0
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        logger.error("The load test needs the 'websockets' package: pip install websockets")
+        return 1
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        port = args.port or _free_port()
+        process = start_server(args, port)
+        base_url = f"http://127.0.0.1:{port}"
+    ws_url = base_url.replace("http", "ws", 1) + "/ws"
+
+    try:
+        asyncio.run(load_initial_model(ws_url, args))
+        try:
+            fetch_stats(base_url, reset=True)
+        except OSError:
+            logger.warning("The server has no load-test stats (not started with --serve).")
+        logger.warning(
+            f"Running {args.clients} clients for {args.duration:.0f}s "
+            f"(+{args.ramp:.0f}s ramp) against {ws_url}..."
+        )
+        recorder, elapsed, client_lag = asyncio.run(run_clients(ws_url, args))
+        try:
+            server = fetch_stats(base_url)
+        except OSError:
+            server = None
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    report = build_report(args, recorder, elapsed, client_lag, server)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"loadtest_{time.strftime('%Y%m%d-%H%M%S')}_{args.clients}c.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report written to '{output}'.")
+    client_lag_p99 = report["client_loop_lag_seconds"].get("p99")
+    if client_lag_p99 is not None and client_lag_p99 > CLIENT_LAG_WARNING:
+        logger.warning(
+            f"The load generator's own event loop lagged {client_lag_p99 * 1000:.0f} ms (p99); "
+            "latencies are partly its own. Use fewer clients per process."
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+# benchmarks/run.py
+"""
+Reproducible CPU benchmark of the model and generation paths, using the tiny
+random-weight pipelines from `benchmarks.tiny_models`.
+
+    python -m benchmarks.run                      # quick grid, compare to baseline
+    python -m benchmarks.run --grid full --repeats 5
+    python -m benchmarks.run --update-baseline    # make this run the new baseline
+
+For each family it measures header detection, model load (per phase and
+load mode) and, over a grid of sizes, step counts and batch sizes, the
+per-step latency, VAE decode, image save and end-to-end latency through
+`core.logic.generate_image_batch`. Results are written to
+`benchmarks/results/` and compared against `benchmarks/baseline.json`; the
+exit code is 1 when a timing regressed beyond the tolerance or there is no
+baseline to compare against. Baselines are machine specific: record one on
+the machine that runs the comparison.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from core.settings import update_settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+REPORT_VERSION = 1
+# A timing regresses when it is this much slower than the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and by more than this many seconds; smaller differences are timer noise.
+MIN_DELTA_SECONDS = 0.002
+
+GRIDS = {
+    "quick": {
+        "sizes": [(256, 256)],
+        "steps": [4],
+        "batch_sizes": [1, 2],
+        "load_modes": ["lazy"],
+    },
+    "full": {
+        "sizes": [(256, 256), (384, 256)],
+        "steps": [4, 12],
+        "batch_sizes": [1, 2, 4],
+        "load_modes": ["lazy", "eager"],
+    },
+}
+PROMPTS = [
+    "a photo of an astronaut riding a horse on mars",
+    "oil painting of a castle in a forest at sunset",
+    "portrait of a woman studio lighting sharp focus",
+    "city street at night in the rain cinematic lighting",
+]
+NEGATIVE_PROMPT = "blurry lowres watermark"
+GUIDANCE = 5.0
+
+
+def _median(values):
+    return statistics.median(values) if values else None
+
+
+def _stage_totals():
+    from core.metrics import metrics
+
+    totals = metrics.totals("generation_stage_seconds")
+    return {dict(key)["stage"]: value for key, value in totals.items()}
+
+
+def _stage_delta(before, after, stage):
+    """Mean seconds per observation of `stage` between two `_stage_totals`."""
+    count = after.get(stage, (0, 0.0))[0] - before.get(stage, (0, 0.0))[0]
+    total = after.get(stage, (0, 0.0))[1] - before.get(stage, (0, 0.0))[1]
+    return total / count if count else None
+
+
+# --- Measurements ---
+def bench_detection(family, checkpoint, repeats):
+    """Cold header parse + content hash, and the cached (stat only) lookup."""
+    from pipelines.model_index import ModelIndex
+    from benchmarks.tiny_models import EXPECTED_ARCHITECTURE
+
+    cold, cached = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(repeats):
+            index = ModelIndex(os.path.join(tmp, f"index-{i}.json"))
+            start = time.perf_counter()
+            entry = index.describe(checkpoint, save=False)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            index.describe(checkpoint, save=False)
+            cached.append(time.perf_counter() - start)
+    if entry["architecture"] != EXPECTED_ARCHITECTURE[family]:
+        raise RuntimeError(
+            f"{family} checkpoint detected as '{entry['architecture']}', "
+            f"expected '{EXPECTED_ARCHITECTURE[family]}'."
+        )
+    return {"detect_seconds": _median(cold), "detect_cached_seconds": _median(cached)}
+
+
+def bench_load(family, load_mode, repeats):
+    """
+    Loads the family's tiny model `repeats` times through `core.load_model`,
+    unloading in between, and once more from the pipeline cache. Returns
+    the median wall time, time per load phase (see `core.metrics`) and peak
+    RSS increase (see `pipelines.loading.load_stats`); the model is left
+    loaded. RSS is most comparable between load modes run in fresh processes.
+    """
+    from core import logic as core
+    from benchmarks.tiny_models import model_name
+    from pipelines.loading import load_stats
+
+    update_settings(load_mode=load_mode)
+    samples = {"total": []}
+    rss_increases = []
+    for _ in range(repeats):
+        if core.app_state["is_model_loaded"]:
+            _unload()
+        before = _phase_totals()
+        start = time.perf_counter()
+        core.load_model(model_name(family), "Euler", False, False, "None", warmup=False)
+        samples["total"].append(time.perf_counter() - start)
+        after = _phase_totals()
+        for phase, (count, total) in after.items():
+            previous_count, previous_total = before.get(phase, (0, 0.0))
+            if count > previous_count:
+                samples.setdefault(phase, []).append(total - previous_total)
+        pipeline_name = type(core.app_state["current_pipe"]).__name__
+        entry = load_stats.all().get(pipeline_name, {}).get(load_mode, {})
+        if entry.get("rss_increase_bytes") is not None:
+            rss_increases.append(entry["rss_increase_bytes"])
+
+    # Loading the active model again only restores it from the pipeline cache.
+    start = time.perf_counter()
+    core.load_model(model_name(family), "Euler", False, False, "None", warmup=False)
+    samples["cached"] = [time.perf_counter() - start]
+    report = {f"{name}_seconds": _median(times) for name, times in samples.items()}
+    report["peak_rss_increase_bytes"] = _median(rss_increases)
+    return report
+
+
+def _phase_totals():
+    from core.metrics import metrics
+
+    totals = metrics.totals("model_load_seconds")
+    return {dict(key)["phase"]: value for key, value in totals.items()}
+
+
+def _unload():
+    """Unloads the model, dropping it from the pipeline cache and its embeddings."""
+    from core import logic as core
+    from pipelines.embedding_cache import embedding_cache
+
+    core.unload_model()
+    embedding_cache.clear()
+    gc.collect()
+
+
+def bench_generation(width, height, steps, batch_size, repeats, out_dir):
+    """
+    Runs one grid point through `core.generate_image_batch` and saves the
+    images with the real writer. The first run warms the shape and is not
+    counted; prompt embeddings are cleared before each measured run so text
+    encoding is part of every one.
+    """
+    from core import logic as core
+    from core.image_writer import image_writer
+    from pipelines.embedding_cache import embedding_cache
+
+    calls = [
+        (
+            (),
+            {
+                "prompt": PROMPTS[i % len(PROMPTS)],
+                "negative_prompt": NEGATIVE_PROMPT,
+                "steps": steps,
+                "guidance": GUIDANCE,
+                "seed": 1000 + i,
+                "width": width,
+                "height": height,
+                "lora_weight": 1.0,
+                "loras": [],
+                "save_image": False,
+            },
+        )
+        for i in range(batch_size)
+    ]
+    core.generate_image_batch(calls)
+
+    samples = {name: [] for name in ("text_encode", "step", "vae_decode", "save", "end_to_end")}
+    for repeat in range(repeats):
+        embedding_cache.clear()
+        before = _stage_totals()
+        start = time.perf_counter()
+        results = core.generate_image_batch(calls)
+        writes = [
+            image_writer.submit(
+                result["image"], os.path.join(out_dir, f"{repeat}_{i}.png"), output_format="png"
+            )
+            for i, result in enumerate(results)
+        ]
+        timings = [write.result() for write in writes]
+        samples["end_to_end"].append(time.perf_counter() - start)
+        after = _stage_totals()
+
+        samples["text_encode"].append(_stage_delta(before, after, "text_encode"))
+        samples["step"].append(_stage_delta(before, after, "denoise_step"))
+        samples["vae_decode"].append(_stage_delta(before, after, "vae_decode"))
+        samples["save"].append(
+            sum(t["encode_seconds"] + t["write_seconds"] for t in timings) / len(timings)
+        )
+
+    end_to_end = _median(samples["end_to_end"])
+    return {
+        "width": width,
+        "height": height,
+        "steps": steps,
+        "batch_size": batch_size,
+        "text_encode_seconds": _median([s for s in samples["text_encode"] if s is not None]),
+        "step_seconds": _median([s for s in samples["step"] if s is not None]),
+        "vae_decode_seconds": _median([s for s in samples["vae_decode"] if s is not None]),
+        "save_seconds": _median(samples["save"]),
+        "end_to_end_seconds": end_to_end,
+        "images_per_second": batch_size / end_to_end if end_to_end else None,
+    }
+
+
+def bench_family(family, grid, repeats):
+    from benchmarks.tiny_models import ensure_model
+
+    _, checkpoint = ensure_model(family)
+    report = {"detection": bench_detection(family, checkpoint, repeats), "load": {}, "runs": []}
+
+    for load_mode in grid["load_modes"]:
+        logger.info(f"Benchmarking {family}: {load_mode} load...")
+        report["load"][load_mode] = bench_load(family, load_mode, repeats)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for width, height in grid["sizes"]:
+            for steps in grid["steps"]:
+                for batch_size in grid["batch_sizes"]:
+                    logger.info(
+                        f"Benchmarking {family}: {width}x{height}, {steps} steps, batch {batch_size}..."
+                    )
+                    report["runs"].append(
+                        bench_generation(width, height, steps, batch_size, repeats, out_dir)
+                    )
+    _unload()
+    return report
+
+
+# --- Reports ---
+def environment(dtype):
+    import diffusers
+    import torch
+
+    from pipelines.devices import get_backend
+
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "diffusers": diffusers.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "backend": get_backend().describe(),
+        "threads": torch.get_num_threads(),
+        "dtype": str(dtype),
+    }
+
+
+def flatten(report):
+    """Maps every timing in a report to a stable key, e.g. `sd15.256x256.s4.b2.step_seconds`."""
+    timings = {}
+    for family, data in report["families"].items():
+        for name, value in data["detection"].items():
+            timings[f"{family}.{name}"] = value
+        for load_mode, phases in data["load"].items():
+            for name, value in phases.items():
+                if name.endswith("_seconds"):
+                    timings[f"{family}.load.{load_mode}.{name}"] = value
+        for run in data["runs"]:
+            prefix = f"{family}.{run['width']}x{run['height']}.s{run['steps']}.b{run['batch_size']}"
+            for name, value in run.items():
+                if name.endswith("_seconds"):
+                    timings[f"{prefix}.{name}"] = value
+    return {key: value for key, value in timings.items() if value is not None}
+
+
+def compare(current, baseline, tolerance):
+    """Rows of `(key, baseline, current, ratio, status)` for timings in both reports."""
+    current, baseline = flatten(current), flatten(baseline)
+    rows = []
+    for key in sorted(current.keys() & baseline.keys()):
+        old, new = baseline[key], current[key]
+        ratio = new / old if old else None
+        if ratio is not None and ratio > 1 + tolerance and new - old > MIN_DELTA_SECONDS:
+            status = "REGRESSION"
+        elif ratio is not None and ratio < 1 - tolerance and old - new > MIN_DELTA_SECONDS:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((key, old, new, ratio, status))
+    return rows
+
+
+def print_comparison(rows):
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"{'timing':<{width}}  {'baseline':>10}  {'current':>10}  {'ratio':>6}  status")
+    for key, old, new, ratio, status in rows:
+        ratio_text = f"{ratio:.2f}" if ratio is not None else "-"
+        print(f"{key:<{width}}  {old:>10.4f}  {new:>10.4f}  {ratio_text:>6}  {status}")
+
+
+def print_load_modes(report):
+    """Lazy (component by component) vs. eager (`from_pretrained`) loads per family."""
+    rows = [
+        (family, data["load"]["eager"], data["load"]["lazy"])
+        for family, data in report["families"].items()
+        if {"eager", "lazy"} <= data["load"].keys()
+    ]
+    if not rows:
+        return
+    print(f"{'family':<8}{'eager s':>10}{'lazy s':>10}{'eager RSS MB':>14}{'lazy RSS MB':>13}")
+    for family, eager, lazy in rows:
+        rss = [
+            f"{load['peak_rss_increase_bytes'] / 2**20:.0f}"
+            if load["peak_rss_increase_bytes"] is not None
+            else "-"
+            for load in (eager, lazy)
+        ]
+        print(
+            f"{family:<8}{eager['total_seconds']:>10.3f}{lazy['total_seconds']:>10.3f}"
+            f"{rss[0]:>14}{rss[1]:>13}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ArtTic-LAB CPU benchmark with tiny models.")
+    parser.add_argument("--grid", choices=sorted(GRIDS), default="quick")
+    parser.add_argument(
+        "--families", default="sd15,sdxl,sd3,flux", help="Comma separated subset to run."
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Measured runs per grid point.")
+    parser.add_argument("--dtype", choices=["float32", "bfloat16"], default="float32")
+    parser.add_argument(
+        "--load-modes", default=None, help="Comma separated, overrides the grid (lazy,eager)."
+    )
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads (default: physical cores).")
+    parser.add_argument("--output", default=None, help="Report path (default: benchmarks/results/).")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store this run as the baseline."
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    from helpers.cli_manager import setup_logging
+
+    setup_logging()
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        logger.error(
+            f"No baseline at '{args.baseline}'. Run with --update-baseline on this machine "
+            "to record one."
+        )
+        return 1
+    # Everything on the CPU backend, nothing reused between runs or written to outputs/.
+    update_settings(
+        device="cpu",
+        cpu_threads=args.threads,
+        result_cache=False,
+        warmup=False,
+        conversion_cache=False,
+        max_batch_size=max(GRIDS[args.grid]["batch_sizes"]),
+    )
+
+    import torch
+    from benchmarks.tiny_models import install
+
+    dtype = getattr(torch, args.dtype)
+    install(dtype)
+    torch.manual_seed(0)
+    grid = dict(GRIDS[args.grid])
+    if args.load_modes:
+        grid["load_modes"] = [m.strip() for m in args.load_modes.split(",") if m.strip()]
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "grid": args.grid,
+        "repeats": args.repeats,
+        "environment": environment(dtype),
+        "families": {},
+    }
+    for family in [f.strip() for f in args.families.split(",") if f.strip()]:
+        report["families"][family] = bench_family(family, grid, args.repeats)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{args.grid}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Benchmark report written to '{output}'.")
+    print_load_modes(report)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved as the baseline '{args.baseline}'.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    changed = {
+        key: (baseline["environment"].get(key), value)
+        for key, value in report["environment"].items()
+        if baseline["environment"].get(key) != value
+    }
+    if changed:
+        logger.warning(
+            "The baseline was recorded in a different environment, timings may not compare: "
+            + ", ".join(f"{key} {old} -> {new}" for key, (old, new) in changed.items())
+        )
+    rows = compare(report, baseline, args.tolerance)
+    print_comparison(rows)
+    regressions = [row for row in rows if row[4] == "REGRESSION"]
+    if regressions:
+        logger.error(f"{len(regressions)} timing(s) regressed by more than {args.tolerance:.0%}.")
+        return 1
+    logger.info(f"No regressions against the baseline ({len(rows)} timings compared).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
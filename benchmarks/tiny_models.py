@@ -0,0 +1,343 @@
+# benchmarks/tiny_models.py
+"""
+Tiny, randomly initialized SD1.5 / SDXL / SD3 / FLUX-shaped pipelines built
+locally (no downloads), plus the ArtTic pipeline classes that load them.
+
+The models keep the real architectures, latent channel counts and the 8x VAE
+downscale, so every code path (text encoding, denoising, VAE decode, previews,
+buckets) runs as it does with real checkpoints, only with far fewer channels
+and layers. Weights are seeded, so every machine builds identical models.
+"""
+import json
+import logging
+import os
+
+import torch
+from diffusers import (
+    AutoencoderKL,
+    EulerDiscreteScheduler,
+    FlowMatchEulerDiscreteScheduler,
+    FluxPipeline,
+    FluxTransformer2DModel,
+    SD3Transformer2DModel,
+    StableDiffusion3Pipeline,
+    StableDiffusionPipeline,
+    StableDiffusionXLPipeline,
+    UNet2DConditionModel,
+)
+from safetensors.torch import save_file
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import (
+    CLIPTextConfig,
+    CLIPTextModel,
+    CLIPTextModelWithProjection,
+    PreTrainedTokenizerFast,
+    T5Config,
+    T5EncoderModel,
+)
+
+from pipelines.flux_pipeline import ArtTicFLUXPipeline
+from pipelines.sd15_pipeline import SD15Pipeline
+from pipelines.sd3_pipeline import SD3Pipeline
+from pipelines.sdxl_pipeline import SDXLPipeline
+
+logger = logging.getLogger("arttic_lab")
+
+MODELS_DIR = os.path.join("./cache", "benchmarks", "models")
+# Bump when a builder changes so stale local models are rebuilt.
+BUILD_VERSION = 1
+SEED = 0
+
+# Words the benchmark prompts are made of; anything else maps to <unk>.
+VOCABULARY = (
+    "a photo of an astronaut riding horse on mars portrait woman man cat dog "
+    "castle forest mountain lake city street night day sunset sunrise painting "
+    "oil watercolor digital art detailed sharp focus cinematic lighting studio "
+    "highly intricate soft warm cold blue red green golden hour fog rain snow "
+    "blurry ugly lowres bad anatomy deformed watermark text"
+).split()
+SPECIAL_TOKENS = ("<s>", "<pad>", "</s>", "<unk>")
+
+
+# --- Components ---
+def _tokenizer(max_length):
+    vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS + tuple(VOCABULARY))}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<s>",
+        pad_token="<pad>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        model_max_length=max_length,
+    )
+
+
+def _clip_config(**overrides):
+    return CLIPTextConfig(
+        bos_token_id=0,
+        pad_token_id=1,
+        eos_token_id=2,
+        hidden_size=32,
+        intermediate_size=37,
+        layer_norm_eps=1e-05,
+        num_attention_heads=4,
+        num_hidden_layers=5,
+        vocab_size=len(SPECIAL_TOKENS) + len(VOCABULARY),
+        **overrides,
+    )
+
+
+def _vae(latent_channels, **overrides):
+    # Four blocks give the real 8x downscale at a fraction of the channels.
+    return AutoencoderKL(
+        in_channels=3,
+        out_channels=3,
+        block_out_channels=(16, 16, 32, 32),
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        layers_per_block=1,
+        latent_channels=latent_channels,
+        norm_num_groups=8,
+        **overrides,
+    )
+
+
+def _sd_scheduler():
+    return EulerDiscreteScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        beta_schedule="scaled_linear",
+        steps_offset=1,
+        timestep_spacing="leading",
+    )
+
+
+# --- Pipelines ---
+def build_sd15():
+    torch.manual_seed(SEED)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        sample_size=64,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32,
+    )
+    return StableDiffusionPipeline(
+        vae=_vae(4),
+        text_encoder=CLIPTextModel(_clip_config()),
+        tokenizer=_tokenizer(77),
+        unet=unet,
+        scheduler=_sd_scheduler(),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+
+
+def build_sdxl():
+    torch.manual_seed(SEED)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        sample_size=64,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        attention_head_dim=(2, 4),
+        use_linear_projection=True,
+        addition_embed_type="text_time",
+        addition_time_embed_dim=8,
+        transformer_layers_per_block=(1, 2),
+        # Six 8-dim time ids plus the 32-dim pooled text embedding.
+        projection_class_embeddings_input_dim=80,
+        # Both text encoders' hidden states, concatenated.
+        cross_attention_dim=64,
+    )
+    return StableDiffusionXLPipeline(
+        vae=_vae(4),
+        text_encoder=CLIPTextModel(_clip_config()),
+        text_encoder_2=CLIPTextModelWithProjection(_clip_config(projection_dim=32)),
+        tokenizer=_tokenizer(77),
+        tokenizer_2=_tokenizer(77),
+        unet=unet,
+        scheduler=_sd_scheduler(),
+    )
+
+
+def build_sd3():
+    torch.manual_seed(SEED)
+    transformer = SD3Transformer2DModel(
+        sample_size=32,
+        patch_size=2,
+        in_channels=16,
+        out_channels=16,
+        num_layers=2,
+        attention_head_dim=8,
+        num_attention_heads=4,
+        caption_projection_dim=32,
+        # Both CLIP encoders' hidden states; there is no T5, as SD3 allows.
+        joint_attention_dim=64,
+        pooled_projection_dim=64,
+    )
+    return StableDiffusion3Pipeline(
+        transformer=transformer,
+        scheduler=FlowMatchEulerDiscreteScheduler(),
+        vae=_vae(16, shift_factor=0.0609, scaling_factor=1.5035),
+        text_encoder=CLIPTextModelWithProjection(_clip_config(projection_dim=32)),
+        tokenizer=_tokenizer(77),
+        text_encoder_2=CLIPTextModelWithProjection(_clip_config(projection_dim=32)),
+        tokenizer_2=_tokenizer(77),
+        text_encoder_3=None,
+        tokenizer_3=None,
+    )
+
+
+def build_flux():
+    torch.manual_seed(SEED)
+    transformer = FluxTransformer2DModel(
+        patch_size=1,
+        # 16 latent channels packed 2x2.
+        in_channels=64,
+        num_layers=1,
+        num_single_layers=2,
+        attention_head_dim=16,
+        num_attention_heads=2,
+        joint_attention_dim=32,
+        pooled_projection_dim=32,
+        axes_dims_rope=(4, 4, 8),
+        guidance_embeds=False,
+    )
+    text_encoder_2 = T5EncoderModel(
+        T5Config(
+            d_model=32,
+            d_ff=37,
+            d_kv=8,
+            num_layers=2,
+            num_heads=4,
+            relative_attention_num_buckets=8,
+            vocab_size=len(SPECIAL_TOKENS) + len(VOCABULARY),
+            pad_token_id=1,
+            eos_token_id=2,
+            decoder_start_token_id=0,
+        )
+    )
+    return FluxPipeline(
+        transformer=transformer,
+        scheduler=FlowMatchEulerDiscreteScheduler(),
+        vae=_vae(16, shift_factor=0.1159, scaling_factor=0.3611),
+        text_encoder=CLIPTextModel(_clip_config()),
+        tokenizer=_tokenizer(77),
+        text_encoder_2=text_encoder_2,
+        tokenizer_2=_tokenizer(512),
+    )
+
+
+# --- ArtTic pipeline classes ---
+# The real classes, loading the local diffusers folder instead of a single-file
+# checkpoint (SD1.5/SDXL) or a Hugging Face base repo plus weights (SD3/FLUX).
+class TinySD15Pipeline(SD15Pipeline):
+    def load_pipeline(self, progress):
+        self._load_pretrained(StableDiffusionPipeline, self.model_path, progress, safety_checker=None)
+
+
+class TinySDXLPipeline(SDXLPipeline):
+    def load_pipeline(self, progress):
+        self._load_pretrained(StableDiffusionXLPipeline, self.model_path, progress)
+
+
+class TinySD3Pipeline(SD3Pipeline):
+    def load_pipeline(self, progress):
+        self._load_pretrained(StableDiffusion3Pipeline, self.model_path, progress)
+
+
+class TinyFLUXPipeline(ArtTicFLUXPipeline):
+    def __init__(self, model_path, dtype=None):
+        super().__init__(model_path, dtype, is_schnell=True)
+
+    def load_pipeline(self, progress):
+        self._load_pretrained(FluxPipeline, self.model_path, progress)
+
+
+# --- Checkpoint headers for detection ---
+# Tensor names that drive `detect_architecture`, plus the approximate tensor
+# count of a real checkpoint of each family so header parsing is realistic.
+DETECTION_LAYOUT = {
+    "sd15": (["model.diffusion_model.input_blocks.0.0.weight"], 1130),
+    "sdxl": (["conditioner.embedders.1.model.ln_final.weight"], 2515),
+    "sd3": (["text_encoders.clip_l.transformer.text_model.final_layer_norm.weight"], 1290),
+    "flux": (["double_blocks.0.img_attn.qkv.weight"], 780),
+}
+
+
+def write_detection_checkpoint(family, path):
+    """A single-file checkpoint with a real-sized header of `family` and 1-element tensors."""
+    markers, count = DETECTION_LAYOUT[family]
+    tensors = {name: torch.zeros(1) for name in markers}
+    for i in range(count - len(markers)):
+        tensors[f"model.diffusion_model.blocks.{i // 8}.param_{i % 8}.weight"] = torch.zeros(1)
+    save_file(tensors, path)
+
+
+FAMILIES = {
+    "sd15": (build_sd15, TinySD15Pipeline),
+    "sdxl": (build_sdxl, TinySDXLPipeline),
+    "sd3": (build_sd3, TinySD3Pipeline),
+    "flux": (build_flux, TinyFLUXPipeline),
+}
+# What `detect_architecture` should report for each family's header.
+EXPECTED_ARCHITECTURE = {"sd15": "sd15", "sdxl": "sdxl", "sd3": "sd3", "flux": "flux-schnell"}
+
+
+def model_name(family):
+    return f"{family}-tiny"
+
+
+def install(dtype=None, models_dir=MODELS_DIR):
+    """
+    Makes `core.load_model` load `model_name(family)` as that family's tiny
+    pipeline, so the benchmark goes through the pipeline cache, component
+    store and load modes like a real model. Only affects this process.
+    """
+    from core import logic as core
+
+    get_pipeline_for_model = core.get_pipeline_for_model
+    names = {model_name(family): family for family in FAMILIES}
+
+    def get_pipeline(name):
+        family = names.get(name)
+        if family is None:
+            return get_pipeline_for_model(name)
+        _, pipeline_class = FAMILIES[family]
+        return pipeline_class(os.path.join(models_dir, family), dtype)
+
+    core.get_pipeline_for_model = get_pipeline
+
+
+def ensure_model(family, models_dir=MODELS_DIR):
+    """
+    Builds and saves `family`'s tiny pipeline and detection checkpoint unless
+    an up-to-date copy exists. Returns `(diffusers_dir, checkpoint_path)`.
+    """
+    model_dir = os.path.join(models_dir, family)
+    checkpoint = os.path.join(models_dir, f"{family}-tiny.safetensors")
+    stamp_path = os.path.join(model_dir, "arttic_benchmark.json")
+    try:
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("version") == BUILD_VERSION and os.path.exists(checkpoint):
+                return model_dir, checkpoint
+    except (OSError, ValueError):
+        pass
+
+    logger.info(f"Building tiny {family} benchmark model in '{model_dir}'...")
+    build, _ = FAMILIES[family]
+    build().save_pretrained(model_dir, safe_serialization=True)
+    write_detection_checkpoint(family, checkpoint)
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": BUILD_VERSION, "seed": SEED}, f)
+    return model_dir, checkpoint
@@ -0,0 +1,327 @@
+# core/batch_runner.py
+import hashlib
+import json
+import logging
+import os
+import time
+
+from core import logic as core
+from core.image_writer import image_writer
+from core.loras import normalize_loras
+from core.pipeline_cache import pipeline_cache
+from core.settings import settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+
+def _job_id(job):
+    """The job's own `id`, or a hash of its content so reordering the file is safe."""
+    if job.get("id") is not None:
+        return str(job["id"])
+    payload = json.dumps(job, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_jobs(path):
+    """
+    Parses a JSONL job file. Each line is an object with `model` and `prompt`
+    and optionally `id`, `negative_prompt`, `seed`, `steps`, `guidance`,
+    `width`, `height`, `scheduler`, `loras` (`[{"name", "weight"}]`, or
+    `lora` + `lora_weight`), `cpu_offload` and `vae_tiling`.
+    """
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            if not job.get("model") or "prompt" not in job:
+                raise ValueError(f"{path}:{line_number}: 'model' and 'prompt' are required.")
+            if "loras" not in job and job.get("lora"):
+                job["loras"] = [{"name": job["lora"], "weight": job.get("lora_weight", 1.0)}]
+            job["loras"] = normalize_loras(job.get("loras"))
+            job["id"] = _job_id(job)
+            if job.get("seed") is None:
+                # Derived from the job so a resumed run renders the same image.
+                job["seed"] = int(hashlib.sha256(job["id"].encode()).hexdigest()[:8], 16)
+            if job.get("guidance") is None:
+                job["guidance"] = 7.0
+            jobs.append(job)
+    return jobs
+
+
+def order_jobs(jobs):
+    """
+    Orders jobs so model loads, LoRA swaps and shape changes are minimal:
+    by model, then LoRA set, then resolution and sampler settings. The sort
+    is stable, so jobs that agree on all of these keep their file order and
+    consecutive ones can share a batch.
+    """
+    return sorted(
+        jobs,
+        key=lambda job: (
+            job["model"],
+            bool(job.get("cpu_offload")),
+            bool(job.get("vae_tiling")),
+            tuple(job["loras"]),
+            job.get("width") or 0,
+            job.get("height") or 0,
+            job.get("scheduler") or "",
+            job.get("steps") or 0,
+            float(job["guidance"]),
+        ),
+    )
+
+
+class BatchManifest:
+    """Checkpoint of the job IDs finished so far, rewritten atomically after each batch."""
+
+    def __init__(self, path, jobs_path):
+        self.path = path
+        self.jobs_path = os.path.abspath(jobs_path)
+        self.completed = set()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.completed = set(json.load(f).get("completed", []))
+        except (OSError, ValueError):
+            pass
+
+    def mark(self, job_ids):
+        self.completed.update(job_ids)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"jobs_file": self.jobs_path, "completed": sorted(self.completed)}, f
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class BatchRunner:
+    """
+    Runs a JSONL job file headlessly through `core.load_model` and
+    `core.generate_image_batch`. Each model is loaded once for all its jobs,
+    compatible consecutive jobs share one batched pipeline call, and every
+    finished job is appended to the results JSONL and checkpointed in the
+    manifest, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, jobs_path, results_path=None, manifest_path=None):
+        stem = os.path.splitext(jobs_path)[0]
+        self.jobs_path = jobs_path
+        self.results_path = results_path or f"{stem}.results.jsonl"
+        self.manifest = BatchManifest(manifest_path or f"{stem}.manifest.json", jobs_path)
+        self.totals = {"done": 0, "failed": 0, "cached": 0, "loads": 0, "load_seconds": 0.0}
+        # Load settings and default width/height of the model this runner loaded last.
+        self._loaded_key = None
+        self._defaults = None
+
+    def run(self):
+        jobs = read_jobs(self.jobs_path)
+        todo = [job for job in order_jobs(jobs) if job["id"] not in self.manifest.completed]
+        skipped = len(jobs) - len(todo)
+        logger.info(
+            f"Batch: {len(todo)} jobs to run"
+            + (f", {skipped} already completed." if skipped else ".")
+        )
+        start = time.perf_counter()
+        total, done = len(todo), 0
+        while todo:
+            group = self._model_group(todo)
+            todo = todo[len(group):]
+            try:
+                load_seconds, defaults = self._ensure_loaded(group[0])
+            except Exception as e:
+                # One bad model must not stop the jobs of the others.
+                logger.error(f"Skipping {len(group)} jobs of '{group[0]['model']}': {e}")
+                self._fail_group(group, e)
+                done += len(group)
+                continue
+            for chunk in self._chunks(group, defaults):
+                self._run_chunk(chunk, defaults, load_seconds)
+                load_seconds = None
+                done += len(chunk)
+                logger.info(f"Batch progress: {done}/{total} jobs.")
+
+        image_writer.flush()
+        elapsed = time.perf_counter() - start
+        images = self.totals["done"]
+        summary = {
+            **self.totals,
+            "jobs": len(jobs),
+            "skipped": skipped,
+            "seconds": elapsed,
+            "images_per_second": images / elapsed if elapsed else 0.0,
+            "results": self.results_path,
+        }
+        logger.info(
+            f"Batch finished in {elapsed:.1f}s: {images} generated, "
+            f"{self.totals['cached']} reused, {self.totals['failed']} failed, "
+            f"{self.totals['loads']} model loads ({self.totals['load_seconds']:.1f}s), "
+            f"{summary['images_per_second']:.2f} images/s."
+        )
+        return summary
+
+    # --- Grouping ---
+    @staticmethod
+    def _load_key(job):
+        return (job["model"], bool(job.get("cpu_offload")), bool(job.get("vae_tiling")))
+
+    def _model_group(self, todo):
+        key = self._load_key(todo[0])
+        group = []
+        for job in todo:
+            if self._load_key(job) != key:
+                break
+            group.append(job)
+        return group
+
+    def _chunks(self, group, defaults):
+        """Splits a model group into runs of batch-compatible jobs."""
+        chunk, chunk_key = [], None
+        for job in group:
+            key = core.generation_batch_key(**self._call_kwargs(job, defaults))
+            if chunk and (key != chunk_key or len(chunk) >= settings["max_batch_size"]):
+                yield chunk
+                chunk = []
+            chunk.append(job)
+            chunk_key = key
+        if chunk:
+            yield chunk
+
+    # --- Execution ---
+    def _ensure_loaded(self, job):
+        """Loads the job's model unless it is already the active one."""
+        model, cpu_offload, vae_tiling = self._load_key(job)
+        scheduler = job.get("scheduler") or next(iter(core.SCHEDULER_MAP))
+        state = core.app_state
+        if (
+            state["is_model_loaded"]
+            and state["current_cache_key"] == pipeline_cache.make_key(model, cpu_offload)
+            and self._loaded_key == self._load_key(job)
+        ):
+            return None, self._defaults
+
+        start = time.perf_counter()
+        self._loaded_key = None
+        result = core.load_model(model, scheduler, vae_tiling, cpu_offload, "None")
+        load_seconds = time.perf_counter() - start
+        self.totals["loads"] += 1
+        self.totals["load_seconds"] += load_seconds
+        self._loaded_key = self._load_key(job)
+        self._defaults = {"width": result["width"], "height": result["height"]}
+        return load_seconds, self._defaults
+
+    @staticmethod
+    def _call_kwargs(job, defaults):
+        return {
+            "prompt": job["prompt"],
+            "negative_prompt": job.get("negative_prompt", ""),
+            "steps": job.get("steps"),
+            "guidance": job["guidance"],
+            "seed": job["seed"],
+            "width": job.get("width") or defaults["width"],
+            "height": job.get("height") or defaults["height"],
+            "lora_weight": 1.0,
+            "loras": job["loras"],
+            "scheduler_name": job.get("scheduler"),
+        }
+
+    def _run_chunk(self, chunk, defaults, load_seconds):
+        calls = [((), self._call_kwargs(job, defaults)) for job in chunk]
+        start = time.perf_counter()
+        try:
+            outcomes = core.generate_image_batch(calls)
+        except Exception as e:
+            if len(chunk) == 1:
+                outcomes = [e]
+            else:
+                logger.warning(f"Batch of {len(chunk)} failed ({e}), running the jobs one by one.")
+                outcomes = []
+                for call in calls:
+                    try:
+                        outcomes.append(core.generate_image_batch([call])[0])
+                    except Exception as job_error:
+                        outcomes.append(job_error)
+        seconds = time.perf_counter() - start
+
+        records = []
+        for i, (job, outcome) in enumerate(zip(chunk, outcomes)):
+            record = {
+                "id": job["id"],
+                "model": job["model"],
+                "seconds": seconds,
+                "batch_size": len(chunk),
+                "finished_at": time.time(),
+            }
+            if i == 0 and load_seconds is not None:
+                record["load_seconds"] = load_seconds
+            if not isinstance(outcome, Exception):
+                outcome = self._wait_written(outcome)
+            if isinstance(outcome, Exception):
+                record.update({"status": "failed", "error": str(outcome)})
+                self.totals["failed"] += 1
+                logger.error(f"Job {job['id']} failed: {outcome}")
+            else:
+                status = "cached" if outcome.get("cached") or outcome.get("coalesced") else "done"
+                record.update(
+                    {
+                        "status": status,
+                        "image_filename": outcome["image_filename"],
+                        "param_hash": outcome.get("param_hash"),
+                        "seed": job["seed"],
+                    }
+                )
+                self.totals[status] += 1
+            records.append(record)
+        self._checkpoint(records)
+
+    @staticmethod
+    def _wait_written(outcome):
+        """
+        Waits until the job's image is on disk, so the manifest never lists a
+        job whose file a crash could still lose. Returns the write error, if any.
+        """
+        write_future = image_writer.pending(outcome["image_filename"])
+        if write_future is not None:
+            try:
+                write_future.result()
+            except Exception as e:
+                return e
+        return outcome
+
+    def _fail_group(self, group, error):
+        self.totals["failed"] += len(group)
+        self._checkpoint(
+            [
+                {
+                    "id": job["id"],
+                    "model": job["model"],
+                    "status": "failed",
+                    "error": str(error),
+                    "finished_at": time.time(),
+                }
+                for job in group
+            ]
+        )
+
+    def _checkpoint(self, records):
+        # Results first: a crash in between only repeats this batch's lines.
+        with open(self.results_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # Failed jobs are not checkpointed, so a resumed run retries them.
+        self.manifest.mark([r["id"] for r in records if r["status"] != "failed"])
+
+
+def run_batch(jobs_path, results_path=None, manifest_path=None):
+    """Runs a JSONL job file and returns the summary; see `BatchRunner`."""
+    return BatchRunner(jobs_path, results_path, manifest_path).run()
@@ -0,0 +1,94 @@
+# core/buckets.py
+import logging
+import math
+import threading
+from collections import Counter
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# --- Canonical Resolutions ---
+# Landscape presets per model family; portrait buckets are their swaps.
+ASPECT_RATIOS_SD15 = {
+    "1:1": (512, 512),
+    "4:3": (576, 448),
+    "3:2": (608, 416),
+    "16:9": (672, 384),
+}
+ASPECT_RATIOS_SD2 = {
+    "1:1": (768, 768),
+    "4:3": (864, 640),
+    "3:2": (960, 640),
+    "16:9": (1024, 576),
+}
+ASPECT_RATIOS_SDXL_SD3_FLUX = {
+    "1:1": (1024, 1024),
+    "4:3": (1152, 896),
+    "3:2": (1216, 832),
+    "16:9": (1344, 768),
+}
+
+ASPECT_RATIOS_BY_FAMILY = {
+    "sd15": ASPECT_RATIOS_SD15,
+    "sd2": ASPECT_RATIOS_SD2,
+    "xl": ASPECT_RATIOS_SDXL_SD3_FLUX,
+}
+
+
+def buckets_for(family):
+    """All canonical (width, height) shapes of a model family, portrait included."""
+    ratios = ASPECT_RATIOS_BY_FAMILY.get(family, ASPECT_RATIOS_SD15)
+    buckets = []
+    for width, height in ratios.values():
+        for shape in ((width, height), (height, width)):
+            if shape not in buckets:
+                buckets.append(shape)
+    return buckets
+
+
+def snap(width, height, family):
+    """
+    Returns the bucket closest to the requested shape: nearest aspect ratio
+    first (in log space, so 2:1 and 1:2 are equally far from 1:1), then
+    nearest pixel count.
+    """
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Width and height must be positive, got {width}x{height}.")
+    ratio = math.log(width / height)
+    area = width * height
+    return min(
+        buckets_for(family),
+        key=lambda b: (round(abs(math.log(b[0] / b[1]) - ratio), 3), abs(b[0] * b[1] - area)),
+    )
+
+
+class ShapeStats:
+    """Counts generations per shape and how many ran on an already warm shape."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.warm_hits = 0
+        self.snapped = 0
+        self.shapes = Counter()
+
+    def record(self, width, height, warm, snapped):
+        with self._lock:
+            self.requests += 1
+            self.warm_hits += bool(warm)
+            self.snapped += bool(snapped)
+            self.shapes[f"{width}x{height}"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "warm_hits": self.warm_hits,
+                "warm_hit_rate": self.warm_hits / self.requests if self.requests else 0.0,
+                "snapped": self.snapped,
+                "distinct_shapes": len(self.shapes),
+                "shapes": dict(self.shapes.most_common()),
+            }
+
+
+shape_stats = ShapeStats()
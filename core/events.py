@@ -0,0 +1,118 @@
+# core/events.py
+import logging
+import threading
+import time
+
+from core.settings import settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+
+class Event:
+    """A single progress/status event emitted for a job."""
+
+    __slots__ = ("job_id", "kind", "data", "final", "time")
+
+    def __init__(self, job_id, kind, data, final=False):
+        self.job_id = job_id
+        self.kind = kind
+        self.data = data
+        self.final = final
+        self.time = time.monotonic()
+
+
+class EventBus:
+    """
+    Thread-safe publish/subscribe hub for job events. Worker threads publish,
+    subscribers (WebSocket, Gradio, CLI) receive. Non-final events are throttled
+    per (job, kind) to `settings["progress_rate"]` per second; a throttled event
+    is kept as pending and flushed when the job finishes, so the last update is
+    never lost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._next_token = 0
+        self._last_emit = {}
+        self._pending = {}
+
+    # --- Subscriptions ---
+    def subscribe(self, callback, job_id=None):
+        """Registers `callback(event)`; `job_id=None` receives events of all jobs."""
+        with self._lock:
+            self._next_token += 1
+            token = self._next_token
+            self._subscribers[token] = (callback, job_id)
+        return token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    # --- Publishing ---
+    def publish(self, job_id, kind, data, final=False):
+        """Publishes an event; safe to call from any thread."""
+        key = (job_id, kind)
+        now = time.monotonic()
+        with self._lock:
+            if not final:
+                interval = 1.0 / settings["progress_rate"]
+                if now - self._last_emit.get(key, 0.0) < interval:
+                    # Coalesce: only the newest throttled event is kept.
+                    self._pending[key] = (data, now)
+                    return
+            self._last_emit[key] = now
+            self._pending.pop(key, None)
+        self._deliver(Event(job_id, kind, data, final))
+
+    def progress_reporter(self, job_id):
+        """Returns a `(progress, desc)` callback that publishes progress events."""
+
+        def report(progress, desc):
+            self.publish(
+                job_id,
+                "progress",
+                {"progress": progress, "description": desc},
+                final=progress >= 1,
+            )
+
+        return report
+
+    def preview_reporter(self, job_id):
+        """Returns a `(step, total, jpeg_bytes)` callback that publishes previews."""
+
+        def report(step, total, jpeg_bytes):
+            self.publish(
+                job_id, "preview", {"step": step, "total": total, "image": jpeg_bytes}
+            )
+
+        return report
+
+    def finish(self, job_id):
+        """Flushes throttled events of a finished job and forgets its state."""
+        with self._lock:
+            flushed = [
+                (key[1], self._pending.pop(key)[0])
+                for key in list(self._pending)
+                if key[0] == job_id
+            ]
+            for key in [key for key in self._last_emit if key[0] == job_id]:
+                del self._last_emit[key]
+        for kind, data in flushed:
+            self._deliver(Event(job_id, kind, data, final=True))
+
+    def _deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for callback, job_filter in subscribers:
+            if job_filter is not None and job_filter != event.job_id:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning(f"Event subscriber failed on '{event.kind}': {e}")
+
+
+event_bus = EventBus()
@@ -0,0 +1,244 @@
+# core/gallery.py
+import logging
+import os
+import sqlite3
+import threading
+
+from core.image_writer import read_metadata
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+OUTPUTS_DIR = "./outputs"
+GALLERY_DB_PATH = os.path.join("./cache", "gallery.sqlite3")
+IMAGE_EXTENSIONS = (".png", ".webp", ".jpg", ".jpeg")
+# Metadata key holding the hash of the generation parameters of an output.
+PARAM_HASH_KEY = "arttic_param_hash"
+DEFAULT_PAGE_SIZE = 60
+MAX_PAGE_SIZE = 500
+# Images whose parameter hash is read per transaction of the backfill.
+HASH_BACKFILL_CHUNK = 200
+
+
+class GalleryIndex:
+    """
+    SQLite index of the images in the outputs directory, newest first. The
+    directory is scanned once (or on an explicit refresh); afterwards images
+    are added incrementally as they are saved, and pages are served with a
+    keyset cursor instead of re-globbing and stat-ing every file. The
+    parameter hash embedded in each image is indexed for the result cache
+    ("" when an image has none, NULL while it has not been read yet). Missing
+    hashes are read on a background thread; until then those images are
+    result-cache misses.
+    """
+
+    def __init__(self, outputs_dir=OUTPUTS_DIR, db_path=GALLERY_DB_PATH):
+        self.outputs_dir = outputs_dir
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._synced = False
+        self._hashes_complete = False
+        self._backfill_thread = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " filename TEXT PRIMARY KEY,"
+                " mtime REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " param_hash TEXT)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(images)")]
+            if "param_hash" not in columns:
+                # Index from before parameter hashes; they are backfilled in the background.
+                self._conn.execute("ALTER TABLE images ADD COLUMN param_hash TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS images_by_time ON images (mtime DESC, filename DESC)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS images_by_hash ON images (param_hash)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _ensure_synced(self):
+        if not self._synced:
+            self.sync()
+
+    # --- Maintenance ---
+    def sync(self):
+        """Reconciles the index with the outputs directory. Returns (added, removed)."""
+        os.makedirs(self.outputs_dir, exist_ok=True)
+        on_disk = {}
+        with os.scandir(self.outputs_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    on_disk[entry.name] = (stat.st_mtime, stat.st_size)
+
+        with self._lock:
+            db = self._db()
+            indexed = {
+                name: (mtime, size)
+                for name, mtime, size in db.execute("SELECT filename, mtime, size FROM images")
+            }
+            added = [
+                (name, mtime, size)
+                for name, (mtime, size) in on_disk.items()
+                if indexed.get(name) != (mtime, size)
+            ]
+            removed = [name for name in indexed if name not in on_disk]
+
+        # Parameter hashes are read by `backfill_hashes`, not here.
+        added = [(*row, None) for row in added]
+        with self._lock:
+            db = self._db()
+            db.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)", added)
+            db.executemany("DELETE FROM images WHERE filename = ?", [(n,) for n in removed])
+            db.commit()
+            self._synced = True
+            if added:
+                self._hashes_complete = False
+
+        if added or removed:
+            logger.info(f"Gallery index synced: {len(added)} added, {len(removed)} removed.")
+        return [a[0] for a in added], removed
+
+    def add(self, filename):
+        """Indexes a single newly written image."""
+        stat = os.stat(os.path.join(self.outputs_dir, filename))
+        param_hash = self._read_param_hash(filename)
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                (filename, stat.st_mtime, stat.st_size, param_hash),
+            )
+            db.commit()
+
+    def _read_param_hash(self, filename):
+        """The hash embedded in an image; "" when it has none or cannot be read."""
+        try:
+            metadata = read_metadata(os.path.join(self.outputs_dir, filename))
+        except Exception as e:
+            logger.debug(f"Could not read the metadata of '{filename}': {e}")
+            return ""
+        return metadata.get(PARAM_HASH_KEY, "")
+
+    def backfill_hashes(self):
+        """
+        Reads the parameter hash of images indexed without one, a chunk at a
+        time so the lock is never held while files are read. Returns how many
+        images were read.
+        """
+        total = 0
+        while True:
+            with self._lock:
+                names = [
+                    row[0]
+                    for row in self._db().execute(
+                        "SELECT filename FROM images WHERE param_hash IS NULL LIMIT ?",
+                        (HASH_BACKFILL_CHUNK,),
+                    )
+                ]
+            if not names:
+                break
+            if not total:
+                logger.info("Reading parameter hashes of earlier images in the background...")
+            hashes = [(self._read_param_hash(name), name) for name in names]
+            with self._lock:
+                db = self._db()
+                db.executemany(
+                    "UPDATE images SET param_hash = ? WHERE filename = ? AND param_hash IS NULL",
+                    hashes,
+                )
+                db.commit()
+            total += len(names)
+        with self._lock:
+            self._hashes_complete = True
+        if total:
+            logger.info(f"Read parameter hashes of {total} earlier images.")
+        return total
+
+    def _start_hash_backfill(self):
+        with self._lock:
+            if self._hashes_complete or (
+                self._backfill_thread is not None and self._backfill_thread.is_alive()
+            ):
+                return
+            self._backfill_thread = threading.Thread(
+                target=self._backfill_logged, name="arttic-gallery-hashes", daemon=True
+            )
+            self._backfill_thread.start()
+
+    def _backfill_logged(self):
+        try:
+            self.backfill_hashes()
+        except Exception as e:
+            logger.warning(f"Reading parameter hashes of earlier images failed: {e}")
+
+    def remove(self, filename):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM images WHERE filename = ?", (filename,))
+            db.commit()
+
+    # --- Queries ---
+    def count(self):
+        self._ensure_synced()
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def find_by_hash(self, param_hash):
+        """
+        Returns the newest image generated with this parameter hash, or None.
+        Images whose hash has not been backfilled yet never match.
+        """
+        self._ensure_synced()
+        self._start_hash_backfill()
+        with self._lock:
+            row = self._db().execute(
+                "SELECT filename FROM images WHERE param_hash = ?"
+                " ORDER BY mtime DESC LIMIT 1",
+                (param_hash,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns up to `limit` filenames newest first, starting after the filename
+        `after` (the `next` cursor of the previous page).
+        """
+        self._ensure_synced()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        with self._lock:
+            db = self._db()
+            anchor = None
+            if after:
+                anchor = db.execute(
+                    "SELECT mtime FROM images WHERE filename = ?", (after,)
+                ).fetchone()
+            if anchor:
+                rows = db.execute(
+                    "SELECT filename FROM images"
+                    " WHERE mtime < ? OR (mtime = ? AND filename < ?)"
+                    " ORDER BY mtime DESC, filename DESC LIMIT ?",
+                    (anchor[0], anchor[0], after, limit + 1),
+                ).fetchall()
+            else:
+                rows = db.execute(
+                    "SELECT filename FROM images ORDER BY mtime DESC, filename DESC LIMIT ?",
+                    (limit + 1,),
+                ).fetchall()
+
+        images = [row[0] for row in rows[:limit]]
+        next_cursor = images[-1] if len(rows) > limit else None
+        return {"images": images, "next": next_cursor}
+
+
+gallery_index = GalleryIndex()
@@ -0,0 +1,184 @@
+# core/image_writer.py
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from core.metrics import metrics
+from core.settings import settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# Output format name -> (Pillow format, file extension)
+OUTPUT_FORMATS = {
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+}
+
+
+def output_extension(output_format=None):
+    """File extension for the configured (or given) output format."""
+    return OUTPUT_FORMATS[output_format or settings["output_format"]][1]
+
+
+# EXIF ImageDescription, used to carry metadata in WebP and JPEG outputs.
+EXIF_DESCRIPTION_TAG = 0x010E
+
+
+def _metadata_options(pil_format, metadata):
+    """Save options embedding `metadata` (str -> str): PNG text chunks, else EXIF."""
+    if pil_format == "PNG":
+        info = PngInfo()
+        for key, value in metadata.items():
+            info.add_text(key, value)
+        return {"pnginfo": info}
+    exif = Image.Exif()
+    exif[EXIF_DESCRIPTION_TAG] = json.dumps(metadata)
+    return {"exif": exif}
+
+
+def read_metadata(path):
+    """Returns the metadata written by `ImageWriter.submit` into an output image."""
+    try:
+        with Image.open(path) as image:
+            if image.format == "PNG":
+                return dict(getattr(image, "text", {}))
+            description = image.getexif().get(EXIF_DESCRIPTION_TAG)
+    except OSError:
+        return {}
+    try:
+        metadata = json.loads(description) if description else {}
+    except ValueError:
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
+def _save_options(output_format):
+    if output_format == "png":
+        return {"compress_level": settings["png_compress_level"]}
+    if output_format == "webp":
+        if settings["webp_lossless"]:
+            return {"lossless": True, "quality": 100, "method": 4}
+        return {"quality": settings["webp_quality"], "method": 4}
+    return {"quality": settings["jpeg_quality"], "subsampling": 0}
+
+
+def output_signature(output_format=None):
+    """The format and encoder options an output is saved with, for hashing."""
+    output_format = output_format or settings["output_format"]
+    return output_format, sorted(_save_options(output_format).items())
+
+
+class ImageWriter:
+    """
+    Encodes and writes generated images on a small thread pool so the
+    generation worker can start the next job as soon as an image is decoded.
+    Encode and disk-write times are measured separately.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._totals = {"images": 0, "bytes": 0, "encode_seconds": 0.0, "write_seconds": 0.0}
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="arttic-writer"
+            )
+        return self._executor
+
+    def submit(self, image, filepath, output_format=None, on_written=None, metadata=None):
+        """
+        Queues `image` to be encoded and written to `filepath`. Returns a Future
+        resolving to the timings; `on_written(filename)` runs after the write.
+        `metadata` (str -> str) is embedded in the file, see `read_metadata`.
+        """
+        output_format = output_format or settings["output_format"]
+        filename = os.path.basename(filepath)
+        future = self._pool().submit(self._write, image, filepath, output_format, metadata)
+        with self._lock:
+            self._pending[filename] = future
+
+        def done(f):
+            with self._lock:
+                self._pending.pop(filename, None)
+            if f.exception() is not None:
+                logger.error(f"Failed to save '{filename}': {f.exception()}")
+            elif on_written is not None:
+                on_written(filename)
+
+        future.add_done_callback(done)
+        return future
+
+    def pending(self, filename):
+        """Returns the write Future of an image still being saved, or None."""
+        with self._lock:
+            return self._pending.get(filename)
+
+    def flush(self, timeout=None):
+        """Blocks until every queued image is on disk."""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures, timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self._totals)
+        images = totals["images"] or 1
+        totals["avg_encode_seconds"] = totals["encode_seconds"] / images
+        totals["avg_write_seconds"] = totals["write_seconds"] / images
+        return totals
+
+    def _write(self, image, filepath, output_format, metadata=None):
+        pil_format, _ = OUTPUT_FORMATS[output_format]
+        if pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        options = _save_options(output_format)
+        if metadata:
+            options.update(_metadata_options(pil_format, metadata))
+
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, **options)
+        data = buffer.getbuffer()
+        encode_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+        write_seconds = time.perf_counter() - start
+
+        metrics.observe("generation_stage_seconds", encode_seconds, stage="image_encode")
+        metrics.observe("generation_stage_seconds", write_seconds, stage="disk_write")
+        with self._lock:
+            self._totals["images"] += 1
+            self._totals["bytes"] += len(data)
+            self._totals["encode_seconds"] += encode_seconds
+            self._totals["write_seconds"] += write_seconds
+        logger.info(
+            f"Saved '{os.path.basename(filepath)}' ({len(data) / 1024**2:.1f} MB): "
+            f"encode {encode_seconds:.2f}s, write {write_seconds:.2f}s."
+        )
+        return {
+            "path": filepath,
+            "bytes": len(data),
+            "encode_seconds": encode_seconds,
+            "write_seconds": write_seconds,
+        }
+
+
+image_writer = ImageWriter()
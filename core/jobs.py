@@ -0,0 +1,427 @@
+# core/jobs.py
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future
+
+from core.events import event_bus
+from core.settings import settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# How many finished jobs are remembered for status lookups.
+FINISHED_JOBS_HISTORY = 256
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a job is submitted while the generation queue is full."""
+
+
+def new_job_id():
+    """Returns a fresh job ID, e.g. to subscribe to its events before submitting."""
+    return uuid.uuid4().hex
+
+
+class Job:
+    """A single unit of work (load, generate, unload) executed by the worker."""
+
+    def __init__(self, kind, func, args, kwargs, on_position=None, job_id=None):
+        self.id = job_id or new_job_id()
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_position = on_position
+        self.future = Future()
+        self.status = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class BatchStats:
+    """Counts batched executions and the throughput they reached."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+        self.seconds = 0.0
+        self.sizes = Counter()
+        self.fallbacks = 0
+
+    def record(self, size, seconds):
+        with self._lock:
+            self.batches += 1
+            self.images += size
+            self.seconds += seconds
+            self.sizes[size] += 1
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "images": self.images,
+                "mean_batch_size": self.images / self.batches if self.batches else 0.0,
+                "images_per_second": self.images / self.seconds if self.seconds else 0.0,
+                "batch_sizes": dict(sorted(self.sizes.items())),
+                "fallbacks": self.fallbacks,
+            }
+
+
+class JobQueue:
+    """
+    A bounded FIFO queue served by a single worker thread. The worker is the only
+    thread that touches the loaded pipeline, so UI handlers never block on it.
+
+    Functions registered with `register_batcher` are batched: when such a job
+    reaches the front, queued jobs of the same function with an equal batch key
+    are run together in one call. Queued jobs whose dedup key equals that of a
+    job that just finished are completed with its result instead of running.
+    Any other kind of job is a barrier that later jobs are never moved across.
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()
+        self._current = None
+        self._batch = []
+        self._thread = None
+        # func -> (key_func, batch_func, dedup_key_func)
+        self._batchers = {}
+        self.batch_stats = BatchStats()
+        self.coalesced = 0
+
+    def register_batcher(self, func, key_func, batch_func, dedup_key_func=None):
+        """
+        Enables batching for jobs running `func`. `key_func(*args, **kwargs)`
+        returns a hashable key (None = run alone) and is evaluated on the worker
+        right before execution. `batch_func(calls)` receives `[(args, kwargs)]`
+        and returns one result per call, in order. `dedup_key_func`, with the
+        same signature, identifies calls that produce the same result.
+        """
+        self._batchers[func] = (key_func, batch_func, dedup_key_func)
+
+    # --- Lifecycle ---
+    def start(self):
+        """Starts the worker thread if it is not already running."""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._worker_loop, name="arttic-worker", daemon=True
+            )
+            self._thread.start()
+            logger.info("Generation worker started.")
+
+    # --- Submission ---
+    def submit(self, kind, func, *args, on_position=None, job_id=None, **kwargs):
+        """
+        Queues `func(*args, **kwargs)` for the worker and returns the Job.
+        `on_position(job, position)` is called from the worker thread whenever
+        the job's place in the queue changes (0 means it has started).
+        """
+        self.start()
+        job = Job(kind, func, args, kwargs, on_position=on_position, job_id=job_id)
+        with self._cond:
+            if len(self._pending) >= settings["queue_size"]:
+                raise QueueFullError(
+                    f"The generation queue is full ({settings['queue_size']} jobs). Try again shortly."
+                )
+            self._pending.append(job)
+            self._remember(job)
+            position = len(self._pending)
+            self._cond.notify()
+        logger.info(f"Queued {kind} job {job.id[:8]} at position {position}.")
+        self._report_position(job, position)
+        return job
+
+    async def run(self, kind, func, *args, on_position=None, job_id=None, **kwargs):
+        """Async bridge: submits a job and awaits its result without blocking the loop."""
+        job = self.submit(
+            kind, func, *args, on_position=on_position, job_id=job_id, **kwargs
+        )
+        return await asyncio.wrap_future(job.future)
+
+    def cancel(self, job_id):
+        """Cancels a job that has not started yet. Returns True on success."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job not in self._pending:
+                return False
+            self._pending.remove(job)
+            job.status = "cancelled"
+            job.future.cancel()
+            waiting = list(self._pending)
+        self._report_positions(waiting)
+        return True
+
+    # --- Introspection ---
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """Returns the 1-based queue position, 0 if running, or None if unknown."""
+        with self._cond:
+            if self._current and self._current.id == job_id:
+                return 0
+            if any(job.id == job_id for job in self._batch):
+                return 0
+            for index, job in enumerate(self._pending):
+                if job.id == job_id:
+                    return index + 1
+        return None
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "running": self._current.to_dict() if self._current else None,
+                "running_batch": [job.to_dict() for job in self._batch],
+                "queued": [job.to_dict() for job in self._pending],
+                "max_size": settings["queue_size"],
+                "batching": self.batch_stats.stats(),
+                "coalesced": self.coalesced,
+            }
+
+    # --- Worker ---
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                self._current = job
+                waiting = list(self._pending)
+
+            self._report_positions(waiting)
+            if not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._current = None
+                continue
+
+            batch = self._collect_batch(job)
+            dedup_keys = {job.id: self._dedup_key(job) for job in batch}
+            if len(batch) > 1:
+                self._execute_batch(batch)
+            else:
+                start = time.perf_counter()
+                if self._execute(job) and job.func in self._batchers:
+                    # Unbatched runs are the baseline the batch throughput compares to.
+                    self.batch_stats.record(1, time.perf_counter() - start)
+            self._complete_duplicates(batch, dedup_keys)
+
+            with self._cond:
+                self._current = None
+                self._batch = []
+
+    # --- Batching ---
+    def _batch_key(self, job):
+        batcher = self._batchers.get(job.func)
+        if batcher is None:
+            return None
+        try:
+            return batcher[0](*job.args, **job.kwargs)
+        except Exception as e:
+            # Invalid requests run alone and fail with their own error.
+            logger.debug(f"No batch key for job {job.id[:8]}: {e}")
+            return None
+
+    def _dedup_key(self, job):
+        batcher = self._batchers.get(job.func)
+        if batcher is None or batcher[2] is None:
+            return None
+        try:
+            return batcher[2](*job.args, **job.kwargs)
+        except Exception as e:
+            logger.debug(f"No dedup key for job {job.id[:8]}: {e}")
+            return None
+
+    def _complete_duplicates(self, done, keys):
+        """
+        Finishes queued jobs identical to ones that just completed with their
+        result, so the same work does not run again.
+        """
+        results = {
+            keys[job.id]: job.future.result()
+            for job in done
+            if job.status == "done" and keys.get(job.id) is not None
+        }
+        if not results:
+            return
+        with self._cond:
+            candidates, _ = self._candidates(done[0])
+        # Keys are computed outside the lock: they stat and read model files.
+        matches = [(job, results.get(self._dedup_key(job))) for job in candidates]
+        followers = []
+        with self._cond:
+            for job, result in matches:
+                if result is not None and job in self._pending:
+                    self._pending.remove(job)
+                    followers.append((job, result))
+            waiting = list(self._pending)
+
+        for job, result in followers:
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            job.status = "done"
+            job.started_at = job.finished_at = time.time()
+            self.coalesced += 1
+            logger.info(f"Job {job.id[:8]} reuses the result of an identical job.")
+            event_bus.finish(job.id)
+            if isinstance(result, dict):
+                result = {**result, "coalesced": True}
+            job.future.set_result(result)
+        if followers:
+            self._report_positions(waiting)
+
+    def _candidates(self, head):
+        """Queued jobs that may join `head`'s batch, up to the first barrier. Needs the lock."""
+        candidates = []
+        for job in self._pending:
+            if job.func is not head.func:
+                return candidates, True
+            candidates.append(job)
+        return candidates, False
+
+    def _collect_batch(self, head):
+        """
+        Returns `head` plus the compatible queued jobs, waiting up to
+        `settings["batch_window_ms"]` for more to arrive. Joined jobs are taken
+        off the queue and marked running.
+        """
+        max_size = settings["max_batch_size"]
+        if max_size <= 1 or head.func not in self._batchers:
+            return [head]
+        key = self._batch_key(head)
+        if key is None:
+            return [head]
+
+        deadline = time.monotonic() + settings["batch_window_ms"] / 1000
+        keys = {}
+        while True:
+            with self._cond:
+                candidates, barrier = self._candidates(head)
+            # Keys are computed outside the lock so submit() never waits for them.
+            for job in candidates:
+                if job.id not in keys:
+                    keys[job.id] = self._batch_key(job)
+            with self._cond:
+                found = [
+                    job for job in candidates if keys[job.id] == key and job in self._pending
+                ]
+                remaining = deadline - time.monotonic()
+                if len(found) + 1 >= max_size or barrier or remaining <= 0:
+                    joined = []
+                    for job in found[: max_size - 1]:
+                        self._pending.remove(job)
+                        if job.future.set_running_or_notify_cancel():
+                            joined.append(job)
+                    self._batch = [head] + joined
+                    waiting = list(self._pending)
+                    break
+                # Jobs queued while the keys were computed are keyed right away.
+                if all(job.id in keys for job in self._pending):
+                    self._cond.wait(remaining)
+        if joined:
+            self._report_positions(waiting)
+        return [head] + joined
+
+    def _execute_batch(self, batch):
+        for job in batch:
+            job.status = "running"
+            job.started_at = time.time()
+            self._report_position(job, 0)
+        batch_func = self._batchers[batch[0].func][1]
+        logger.info(f"Running {len(batch)} {batch[0].kind} jobs as one batch.")
+        start = time.perf_counter()
+        try:
+            results = batch_func([(job.args, job.kwargs) for job in batch])
+        except Exception as e:
+            # E.g. out of memory at this batch size: fall back to one at a time.
+            logger.warning(f"Batched run failed ({e}), running the jobs one by one.")
+            self.batch_stats.record_fallback()
+            for job in batch:
+                self._execute(job)
+            return
+        seconds = time.perf_counter() - start
+        self.batch_stats.record(len(batch), seconds)
+        logger.info(
+            f"Batch of {len(batch)} finished in {seconds:.2f}s "
+            f"({len(batch) / seconds:.2f} images/s)."
+        )
+        for job, result in zip(batch, results):
+            job.status = "done"
+            job.finished_at = time.time()
+            event_bus.finish(job.id)
+            job.future.set_result(result)
+
+    def _execute(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        self._report_position(job, 0)
+        try:
+            result = job.func(*job.args, **job.kwargs)
+        except BaseException as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = time.time()
+            event_bus.finish(job.id)
+            job.future.set_exception(e)
+            return False
+        else:
+            job.status = "done"
+            job.finished_at = time.time()
+            # Flush the last throttled progress before the result is delivered.
+            event_bus.finish(job.id)
+            job.future.set_result(result)
+            return True
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > FINISHED_JOBS_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+
+    def _report_positions(self, waiting):
+        for index, job in enumerate(waiting):
+            self._report_position(job, index + 1)
+
+    @staticmethod
+    def _report_position(job, position):
+        if job.on_position is None:
+            return
+        try:
+            job.on_position(job, position)
+        except Exception as e:
+            logger.warning(f"Queue position callback failed for job {job.id[:8]}: {e}")
+
+
+job_queue = JobQueue()
@@ -1,31 +1,43 @@
 # core/logic.py
-import torch
 import os
 import time
 import random
 import logging
 from glob import glob
-from diffusers import (
-    EulerAncestralDiscreteScheduler,
-    EulerDiscreteScheduler,
-    LMSDiscreteScheduler,
-    DPMSolverMultistepScheduler,
-    DDIMScheduler,
-    UniPCMultistepScheduler,
-)
-from pipelines import get_pipeline_for_model
+from PIL import Image
+from pipelines import get_pipeline_for_model, model_index, conversion_cache, MODELS_DIR
+from pipelines.loading import PeakRSSSampler, current_rss, load_stats
+from pipelines.devices import get_backend
+from pipelines.component_store import component_store
+from pipelines.embedding_cache import embedding_cache
 from pipelines.sdxl_pipeline import SDXLPipeline
 from pipelines.sd2_pipeline import SD2Pipeline
 from pipelines.sd3_pipeline import SD3Pipeline
 
 # CORRECTED: Import the new unified FLUX pipeline class
 from pipelines.flux_pipeline import ArtTicFLUXPipeline
+from core.pipeline_cache import pipeline_cache
+from core.gallery import gallery_index, OUTPUTS_DIR, DEFAULT_PAGE_SIZE, IMAGE_EXTENSIONS, PARAM_HASH_KEY
+from core.thumbnails import thumbnail_service
+from core.image_writer import image_writer, output_extension, output_signature
+from core.previews import LatentPreviewer
+from core.loras import check_lora_count, lora_manager, lora_path, normalize_loras
+from core.settings import settings
+from core.warmup import warm_up, warm_shapes
+from core.buckets import snap, buckets_for, shape_stats
+from core.jobs import job_queue
+from core.metrics import metrics
+from core.profiling import profiler
+from core.result_cache import result_cache, param_hash
+from core.schedulers import SCHEDULER_MAP, RECOMMENDED_STEPS, recommended_steps, use_scheduler
 
 # --- Application State ---
 app_state = {
     "current_pipe": None,
     "current_model_name": "",
     "current_lora_name": "",
+    "current_scheduler": None,
+    "current_cache_key": None,
     "is_model_loaded": False,
     "status_message": "No model loaded.",
 }
@@ -33,32 +45,53 @@ app_state = {
 # --- Constants ---
 APP_LOGGER_NAME = "arttic_lab"
 logger = logging.getLogger(APP_LOGGER_NAME)
-SCHEDULER_MAP = {
-    "Euler A": EulerAncestralDiscreteScheduler,
-    "DPM++ 2M": DPMSolverMultistepScheduler,
-    "DDIM": DDIMScheduler,
-    "UniPC": UniPCMultistepScheduler,
-    "Euler": EulerDiscreteScheduler,
-    "LMS": LMSDiscreteScheduler,
-}
 
 # --- Core Functions ---
 
 
 def get_config():
     """Returns the initial configuration for the UI."""
+    gallery = get_gallery_page()
     return {
         "models": get_available_models(),
         "loras": get_available_loras(),
         "schedulers": list(SCHEDULER_MAP.keys()),
-        "gallery_images": get_output_images(),
+        "scheduler_steps": RECOMMENDED_STEPS,
+        "gallery_images": gallery["images"],
+        "gallery_next": gallery["next"],
     }
 
 
-def get_available_models():
-    """Scans the models directory and returns a list of available model names."""
-    models_path = os.path.join("./models", "*.safetensors")
-    return [os.path.basename(p).replace(".safetensors", "") for p in glob(models_path)]
+def get_available_models(with_metadata=False):
+    """
+    Scans the models directory and returns a list of available model names, or
+    with `with_metadata` a list of dicts with the indexed header metadata.
+    """
+    models_path = os.path.join(MODELS_DIR, "*.safetensors")
+    paths = glob(models_path)
+    names = [os.path.basename(p).replace(".safetensors", "") for p in paths]
+    if not with_metadata:
+        return names
+
+    models = []
+    for name, path in zip(names, paths):
+        try:
+            entry = model_index.describe(path, save=False)
+        except Exception as e:
+            logger.warning(f"Could not index model '{name}': {e}")
+            entry = {}
+        models.append(
+            {
+                "name": name,
+                "architecture": entry.get("architecture"),
+                "dtype": entry.get("dtype"),
+                "parameters": entry.get("parameters"),
+                "size": entry.get("size"),
+                "hash": entry.get("hash"),
+            }
+        )
+    model_index.save()
+    return models
 
 
 def get_available_loras():
@@ -68,42 +101,98 @@ def get_available_loras():
     return [os.path.basename(p).replace(".safetensors", "") for p in glob(loras_path)]
 
 
-def get_output_images():
-    """Returns a sorted list of generated images from the outputs directory."""
-    outputs_path = os.path.join("./outputs", "*.png")
-    return [
-        os.path.basename(f)
-        for f in sorted(glob(outputs_path), key=os.path.getmtime, reverse=True)
-    ]
+def get_output_images(limit=DEFAULT_PAGE_SIZE):
+    """Returns the newest generated images, served from the gallery index."""
+    return gallery_index.page(limit=limit)["images"]
+
+
+def get_gallery_page(after=None, limit=DEFAULT_PAGE_SIZE, refresh=False):
+    """Returns one page of the gallery plus the cursor for the next page."""
+    if refresh:
+        _, removed = gallery_index.sync()
+        for filename in removed:
+            thumbnail_service.invalidate(filename)
+    page = gallery_index.page(after=after, limit=limit)
+    page["total"] = gallery_index.count()
+    return page
+
+
+def get_thumbnail_path(filename, size):
+    """
+    Returns the path of an image's thumbnail, rendering it first if needed.
+    Raises OSError when the image cannot be decoded.
+    """
+    if os.path.basename(filename) != filename or not filename.lower().endswith(IMAGE_EXTENSIONS):
+        raise ValueError("Invalid image filename.")
+    if not os.path.isfile(os.path.join(OUTPUTS_DIR, filename)):
+        thumbnail_service.invalidate(filename)
+        raise FileNotFoundError(filename)
+    return thumbnail_service.ensure(filename, size)
+
+
+def backfill_thumbnails():
+    """
+    Syncs the gallery index, reads missing parameter hashes and renders/prunes
+    thumbnails for all outputs.
+    """
+    _, removed = gallery_index.sync()
+    for filename in removed:
+        thumbnail_service.invalidate(filename)
+    gallery_index.backfill_hashes()
+    return thumbnail_service.backfill(prune=True)
+
+
+def get_cache_stats():
+    """Returns statistics of the pipeline, LoRA, conversion and embedding caches."""
+    return {
+        **pipeline_cache.stats(),
+        "loras": lora_manager.stats(),
+        "conversions": conversion_cache.stats(),
+        "load_stats": load_stats.all(),
+        "components": component_store.refcounts(),
+        "shapes": shape_stats.stats(),
+        "embeddings": embedding_cache.stats(),
+        "results": result_cache.stats(),
+    }
 
 
-def unload_model():
-    """Unloads the current model from VRAM and clears the cache."""
+def unload_model(progress_callback=None):
+    """
+    Unloads the current model from VRAM and clears the cache. Other cached
+    pipelines are parked in host RAM so switching back to them stays fast.
+    """
     if not app_state["is_model_loaded"]:
         logger.info("Unload command received, but no model is currently loaded.")
         return {"status_message": "No model loaded."}
 
     logger.info(f"Unloading model '{app_state['current_model_name']}' from VRAM...")
-    pipe_to_delete = app_state["current_pipe"]
+    if progress_callback:
+        progress_callback(0, "Unloading model...")
 
-    if hasattr(pipe_to_delete, "pipe"):
-        del pipe_to_delete.pipe
-    del pipe_to_delete
+    pipeline_cache.remove(app_state["current_cache_key"])
 
     app_state.update(
         {
             "current_pipe": None,
             "current_model_name": "",
             "current_lora_name": "",
+            "current_cache_key": None,
             "is_model_loaded": False,
             "status_message": "No model loaded.",
         }
     )
 
-    torch.xpu.empty_cache()
+    pipeline_cache.park_all()
 
+    components = component_store.refcounts()
+    for component in components:
+        logger.info(
+            f"Shared {component['component']} still referenced by {component['refs']} pipeline(s)."
+        )
     logger.info("Model unloaded and VRAM cache cleared.")
-    return {"status_message": app_state["status_message"]}
+    if progress_callback:
+        progress_callback(1, "Model unloaded.")
+    return {"status_message": app_state["status_message"], "components": components}
 
 
 def load_model(
@@ -113,8 +202,27 @@ def load_model(
     cpu_offload,
     lora_name,
     progress_callback=None,
+    warmup=None,
+    profile=False,
+):
+    """
+    Loads a new model into memory, applying specified configurations and a LoRA.
+    With `warmup` (default: `settings["warmup"]`) a short dummy generation
+    compiles kernels before the model is reported ready. With `profile` the
+    load is captured by `torch.profiler` and the result links the trace.
+    """
+    with profiler.capture("load_model", requested=profile) as capture:
+        result = _load_model(
+            model_name, scheduler_name, vae_tiling, cpu_offload, lora_name, progress_callback, warmup
+        )
+    if capture is not None:
+        result["profile"] = capture.links
+    return result
+
+
+def _load_model(
+    model_name, scheduler_name, vae_tiling, cpu_offload, lora_name, progress_callback, warmup
 ):
-    """Loads a new model into memory, applying specified configurations and a LoRA."""
     if not model_name:
         raise ValueError("Please select a model from the dropdown.")
 
@@ -123,52 +231,79 @@ def load_model(
             progress_callback(progress, desc)
 
     try:
-        if app_state["is_model_loaded"]:
-            unload_model()
-
-        logger.info(f"Loading model: {model_name}...")
-        update_progress(0, f"Getting pipeline for {model_name}...")
-
-        pipe = get_pipeline_for_model(model_name)
-        pipe.load_pipeline(lambda progress, desc: update_progress(progress, desc))
-        pipe.place_on_device(use_cpu_offload=cpu_offload)
-
-        if lora_name and lora_name != "None":
-            lora_path = os.path.join("./loras", f"{lora_name}.safetensors")
-            if os.path.exists(lora_path):
-                logger.info(f"Loading LoRA: {lora_name}")
-                update_progress(0.7, f"Loading LoRA: {lora_name}")
-                pipe.pipe.load_lora_weights(lora_path)
-                app_state["current_lora_name"] = lora_name
-            else:
-                logger.warning(f"LoRA file not found: {lora_path}. Skipping.")
-                app_state["current_lora_name"] = ""
-        else:
-            app_state["current_lora_name"] = ""
-
-        pipe.optimize_with_ipex(lambda progress, desc: update_progress(progress, desc))
+        cache_key = pipeline_cache.make_key(model_name, cpu_offload)
+        pipe = pipeline_cache.get(cache_key)
 
-        # CORRECTED: Simplified check for pipelines that manage their own schedulers
-        if not isinstance(pipe, (SD3Pipeline, ArtTicFLUXPipeline)):
-            logger.info(f"Setting scheduler to: {scheduler_name}")
-            SchedulerClass = SCHEDULER_MAP[scheduler_name]
-            pipe.pipe.scheduler = SchedulerClass.from_config(pipe.pipe.scheduler.config)
+        if pipe is not None:
+            logger.info(f"Restoring cached pipeline for '{model_name}'...")
+            update_progress(0.5, f"Restoring cached {model_name}...")
+            pipeline_cache.activate(cache_key)
+        else:
+            logger.info(f"Loading model: {model_name}...")
+            update_progress(0, f"Getting pipeline for {model_name}...")
+
+            # Make room on the device using the checkpoint size as an estimate.
+            model_path = os.path.join(MODELS_DIR, f"{model_name}.safetensors")
+            if not cpu_offload and os.path.exists(model_path):
+                pipeline_cache.reserve(os.path.getsize(model_path))
+
+            with metrics.timer("model_load_seconds", phase="detect"):
+                pipe = get_pipeline_for_model(model_name)
+            pipe.load_device = "cpu" if cpu_offload else pipe.backend.device
+            try:
+                with PeakRSSSampler() as rss:
+                    load_start = time.perf_counter()
+                    pipe.load_pipeline(lambda progress, desc: update_progress(progress, desc))
+                load_seconds = time.perf_counter() - load_start
+                metrics.observe("model_load_seconds", load_seconds, phase="load_pipeline")
+                load_stats.record(
+                    type(pipe).__name__,
+                    settings["load_mode"],
+                    load_seconds,
+                    rss,
+                )
+                with metrics.timer("model_load_seconds", phase="place_on_device"):
+                    pipe.place_on_device(use_cpu_offload=cpu_offload)
+                with metrics.timer("model_load_seconds", phase="optimize"):
+                    pipe.optimize_with_ipex(
+                        lambda progress, desc: update_progress(progress, desc)
+                    )
+            except Exception:
+                # Do not keep shared components alive for a pipeline that failed to load.
+                pipe.release_components()
+                raise
+            pipeline_cache.put(cache_key, pipe)
+
+        # The LoRA chosen at load time becomes the default for generations that
+        # do not pass their own list; attach it now so the first one is fast.
+        lora_name = lora_name if lora_name and lora_name != "None" else ""
+        if lora_name:
+            try:
+                update_progress(0.9, f"Attaching LoRA: {lora_name}")
+                with metrics.timer("model_load_seconds", phase="lora"):
+                    lora_manager.attach(pipe, lora_name)
+            except FileNotFoundError as e:
+                logger.warning(f"{e}. Skipping.")
+                lora_name = ""
+        app_state["current_lora_name"] = lora_name
+
+        # The load-time sampler is the default; generations may pick another one.
+        app_state["current_scheduler"] = use_scheduler(pipe, scheduler_name)
 
         # CORRECTED: Simplified check for VAE tiling applicability
         if not isinstance(pipe, ArtTicFLUXPipeline):
             if vae_tiling:
                 logger.info("Enabling VAE Slicing & Tiling for memory efficiency.")
-                pipe.pipe.enable_vae_slicing()
-                pipe.pipe.enable_vae_tiling()
             else:
                 logger.info("Disabling VAE Slicing & Tiling.")
-                pipe.pipe.disable_vae_slicing()
-                pipe.pipe.disable_vae_tiling()
+            # Applied per call: the VAE may be shared with other cached pipelines.
+            pipe.vae_tiling = bool(vae_tiling)
         else:
             logger.info("VAE Tiling is not applicable for FLUX models.")
 
         app_state["current_pipe"] = pipe
         app_state["current_model_name"] = model_name
+        app_state["current_cache_key"] = cache_key
 
         # CORRECTED: Logic to determine model type string and resolution
         if isinstance(pipe, ArtTicFLUXPipeline):
@@ -183,6 +318,19 @@ def load_model(
         else:
             default_res, model_type = 512, "SD 1.5"
 
+        warmup_report = None
+        if (settings["warmup"] if warmup is None else warmup) and not pipe.is_offloaded:
+            try:
+                warmup_report = warm_up(
+                    pipe, _model_key(pipe), (default_res, default_res), update_progress
+                )
+                if warmup_report["shapes"]:
+                    metrics.observe("model_load_seconds", warmup_report["seconds"], phase="warmup")
+                    update_progress(0.99, f"Warmed up in {warmup_report['seconds']:.1f}s")
+            except Exception as e:
+                # A failed warmup only costs speed; the model itself is usable.
+                logger.warning(f"Warmup failed: {e}")
+
         status_suffix = "(CPU Offload)" if cpu_offload else ""
         lora_suffix = (
             f" + {app_state['current_lora_name']}"
@@ -206,6 +354,9 @@ def load_model(
             "model_type": model_type,
             "width": default_res,
             "height": default_res,
+            "recommended_steps": recommended_steps(scheduler_name, pipe),
+            "warmup": warmup_report,
+            "buckets": buckets_for(pipe.bucket_family),
         }
     except Exception as e:
         logger.error(
@@ -217,6 +368,7 @@ def load_model(
                 "current_model_name": "",
                 "is_model_loaded": False,
                 "current_lora_name": "",
+                "current_cache_key": None,
             }
         )
         raise RuntimeError(
@@ -224,6 +376,21 @@ def load_model(
         )
 
 
+def _model_key(pipe):
+    """Stable identity of a pipeline's weights for the warm-shape manifest."""
+    try:
+        return model_index.describe(pipe.model_path)["hash"][:16]
+    except Exception:
+        return os.path.basename(pipe.model_path)
+
+
+def _on_image_written(filename):
+    """Runs on the writer pool once an output image is on disk."""
+    gallery_index.add(filename)
+    result_cache.forget_written(filename)
+    thumbnail_service.schedule(filename)
+
+
 def generate_image(
     prompt,
     negative_prompt,
@@ -234,54 +401,468 @@ def generate_image(
     height,
     lora_weight,
     progress_callback=None,
+    return_image=False,
+    preview_callback=None,
+    loras=None,
+    fuse_loras=False,
+    scheduler_name=None,
+    snap_resolution=None,
+    save_image=True,
+    profile=False,
 ):
+    """
+    Generates one image and hands it to the background writer. The result is
+    returned as soon as the image is decoded; use `image_writer.pending` to
+    wait for the file. `return_image` adds the PIL image to the result.
+    `preview_callback(step, total, jpeg_bytes)` receives live latent previews.
+    `loras` is a list of `{"name", "weight"}`; when omitted, the LoRA chosen at
+    load time is used with `lora_weight`. `fuse_loras` folds them into the
+    base weights, which is faster for long runs with a fixed LoRA set.
+    `scheduler_name` overrides the sampler chosen at load time, and a missing
+    or zero `steps` uses that sampler's recommended step count.
+    `snap_resolution` (default: `settings["snap_resolutions"]`) moves the size
+    to the nearest canonical bucket so compiled kernels are reused.
+    With `save_image=False` the image is returned in the result instead of
+    being written, for a caller that saves it with `save_output`.
+    `profile` captures the pipeline call with `torch.profiler` (see
+    `core.profiling`); such calls never reuse an earlier output.
+
+    Queued calls with the same model, size, steps, sampler, guidance and LoRA
+    set are batched by the worker (see `generate_image_batch`). A call whose
+    parameters match an earlier output returns that file with `"cached": True`.
+    """
+    request = _prepare_generation(
+        prompt,
+        negative_prompt,
+        steps,
+        guidance,
+        seed,
+        width,
+        height,
+        lora_weight,
+        progress_callback=progress_callback,
+        return_image=return_image,
+        preview_callback=preview_callback,
+        loras=loras,
+        fuse_loras=fuse_loras,
+        scheduler_name=scheduler_name,
+        snap_resolution=snap_resolution,
+        save_image=save_image,
+        profile=profile,
+    )
+    return _run_generation([request])[0]
+
+
+def generate_image_batch(calls):
+    """
+    Runs several `generate_image` calls, given as `[(args, kwargs)]` with equal
+    `generation_batch_key`s, as one batched denoising pass. Each call keeps its
+    own prompt, negative prompt, seed, callbacks and result.
+    """
+    return _run_generation([_prepare_generation(*args, **kwargs) for args, kwargs in calls])
+
+
+def generation_batch_key(*args, **kwargs):
+    """
+    The batching key of a `generate_image` call: calls with equal keys can share
+    one denoising pass. Guidance is part of the key because the diffusers
+    pipelines take a single guidance scale per call. Returns None when no
+    model is loaded.
+    """
     if not app_state["is_model_loaded"]:
-        raise ConnectionAbortedError("Cannot generate, no model is loaded.")
+        return None
+    return _prepare_generation(*args, **kwargs)["batch_key"]
 
-    logger.info("Starting image generation...")
-    start_time = time.time()
 
+def _prepare_generation(
+    prompt,
+    negative_prompt,
+    steps,
+    guidance,
+    seed,
+    width,
+    height,
+    lora_weight,
+    progress_callback=None,
+    return_image=False,
+    preview_callback=None,
+    loras=None,
+    fuse_loras=False,
+    scheduler_name=None,
+    snap_resolution=None,
+    save_image=True,
+    profile=False,
+):
+    """Resolves the defaults of a `generate_image` call without touching the pipeline."""
+    if not app_state["is_model_loaded"]:
+        raise ConnectionAbortedError("Cannot generate, no model is loaded.")
+
+    pipe = app_state["current_pipe"]
+    scheduler_name = scheduler_name or app_state["current_scheduler"]
+    if not pipe.scheduler_swappable:
+        scheduler_name = None
+    steps = int(steps or recommended_steps(scheduler_name, pipe))
+
+    width, height = int(width), int(height)
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Width and height must be positive, got {width}x{height}.")
+    requested_size = (width, height)
+    if settings["snap_resolutions"] if snap_resolution is None else snap_resolution:
+        width, height = snap(width, height, pipe.bucket_family)
+
+    if loras is None:
+        loras = [{"name": app_state["current_lora_name"], "weight": lora_weight}]
+    loras = normalize_loras(loras)
+    check_lora_count(loras)
+    guidance = float(guidance)
+    fuse_loras = bool(fuse_loras)
+
+    negative_prompt = negative_prompt if negative_prompt and negative_prompt.strip() else None
     seed = int(seed if seed is not None else random.randint(0, 2**32 - 1))
-    generator = torch.Generator("xpu").manual_seed(seed)
 
-    def pipeline_progress_callback(pipe, step, timestep, callback_kwargs):
-        progress = step / int(steps)
-        if progress_callback:
-            progress_callback(progress, f"Sampling... {step + 1}/{int(steps)}")
+    batch_key = (id(pipe), scheduler_name, steps, guidance, width, height, tuple(loras), fuse_loras)
+    return {
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "seed": seed,
+        # Set by `_run_generation` when the result cache is on; see `_param_hash`.
+        "param_hash": None,
+        "requested_size": requested_size,
+        "snapped": requested_size != (width, height),
+        "progress_callback": progress_callback,
+        "preview_callback": preview_callback,
+        "return_image": return_image,
+        "save_image": save_image,
+        "profile": bool(profile),
+        "batch_key": batch_key,
+        # Equal within a run of the same pipeline means the same image.
+        "identity": batch_key + (prompt, negative_prompt, seed),
+        "pipe": pipe,
+        "scheduler_name": scheduler_name,
+        "steps": steps,
+        "guidance": guidance,
+        "width": width,
+        "height": height,
+        "loras": loras,
+        "fuse_loras": fuse_loras,
+    }
+
+
+def _param_hash(request):
+    """
+    Hash of everything that determines a prepared request's saved file, for
+    the result cache. Stats (and on a first sight hashes) the model and LoRA
+    files, so it is only computed for requests about to run.
+    """
+    pipe = request["pipe"]
+    return param_hash(
+        {
+            "model": _model_key(pipe),
+            "dtype": str(pipe.dtype),
+            "loras": [
+                (name, weight, _file_mtime(lora_path(name))) for name, weight in request["loras"]
+            ],
+            "prompt": request["prompt"],
+            "negative_prompt": request["negative_prompt"],
+            "seed": request["seed"],
+            "steps": request["steps"],
+            "guidance": request["guidance"],
+            "scheduler": request["scheduler_name"],
+            "width": request["width"],
+            "height": request["height"],
+            "fuse_loras": request["fuse_loras"],
+            "vae_tiling": pipe.vae_tiling,
+            # The file, not just the pixels: format and encoder settings.
+            "output": output_signature(),
+        }
+    )
+
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _run_generation(requests):
+    """
+    Serves prepared requests sharing one batch key: requests whose parameter
+    hash already has an output reuse it, identical requests run once, and the
+    rest share a single pipeline call.
+    """
+    results = [None] * len(requests)
+    if settings["result_cache"]:
+        for i, request in enumerate(requests):
+            request["param_hash"] = _param_hash(request)
+            if request["profile"]:
+                continue  # Asked to measure the generation itself.
+            filename = result_cache.lookup(request["param_hash"])
+            if filename is not None:
+                results[i] = _cached_result(request, filename)
+
+    first_of_identity = {}
+    for i, request in enumerate(requests):
+        if results[i] is None:
+            first_of_identity.setdefault(request["identity"], i)
+    if first_of_identity:
+        generated = _generate([requests[i] for i in first_of_identity.values()])
+        for i, result in zip(first_of_identity.values(), generated):
+            results[i] = result
+
+    for i, request in enumerate(requests):
+        if results[i] is None:
+            results[i] = {**results[first_of_identity[request["identity"]]], "coalesced": True}
+    return results
+
+
+def save_output(image, filename, param_hash=None):
+    """Hands a generated image to the background writer and the result cache."""
+    image_writer.submit(
+        image,
+        os.path.join(OUTPUTS_DIR, filename),
+        on_written=_on_image_written,
+        metadata={PARAM_HASH_KEY: param_hash} if param_hash else None,
+    )
+    if param_hash:
+        result_cache.record(param_hash, filename)
+
+
+def _cached_result(request, filename):
+    logger.info(f"Reusing '{filename}' for a request with identical parameters.")
+    if request["progress_callback"]:
+        request["progress_callback"](1.0, "Reused an identical earlier image.")
+    result = {
+        "image_filename": filename,
+        "info": (
+            f"Reused '{filename}', generated earlier with identical parameters "
+            f"(seed {request['seed']})."
+        ),
+        "cached": True,
+        "param_hash": request["param_hash"],
+    }
+    if request["return_image"]:
+        write_future = image_writer.pending(filename)
+        if write_future is not None:
+            write_future.result()
+        with Image.open(os.path.join(OUTPUTS_DIR, filename)) as image:
+            result["image"] = image.copy()
+    return result
+
+
+def _generate(requests):
+    """Runs prepared requests sharing one batch key in a single pipeline call."""
+    first = requests[0]
+    pipe = first["pipe"]
+    steps, width, height = first["steps"], first["width"], first["height"]
+    loras, fuse_loras = first["loras"], first["fuse_loras"]
+    batch_size = len(requests)
+
+    logger.info(
+        "Starting image generation..."
+        if batch_size == 1
+        else f"Starting batched generation of {batch_size} images..."
+    )
+    start_time = time.time()
+
+    scheduler_name = use_scheduler(pipe, first["scheduler_name"])
+    for request in requests:
+        if request["snapped"]:
+            requested_width, requested_height = request["requested_size"]
+            logger.info(
+                f"Snapped {requested_width}x{requested_height} to bucket {width}x{height}."
+            )
+    warm_shape = (width, height) in pipe.warm_shapes
+
+    previewers = [
+        LatentPreviewer(pipe.latent_format, height, width)
+        if request["preview_callback"] and settings["preview_interval"] > 0
+        else None
+        for request in requests
+    ]
+    step_times = []
+
+    def pipeline_progress_callback(diffusers_pipe, step, timestep, callback_kwargs):
+        now = time.perf_counter()
+        # The first interval also covers latent preparation.
+        metrics.observe("generation_stage_seconds", now - step_times[-1], stage="denoise_step")
+        step_times.append(now)
+        progress = step / steps
+        latents = callback_kwargs.get("latents")
+        for i, request in enumerate(requests):
+            if request["progress_callback"]:
+                request["progress_callback"](progress, f"Sampling... {step + 1}/{steps}")
+            if previewers[i] is None or latents is None:
+                continue
+            try:
+                preview = previewers[i](step, latents[i : i + 1])
+            except Exception as e:
+                logger.warning(f"Latent preview failed, disabling previews: {e}")
+                previewers[i] = None
+                preview = None
+            if preview:
+                request["preview_callback"](step + 1, steps, preview)
         return callback_kwargs
 
+    lora_manager.apply(pipe, loras, fuse=fuse_loras)
+
+    prompts = [request["prompt"] for request in requests]
+    # Negative prompts only matter with classifier-free guidance.
+    negative_prompts = (
+        [request["negative_prompt"] for request in requests] if first["guidance"] > 1 else None
+    )
+    with metrics.timer("generation_stage_seconds", stage="text_encode"):
+        # Text encoders only run for prompts not seen with these encoders and LoRAs.
+        embeds = pipe.encode_prompts(prompts, negative_prompts)
     gen_kwargs = {
-        "prompt": prompt,
-        "num_inference_steps": int(steps),
-        "guidance_scale": float(guidance),
-        "width": int(width),
-        "height": int(height),
-        "generator": generator,
+        **embeds,
+        "num_inference_steps": steps,
+        "guidance_scale": first["guidance"],
+        "width": width,
+        "height": height,
+        "generator": [
+            pipe.backend.generator(request["seed"]) for request in requests
+        ],
         "callback_on_step_end": pipeline_progress_callback,
     }
 
-    if app_state["current_lora_name"] and float(lora_weight) > 0:
-        gen_kwargs["cross_attention_kwargs"] = {"scale": float(lora_weight)}
-        logger.info(
-            f"Applying LoRA '{app_state['current_lora_name']}' with weight {lora_weight}"
+    step_times.append(time.perf_counter())
+    with profiler.capture(
+        "generate", requested=any(request["profile"] for request in requests)
+    ) as capture:
+        images = pipe.generate(**gen_kwargs).images
+        generated_at = time.perf_counter()
+    if len(step_times) > 1:
+        # Everything after the last step: VAE decode and conversion to PIL.
+        metrics.observe(
+            "generation_stage_seconds", generated_at - step_times[-1], stage="vae_decode"
+        )
+    for request in requests:
+        shape_stats.record(width, height, warm=warm_shape, snapped=request["snapped"])
+    if not warm_shape:
+        pipe.warm_shapes.add((width, height))
+        warm_shapes.record(_model_key(pipe), pipe.dtype, width, height)
+    generation_time = time.time() - start_time
+    metrics.observe("generation_seconds", generation_time, batch_size=batch_size)
+    images_per_second = batch_size / generation_time
+    logger.info(
+        f"Generation completed in {generation_time:.2f} seconds"
+        + (f" ({images_per_second:.2f} images/s)." if batch_size > 1 else ".")
+    )
+    if loras and len(step_times) > 3:
+        # step_times starts with the call itself; skip the first step, which includes warmup.
+        lora_manager.record_step_time(
+            pipe,
+            (width, height, batch_size),
+            (step_times[-1] - step_times[1]) / (len(step_times) - 2),
         )
 
-    if negative_prompt and negative_prompt.strip():
-        gen_kwargs["negative_prompt"] = negative_prompt
+    results = []
+    for i, (request, image) in enumerate(zip(requests, images)):
+        seed = request["seed"]
+        # Batch members can share a seed; the index keeps their files apart.
+        suffix = f"_{i}" if batch_size > 1 else ""
+        filename = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{app_state['current_model_name']}_{seed}{suffix}"
+            f"{output_extension()}"
+        )
+        if request["save_image"]:
+            save_output(image, filename, request["param_hash"])
+
+        info_text = f"Generated in {generation_time:.2f}s on '{app_state['current_model_name']}' with seed {seed}."
+        if batch_size > 1:
+            info_text += f" Batched with {batch_size - 1} other request(s), {images_per_second:.2f} images/s."
+        if scheduler_name:
+            info_text += f" Sampler: {scheduler_name}, {steps} steps."
+        if request["snapped"]:
+            info_text += f" Size snapped to {width}x{height}."
+        if loras:
+            info_text += " LoRA: " + ", ".join(f"{n} @ {w}" for n, w in loras) + "."
+            if fuse_loras:
+                gain = lora_manager.fusion_gain(pipe, (width, height, batch_size))
+                info_text += " (fused"
+                info_text += f", {gain:.0%} faster per step)" if gain is not None else ")"
+
+        result = {
+            "image_filename": filename,
+            "info": info_text,
+            "batch_size": batch_size,
+            "images_per_second": images_per_second,
+            "param_hash": request["param_hash"],
+        }
+        if capture is not None:
+            # A batched capture covers every request in the call.
+            result["profile"] = capture.links
+        if request["return_image"] or not request["save_image"]:
+            result["image"] = image
+        results.append(result)
+    return results
+
+
+def generation_dedup_key(*args, **kwargs):
+    """
+    Identity of a `generate_image` call's parameters on the loaded pipeline;
+    equal keys give the same image. Cheap, unlike the result cache's hash.
+    """
+    if not app_state["is_model_loaded"]:
+        return None
+    request = _prepare_generation(*args, **kwargs)
+    # Profiled calls must really run, not take over another job's result.
+    return None if request["profile"] else request["identity"]
 
-    image = app_state["current_pipe"].generate(**gen_kwargs).images[0]
-    generation_time = time.time() - start_time
-    logger.info(f"Generation completed in {generation_time:.2f} seconds.")
 
-    os.makedirs("./outputs", exist_ok=True)
-    filename = (
-        f"{time.strftime('%Y%m%d-%H%M%S')}_{app_state['current_model_name']}_{seed}.png"
-    )
-    filepath = os.path.join("./outputs", filename)
-    image.save(filepath)
+job_queue.register_batcher(
+    generate_image,
+    generation_batch_key,
+    generate_image_batch,
+    dedup_key_func=generation_dedup_key,
+)
 
-    info_text = f"Generated in {generation_time:.2f}s on '{app_state['current_model_name']}' with seed {seed}."
-    if app_state["current_lora_name"]:
-        info_text += f" LoRA: {app_state['current_lora_name']} @ {lora_weight}."
 
-    return {"image_filename": filename, "info": info_text}
+# --- Metrics ---
+# Read at scrape time only; see core.metrics.
+metrics.gauge("queue_depth", "Jobs waiting in the generation queue.", job_queue.depth)
+metrics.gauge(
+    "loaded_models",
+    "Pipelines in the cache, by where their weights are.",
+    lambda: [
+        ({"location": location}, count)
+        for location, count in _loaded_model_counts().items()
+    ],
+)
+metrics.gauge("host_memory_bytes", "Resident set size of this process.", current_rss)
+metrics.gauge(
+    "device_memory_bytes",
+    "Device memory allocated by tensors and the device's total memory.",
+    lambda: [
+        ({"kind": "allocated"}, get_backend().memory_allocated()),
+        ({"kind": "total"}, get_backend().total_memory()),
+    ],
+)
+metrics.gauge(
+    "cache_hits_total",
+    "Lookups answered from a cache.",
+    lambda: [({"cache": name}, stats["hits"]) for name, stats in _cache_counters().items()],
+    kind="counter",
+)
+metrics.gauge(
+    "cache_misses_total",
+    "Lookups that missed a cache.",
+    lambda: [({"cache": name}, stats["misses"]) for name, stats in _cache_counters().items()],
+    kind="counter",
+)
+
+
+def _loaded_model_counts():
+    counts = {"device": 0, "host": 0}
+    for entry in pipeline_cache.stats()["entries"]:
+        counts[entry["location"]] += 1
+    return counts
+
+
+def _cache_counters():
+    return {
+        "pipelines": pipeline_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "results": result_cache.stats(),
+    }
@@ -0,0 +1,234 @@
+# core/loras.py
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from safetensors.torch import load_file
+
+from core.settings import settings
+from pipelines.component_store import touches_text_encoders
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+LORAS_DIR = "./loras"
+MB = 1024**2
+
+
+def lora_path(name):
+    return os.path.join(LORAS_DIR, f"{name}.safetensors")
+
+
+def adapter_name(name):
+    """PEFT adapter names end up in module attribute paths; keep them identifier-safe."""
+    return "lora_" + re.sub(r"\W", "_", name)
+
+
+def normalize_loras(loras):
+    """
+    Accepts `[{"name", "weight"}]`, `[(name, weight)]` or None and returns a list
+    of `(name, weight)` with "None", empty and zero-weight entries removed.
+    """
+    normalized = []
+    for item in loras or []:
+        if isinstance(item, dict):
+            name, weight = item.get("name"), item.get("weight", 1.0)
+        else:
+            name, weight = item
+        if not name or name == "None" or float(weight) == 0:
+            continue
+        normalized.append((name, float(weight)))
+    return normalized
+
+
+def check_lora_count(loras):
+    """Rejects a LoRA set that cannot be attached to a pipeline all at once."""
+    limit = settings["max_attached_loras"]
+    count = len({name for name, _ in loras})
+    if count > limit:
+        raise ValueError(f"At most {limit} LoRAs can be used at once, got {count}.")
+
+
+class LoraManager:
+    """
+    Keeps parsed LoRA state dicts in host RAM (LRU, bounded by
+    `settings["lora_cache_mb"]`) and attaches them as named PEFT adapters on
+    resident pipelines. Switching or stacking LoRAs only changes the active
+    adapter set and weights; the base model is never reloaded.
+    """
+
+    def __init__(self):
+        self._state_dicts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- Host cache ---
+    def state_dict(self, name):
+        """Returns the parsed weights of a LoRA, reading the file only on a miss."""
+        path = lora_path(name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"LoRA file not found: {path}")
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            entry = self._state_dicts.get(name)
+            if entry is not None and entry["mtime"] == mtime:
+                self.hits += 1
+                self._state_dicts.move_to_end(name)
+                return entry["weights"]
+            self.misses += 1
+
+        start = time.perf_counter()
+        weights = load_file(path, device="cpu")
+        size = sum(t.numel() * t.element_size() for t in weights.values())
+        logger.info(
+            f"Read LoRA '{name}' ({size / MB:.0f} MB) in {time.perf_counter() - start:.2f}s."
+        )
+        with self._lock:
+            self._state_dicts[name] = {"weights": weights, "mtime": mtime, "bytes": size}
+            self._evict()
+        return weights
+
+    def _evict(self):
+        budget = settings["lora_cache_mb"] * MB
+        while len(self._state_dicts) > 1 and self._host_bytes() > budget:
+            name, _ = self._state_dicts.popitem(last=False)
+            logger.info(f"Dropped LoRA '{name}' from the host cache.")
+
+    def _host_bytes(self):
+        return sum(entry["bytes"] for entry in self._state_dicts.values())
+
+    # --- Adapters on a pipeline ---
+    def attach(self, pipe, name, keep=()):
+        """
+        Loads a LoRA as a named adapter on `pipe` unless it is already attached.
+        Adapters named in `keep` (the rest of the set being activated) are
+        never detached to make room.
+        """
+        if name in pipe.lora_adapters:
+            pipe.lora_adapters.move_to_end(name)
+            return
+        # diffusers pops keys while converting, so hand it a shallow copy.
+        weights = dict(self.state_dict(name))
+        # Text encoders may be shared with other pipelines; never patch those in place.
+        pipe.make_text_encoders_private(weights.keys())
+        touches_encoders = touches_text_encoders(weights.keys())
+        pipe.pipe.load_lora_weights(weights, adapter_name=adapter_name(name))
+        pipe.lora_adapters[name] = adapter_name(name)
+        if touches_encoders:
+            # Prompt embeddings depend on this LoRA while it is active.
+            pipe.text_encoder_loras.add(name)
+
+        evictable = [n for n in pipe.lora_adapters if n != name and n not in keep]
+        while len(pipe.lora_adapters) > settings["max_attached_loras"] and evictable:
+            old_name = evictable.pop(0)
+            old_adapter = pipe.lora_adapters.pop(old_name)
+            pipe.pipe.delete_adapters(old_adapter)
+            pipe.text_encoder_loras.discard(old_name)
+            logger.info(f"Detached LoRA '{old_name}' from the pipeline.")
+
+    def apply(self, pipe, loras, fuse=False):
+        """
+        Makes exactly `loras` (a list of `(name, weight)`) active on `pipe`,
+        attaching missing adapters. Adapters injected by the base model loader
+        (`pipe.base_adapters`) always stay active at full weight. With `fuse`,
+        the LoRAs are folded into the base weights so sampling runs without
+        the extra low-rank matmuls.
+        """
+        check_lora_count(loras)
+        start = time.perf_counter()
+        key = tuple(loras)
+        if pipe.fused_loras is not None:
+            if fuse and pipe.fused_loras == key:
+                return
+            self._unfuse(pipe)
+
+        requested = {name for name, _ in loras}
+        for name, _ in loras:
+            self.attach(pipe, name, keep=requested)
+
+        names = list(pipe.base_adapters) + [adapter_name(name) for name, _ in loras]
+        weights = [1.0] * len(pipe.base_adapters) + [weight for _, weight in loras]
+        if names:
+            if not pipe.loras_enabled:
+                pipe.pipe.enable_lora()
+                pipe.loras_enabled = True
+            pipe.pipe.set_adapters(names, adapter_weights=weights)
+        elif pipe.lora_adapters and pipe.loras_enabled:
+            pipe.pipe.disable_lora()
+            pipe.loras_enabled = False
+
+        if fuse and loras:
+            self._fuse(pipe, loras)
+        pipe.active_loras = key
+
+        if loras or pipe.lora_adapters:
+            logger.info(
+                f"LoRAs set to {[f'{n} @ {w}' for n, w in loras] or 'none'}"
+                f"{' (fused)' if pipe.fused_loras else ''} "
+                f"in {time.perf_counter() - start:.2f}s."
+            )
+
+    # --- Fusion ---
+    def _fuse(self, pipe, loras):
+        """
+        Merges the active adapter weights into the base layers. The low-rank
+        A/B matrices stay attached, so the delta can be subtracted again by
+        `_unfuse` without touching the checkpoint.
+        """
+        pipe.pipe.fuse_lora(
+            adapter_names=[adapter_name(name) for name, _ in loras], lora_scale=1.0
+        )
+        pipe.fused_loras = tuple(loras)
+        self._reoptimize(pipe)
+
+    def _unfuse(self, pipe):
+        pipe.pipe.unfuse_lora()
+        pipe.fused_loras = None
+        self._reoptimize(pipe)
+
+    @staticmethod
+    def _reoptimize(pipe):
+        # Only the denoiser's base weights changed in place; LoRAs never touch the VAE.
+        if pipe.is_optimized and not pipe.is_offloaded:
+            pipe.optimize_denoiser()
+
+    def record_step_time(self, pipe, shape, seconds_per_step):
+        """
+        Tracks the sampling speed of `pipe` with and without fused LoRAs at
+        `shape`, a `(width, height, batch_size)` tuple, so the two are only
+        compared at equal shapes.
+        """
+        mode = "fused" if pipe.fused_loras else "unfused"
+        times = pipe.step_seconds.setdefault(shape, {})
+        previous = times.get(mode)
+        times[mode] = (
+            seconds_per_step if previous is None else 0.7 * previous + 0.3 * seconds_per_step
+        )
+
+    @staticmethod
+    def fusion_gain(pipe, shape):
+        """Relative per-step speedup of fused over unfused sampling at `shape`, if both were measured."""
+        times = pipe.step_seconds.get(shape, {})
+        fused = times.get("fused")
+        unfused = times.get("unfused")
+        if not fused or not unfused:
+            return None
+        return 1.0 - fused / unfused
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "host_bytes": self._host_bytes(),
+                "cached": list(self._state_dicts),
+            }
+
+
+lora_manager = LoraManager()
@@ -0,0 +1,191 @@
+# core/metrics.py
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# Upper bounds in seconds, from a single denoising step to a cold model load.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "arttic_"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus sense."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [bucket counts..., +Inf count], sum
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self):
+        """`{labels: (count, sum)}` of every series, e.g. to diff around a run."""
+        with self._lock:
+            return {key: (sum(counts), total) for key, (counts, total) in self._series.items()}
+
+    def render(self):
+        name = PREFIX + self.name
+        lines = [f"# HELP {name} {self.help_text}", f"# TYPE {name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(key)} {total}")
+            lines.append(f"{name}_count{_label_text(key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read from `func()` at scrape time only, so keeping it current costs
+    nothing. `func` returns a number, None (not available) or a list of
+    `(labels_dict, value)`.
+    """
+
+    def __init__(self, name, help_text, func, kind="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.debug(f"Metric {self.name} unavailable: {e}")
+            return []
+        if value is None:
+            return []
+        samples = value if isinstance(value, list) else [({}, value)]
+        name = PREFIX + self.name
+        lines = [f"# HELP {name} {self.help_text}", f"# TYPE {name} {self.kind}"]
+        for labels, sample in samples:
+            if sample is not None:
+                lines.append(f"{name}{_label_text(tuple(sorted(labels.items())))} {float(sample)}")
+        return lines
+
+
+class Metrics:
+    """
+    Registry of the app's metrics, rendered in the Prometheus text format by
+    `render`. Recording a timing is a lock and a bisect; gauges are only
+    evaluated when someone scrapes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def gauge(self, name, help_text, func, kind="gauge"):
+        """Registers a scrape-time gauge (or, with `kind="counter"`, a counter)."""
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, func, kind)
+
+    def observe(self, name, seconds, **labels):
+        metric = self._metrics.get(name)
+        if metric is not None:
+            metric.observe(seconds, **labels)
+
+    def totals(self, name):
+        """Count and sum per label set of histogram `name`; see `Histogram.totals`."""
+        return self._metrics[name].totals()
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Times the `with` block into histogram `name`, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host, port):
+        """
+        Serves `/metrics` on a daemon thread, for UIs that cannot add the route
+        to their own server. Returns the HTTP server.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood the console.
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=server.serve_forever, name="arttic-metrics", daemon=True
+        ).start()
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+        return server
+
+
+metrics = Metrics()
+
+# --- Timings ---
+metrics.histogram(
+    "model_load_seconds",
+    "Time spent in each phase of loading a model.",
+)
+metrics.histogram(
+    "generation_stage_seconds",
+    "Time spent in each stage of a generation; 'denoise_step' is per sampling step.",
+)
+metrics.histogram(
+    "generation_seconds",
+    "Wall time of a generation call, batched calls counted once.",
+)
@@ -0,0 +1,226 @@
+# core/pipeline_cache.py
+import gc
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from core.settings import settings
+from pipelines.devices import get_backend
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+GB = 1024**3
+
+
+def _device_budget_bytes():
+    """VRAM budget from settings, or 80% of the device's memory when unset."""
+    if settings["vram_budget_gb"] is not None:
+        return int(settings["vram_budget_gb"] * GB)
+    total = get_backend().total_memory()
+    if total is None:
+        # The device is the host (CPU backend): its memory is the RAM budget.
+        return _host_budget_bytes()
+    return int(total * 0.8)
+
+
+def _host_budget_bytes():
+    """Host RAM budget from settings, or 50% of the system's memory when unset."""
+    if settings["ram_budget_gb"] is not None:
+        return int(settings["ram_budget_gb"] * GB)
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.5)
+    except (ValueError, OSError, AttributeError):
+        return 8 * GB
+
+
+class PipelineCache:
+    """
+    LRU cache of loaded pipelines. Hot entries live on the XPU, warm entries are
+    parked in host RAM. Entries are demoted (device -> host) and then evicted
+    (host -> gone) in least-recently-used order when the budgets are exceeded.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.demotions = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name, cpu_offload):
+        # LoRAs are hot-swapped as adapters, so they are not part of the key.
+        return (model_name, bool(cpu_offload))
+
+    # --- Lookup ---
+    def get(self, key):
+        """Returns the cached pipeline for `key` (made most recent) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry["pipe"]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    # --- Insertion & Residency ---
+    def put(self, key, pipe):
+        """Adds a freshly loaded (hot) pipeline and enforces the budgets."""
+        with self._lock:
+            modules = pipe.component_footprints()
+            self._entries[key] = {"pipe": pipe, "bytes": sum(modules.values()), "modules": modules}
+            self._entries.move_to_end(key)
+            self._enforce_budgets(active_key=key)
+
+    def activate(self, key):
+        """Moves a cached pipeline back onto the device, demoting others if needed."""
+        with self._lock:
+            entry = self._entries[key]
+            if entry["pipe"].is_parked:
+                self.reserve(entry["bytes"], active_key=key)
+                entry["pipe"].unpark()
+            self._entries.move_to_end(key)
+            self._enforce_budgets(active_key=key)
+            return entry["pipe"]
+
+    def reserve(self, needed_bytes, active_key=None):
+        """Parks least-recently-used hot pipelines until `needed_bytes` of VRAM fit."""
+        with self._lock:
+            budget = _device_budget_bytes()
+            for key, entry in list(self._entries.items()):
+                if self._device_bytes() + needed_bytes <= budget:
+                    break
+                if key != active_key and self._on_device(entry):
+                    self._demote(key, entry)
+
+    def park_all(self, except_key=None):
+        """Parks every hot pipeline, e.g. when the user explicitly frees VRAM."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key != except_key and self._on_device(entry):
+                    self._demote(key, entry)
+        get_backend().empty_cache()
+
+    # --- Removal ---
+    def remove(self, key):
+        """Drops a pipeline from the cache and frees its memory."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._release(entry)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._release(entry)
+
+    # --- Stats ---
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "demotions": self.demotions,
+                "evictions": self.evictions,
+                "device_bytes": self._device_bytes(),
+                "host_bytes": self._host_bytes(),
+                "device_budget_bytes": _device_budget_bytes(),
+                "host_budget_bytes": _host_budget_bytes(),
+                "entries": [
+                    {
+                        "model": key[0],
+                        "cpu_offload": key[1],
+                        "loras": list(entry["pipe"].lora_adapters),
+                        "bytes": entry["bytes"],
+                        "location": "device" if self._on_device(entry) else "host",
+                    }
+                    for key, entry in reversed(self._entries.items())
+                ],
+            }
+
+    # --- Internals ---
+    @staticmethod
+    def _on_device(entry):
+        pipe = entry["pipe"]
+        return not pipe.is_parked and not pipe.is_offloaded
+
+    def _resident_modules(self):
+        """
+        `(device, host)` maps of `id(module) -> bytes`, counting components
+        shared through the component store once. A shared component stays on
+        the device while any of its pipelines is there.
+        """
+        device, host = {}, {}
+        for entry in self._entries.values():
+            (device if self._on_device(entry) else host).update(entry["modules"])
+        return device, {module: size for module, size in host.items() if module not in device}
+
+    def _device_bytes(self):
+        return sum(self._resident_modules()[0].values())
+
+    def _host_bytes(self):
+        return sum(self._resident_modules()[1].values())
+
+    def _demote(self, key, entry):
+        if not entry["pipe"].backend.supports_offload():
+            # The pipeline already lives in host RAM; there is nowhere to park it.
+            self._evict(key, entry)
+            return
+        logger.info(f"Parking pipeline '{key[0]}' in host RAM to free VRAM.")
+        entry["pipe"].park()
+        self.demotions += 1
+
+    def _evict(self, key, entry):
+        logger.info(f"Evicting pipeline '{key[0]}' from the model cache.")
+        del self._entries[key]
+        self._release(entry)
+        self.evictions += 1
+
+    def _enforce_budgets(self, active_key):
+        device_budget = _device_budget_bytes()
+        freed = False
+        for key, entry in list(self._entries.items()):
+            if self._device_bytes() <= device_budget:
+                break
+            if key != active_key and self._on_device(entry):
+                self._demote(key, entry)
+                freed = True
+
+        host_budget = _host_budget_bytes()
+        for key, entry in list(self._entries.items()):
+            over_count = len(self._entries) > settings["max_cached_pipelines"]
+            if not over_count and self._host_bytes() <= host_budget:
+                break
+            if key == active_key or (not over_count and self._on_device(entry)):
+                continue
+            self._evict(key, entry)
+            freed = True
+
+        if freed:
+            get_backend().empty_cache()
+
+    @staticmethod
+    def _release(entry):
+        pipe = entry.pop("pipe", None)
+        if pipe is not None:
+            # Shared VAEs/text encoders stay alive while other pipelines use them.
+            pipe.release_components()
+            # Holders of an evicted pipeline see it as unloaded.
+            pipe.pipe = None
+        del pipe
+        gc.collect()
+
+
+pipeline_cache = PipelineCache()
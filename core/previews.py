@@ -0,0 +1,157 @@
+# core/previews.py
+import io
+import logging
+import math
+import struct
+import time
+
+import torch
+from PIL import Image
+
+from core.settings import settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# Linear latent -> RGB projections, one row per latent channel. They approximate
+# the VAE decoder well enough for a thumbnail at a tiny fraction of its cost.
+LATENT_RGB_FACTORS = {
+    "sd15": [
+        [0.3512, 0.2297, 0.3227],
+        [0.3250, 0.4974, 0.2350],
+        [-0.2829, 0.1762, 0.2721],
+        [-0.2120, -0.2616, -0.7177],
+    ],
+    "sdxl": [
+        [0.3651, 0.4232, 0.4341],
+        [-0.2533, -0.0042, 0.1068],
+        [0.1076, 0.1111, -0.0362],
+        [-0.3165, -0.2492, -0.2188],
+    ],
+    "sd3": [
+        [-0.0645, 0.0177, 0.1052],
+        [0.0028, 0.0312, 0.0650],
+        [0.1848, 0.0762, 0.0360],
+        [0.0944, 0.0360, 0.0889],
+        [0.0897, 0.0506, -0.0364],
+        [-0.0020, 0.1203, 0.0284],
+        [0.0855, 0.0118, 0.0283],
+        [-0.0539, 0.0658, 0.1047],
+        [-0.0057, 0.0116, 0.0700],
+        [-0.0412, 0.0281, -0.0039],
+        [0.1106, 0.1171, 0.1220],
+        [-0.0248, 0.0682, -0.0481],
+        [0.0815, 0.0846, 0.1207],
+        [-0.0120, -0.0055, -0.0867],
+        [-0.0749, -0.0634, -0.0456],
+        [-0.1418, -0.1457, -0.1259],
+    ],
+    "flux": [
+        [-0.0346, 0.0244, 0.0681],
+        [0.0034, 0.0210, 0.0687],
+        [0.0275, -0.0668, -0.0433],
+        [-0.0174, 0.0160, 0.0617],
+        [0.0859, 0.0721, 0.0329],
+        [0.0004, 0.0383, 0.0115],
+        [0.0405, 0.0861, 0.0915],
+        [-0.0236, -0.0185, -0.0259],
+        [-0.0245, 0.0250, 0.1180],
+        [0.1008, 0.0755, -0.0421],
+        [-0.0515, 0.0201, 0.0011],
+        [0.0428, -0.0012, -0.0036],
+        [0.0817, 0.0765, 0.0749],
+        [-0.1264, -0.0522, -0.1103],
+        [-0.0280, -0.0881, -0.0499],
+        [-0.1262, -0.0982, -0.0778],
+    ],
+}
+LATENT_RGB_BIAS = {
+    "sdxl": [0.1084, -0.0175, -0.0011],
+    "flux": [-0.0329, -0.0718, -0.0851],
+}
+
+# Binary WebSocket frame: kind byte, job id length + ascii id, step, total, JPEG.
+PREVIEW_FRAME_KIND = 1
+PREVIEW_JPEG_QUALITY = 70
+
+
+def encode_preview_frame(job_id, step, total, jpeg_bytes):
+    """Packs a preview into the compact binary frame understood by the web UI."""
+    job_bytes = job_id.encode("ascii")
+    header = struct.pack(
+        f">BB{len(job_bytes)}sHH", PREVIEW_FRAME_KIND, len(job_bytes), job_bytes, step, total
+    )
+    return header + jpeg_bytes
+
+
+class LatentPreviewer:
+    """
+    Turns intermediate latents into small JPEG previews every few steps. The
+    interval grows automatically so previews never cost more than
+    `settings["preview_max_overhead"]` of the measured step time.
+    """
+
+    def __init__(self, latent_format, height, width):
+        self.latent_format = latent_format
+        self.height = int(height)
+        self.width = int(width)
+        self.interval = max(1, int(settings["preview_interval"]))
+        self.max_overhead = settings["preview_max_overhead"]
+        self._factors = None
+        self._bias = None
+        self._last_step_time = None
+        self._step_seconds = None
+
+    def __call__(self, step, latents):
+        """Returns JPEG bytes for this step, or None if no preview is due."""
+        now = time.perf_counter()
+        if self._last_step_time is not None:
+            elapsed = now - self._last_step_time
+            self._step_seconds = (
+                elapsed
+                if self._step_seconds is None
+                else 0.8 * self._step_seconds + 0.2 * elapsed
+            )
+        self._last_step_time = now
+        if (step + 1) % self.interval:
+            return None
+
+        jpeg_bytes = self.render(latents)
+        cost = time.perf_counter() - now
+        # Keep the preview's own cost out of the step-time estimate.
+        self._last_step_time += cost
+        if self._step_seconds:
+            # One preview per `interval` steps must stay within the overhead budget.
+            needed = math.ceil(cost / (self.max_overhead * self._step_seconds))
+            if needed > self.interval:
+                self.interval = needed
+                logger.info(f"Latent previews throttled to every {needed} steps.")
+        return jpeg_bytes
+
+    @torch.no_grad()
+    def render(self, latents):
+        latent = self._to_spatial(latents[0])
+        if self._factors is None:
+            self._factors = torch.tensor(
+                LATENT_RGB_FACTORS[self.latent_format], device=latent.device
+            )
+            bias = LATENT_RGB_BIAS.get(self.latent_format, [0.0, 0.0, 0.0])
+            self._bias = torch.tensor(bias, device=latent.device)[:, None, None]
+
+        rgb = torch.einsum("chw,cr->rhw", latent.float(), self._factors) + self._bias
+        rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8)
+        array = rgb.permute(1, 2, 0).cpu().numpy()
+
+        buffer = io.BytesIO()
+        Image.fromarray(array).save(buffer, format="JPEG", quality=PREVIEW_JPEG_QUALITY)
+        return buffer.getvalue()
+
+    def _to_spatial(self, latent):
+        """FLUX latents arrive packed as 2x2 patches; unpack them to (C, H, W)."""
+        if self.latent_format != "flux" or latent.dim() != 2:
+            return latent
+        height = 2 * (self.height // 16)
+        width = 2 * (self.width // 16)
+        channels = latent.shape[-1] // 4
+        latent = latent.view(height // 2, width // 2, channels, 2, 2)
+        return latent.permute(2, 0, 3, 1, 4).reshape(channels, height, width)
@@ -0,0 +1,153 @@
+# core/profiling.py
+import contextlib
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from core.settings import settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+PROFILES_DIR = "./profiles"
+# URL prefix the web server mounts PROFILES_DIR under.
+PROFILES_URL = "/profiles"
+# Operators listed in the text summary next to each trace.
+SUMMARY_ROWS = 30
+# Profiles kept on disk; the oldest are deleted beyond this.
+MAX_PROFILES = 50
+
+
+class Capture:
+    """Outcome of one profiled call; `links` is filled in when the block exits."""
+
+    def __init__(self, name):
+        self.name = name
+        self.links = None
+
+
+class Profiler:
+    """
+    Wraps single calls in `torch.profiler`, recording CPU activity and that of
+    the active device when the profiler supports it. Each capture writes a
+    Chrome/Perfetto trace (open in chrome://tracing or ui.perfetto.dev) and a
+    top-N operator table to `profiles/`. Besides explicit requests, 1 in
+    `settings["profile_every"]` calls is captured automatically.
+    """
+
+    def __init__(self, profiles_dir=PROFILES_DIR):
+        self.profiles_dir = profiles_dir
+        # Sampling counts each kind of call ("generate", "load_model") separately.
+        self._calls = defaultdict(lambda: itertools.count(1))
+        # One capture at a time: the profiler is process-wide.
+        self._active = threading.Lock()
+
+    def should_capture(self, name, requested=False):
+        every = settings["profile_every"]
+        sampled = bool(every) and next(self._calls[name]) % every == 0
+        return bool(requested) or sampled
+
+    @contextlib.contextmanager
+    def capture(self, name, requested=False):
+        """
+        Profiles the `with` block when requested or sampled, yielding a
+        `Capture` (or None when not profiling). A failing profiler never fails
+        the call it wraps.
+        """
+        if not self.should_capture(name, requested) or not self._active.acquire(blocking=False):
+            yield None
+            return
+        capture = Capture(name)
+        try:
+            profile = self._start()
+        except Exception as e:
+            logger.warning(f"Could not start the profiler: {e}")
+            self._active.release()
+            yield None
+            return
+        try:
+            yield capture
+        finally:
+            try:
+                profile.__exit__(None, None, None)
+                capture.links = self._export(profile, name)
+            except Exception as e:
+                logger.warning(f"Could not write the profile of '{name}': {e}")
+            finally:
+                self._active.release()
+
+    @staticmethod
+    def _activities():
+        from torch.profiler import ProfilerActivity
+        from pipelines.devices import get_backend
+
+        activities = [ProfilerActivity.CPU]
+        device = getattr(ProfilerActivity, get_backend().name.upper(), None)
+        if device is not None and device != ProfilerActivity.CPU:
+            activities.append(device)
+        return activities
+
+    def _start(self):
+        import torch
+
+        profile = torch.profiler.profile(
+            activities=self._activities(), record_shapes=True, with_stack=False
+        )
+        profile.__enter__()
+        return profile
+
+    def _export(self, profile, name):
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{os.getpid()}"
+        trace_name, summary_name = f"{stem}.trace.json", f"{stem}.txt"
+        profile.export_chrome_trace(os.path.join(self.profiles_dir, trace_name))
+
+        averages = profile.key_averages()
+        device = next((a.name.lower() for a in self._activities()[1:]), None)
+        # Device time first; its column name differs between torch versions.
+        sort_keys = [f"self_{device}_time_total", "self_device_time_total"] if device else []
+        for sort_by in sort_keys + ["self_cpu_time_total"]:
+            try:
+                table = averages.table(sort_by=sort_by, row_limit=SUMMARY_ROWS)
+                break
+            except Exception:
+                continue
+        with open(os.path.join(self.profiles_dir, summary_name), "w", encoding="utf-8") as f:
+            f.write(table)
+
+        self._prune()
+        logger.info(f"Profile of '{name}' written to {self.profiles_dir}/{stem}.*")
+        return {
+            "trace": f"{PROFILES_URL}/{trace_name}",
+            "summary": f"{PROFILES_URL}/{summary_name}",
+        }
+
+    def list(self):
+        """The captured profiles, newest first."""
+        try:
+            names = os.listdir(self.profiles_dir)
+        except OSError:
+            return []
+        stems = sorted((n[: -len(".txt")] for n in names if n.endswith(".txt")), reverse=True)
+        return [
+            {
+                "name": stem,
+                "trace": f"{PROFILES_URL}/{stem}.trace.json",
+                "summary": f"{PROFILES_URL}/{stem}.txt",
+            }
+            for stem in stems
+        ]
+
+    def _prune(self):
+        for profile in self.list()[MAX_PROFILES:]:
+            for suffix in (".trace.json", ".txt"):
+                try:
+                    os.remove(os.path.join(self.profiles_dir, profile["name"] + suffix))
+                except OSError:
+                    pass
+
+
+profiler = Profiler()
@@ -0,0 +1,102 @@
+# core/result_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from core.gallery import gallery_index, OUTPUTS_DIR
+from core.image_writer import image_writer
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# Bump when the meaning of the hashed parameters changes, invalidating old hashes.
+PARAM_HASH_VERSION = 1
+
+
+def param_hash(params):
+    """
+    Canonical SHA-256 of a generation's parameters: key order, int/float
+    spelling and tuple/list differences do not change the hash.
+    """
+
+    def canonical(value):
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, (list, tuple)):
+            return [canonical(v) for v in value]
+        if isinstance(value, dict):
+            return {k: canonical(v) for k, v in value.items()}
+        return value
+
+    payload = json.dumps(
+        {"v": PARAM_HASH_VERSION, **canonical(params)},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Maps parameter hashes to the output image they produced. Hashes are
+    embedded in the images' metadata and indexed by the gallery, so the cache
+    is rebuilt from the outputs folder after a restart; images still being
+    written are tracked in memory until the gallery indexes them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Returns the filename of an existing output for `key`, or None."""
+        with self._lock:
+            filename = self._recent.get(key)
+        if filename is None:
+            filename = gallery_index.find_by_hash(key)
+        if filename is not None and not self._exists(filename):
+            # Deleted since; forget it and regenerate.
+            gallery_index.remove(filename)
+            with self._lock:
+                self._recent.pop(key, None)
+            filename = None
+        with self._lock:
+            if filename is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return filename
+
+    def record(self, key, filename):
+        """Remembers an output that is being written."""
+        with self._lock:
+            self._recent[key] = filename
+
+    def forget_written(self, filename):
+        """Called once the gallery has indexed `filename` with its hash."""
+        with self._lock:
+            for key in [k for k, f in self._recent.items() if f == filename]:
+                del self._recent[key]
+
+    @staticmethod
+    def _exists(filename):
+        return image_writer.pending(filename) is not None or os.path.exists(
+            os.path.join(OUTPUTS_DIR, filename)
+        )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache()
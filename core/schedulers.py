@@ -0,0 +1,68 @@
+# core/schedulers.py
+import logging
+
+from diffusers import (
+    EulerAncestralDiscreteScheduler,
+    EulerDiscreteScheduler,
+    LMSDiscreteScheduler,
+    DPMSolverMultistepScheduler,
+    DDIMScheduler,
+    UniPCMultistepScheduler,
+)
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+SCHEDULER_MAP = {
+    "Euler A": EulerAncestralDiscreteScheduler,
+    "DPM++ 2M": DPMSolverMultistepScheduler,
+    "DDIM": DDIMScheduler,
+    "UniPC": UniPCMultistepScheduler,
+    "Euler": EulerDiscreteScheduler,
+    "LMS": LMSDiscreteScheduler,
+}
+
+# Step counts at which each sampler typically converges on SD-family models.
+# Multistep solvers (DPM++ 2M, UniPC) get there in far fewer steps.
+RECOMMENDED_STEPS = {
+    "Euler A": 30,
+    "DPM++ 2M": 20,
+    "DDIM": 40,
+    "UniPC": 16,
+    "Euler": 30,
+    "LMS": 40,
+}
+
+
+def recommended_steps(scheduler_name=None, pipe=None):
+    """
+    Suggested step count for a sampler. Pipelines with their own flow-matching
+    scheduler (SD3, FLUX) use the pipeline's `default_steps` instead.
+    """
+    if pipe is not None and not pipe.scheduler_swappable:
+        return pipe.default_steps
+    return RECOMMENDED_STEPS.get(scheduler_name, 30)
+
+
+def use_scheduler(pipe, scheduler_name):
+    """
+    Makes `scheduler_name` the active sampler of `pipe`. Instances are built
+    once per pipeline from the scheduler config the model was loaded with and
+    reused afterwards, so switching is only an attribute assignment.
+    Returns the name in effect, or None if the pipeline keeps its own scheduler.
+    """
+    if not pipe.scheduler_swappable:
+        return None
+    if scheduler_name not in SCHEDULER_MAP:
+        raise ValueError(f"Unknown sampler: {scheduler_name}")
+
+    if pipe.base_scheduler_config is None:
+        pipe.base_scheduler_config = pipe.pipe.scheduler.config
+    scheduler = pipe.schedulers.get(scheduler_name)
+    if scheduler is None:
+        scheduler = SCHEDULER_MAP[scheduler_name].from_config(pipe.base_scheduler_config)
+        pipe.schedulers[scheduler_name] = scheduler
+    if pipe.pipe.scheduler is not scheduler:
+        logger.info(f"Setting scheduler to: {scheduler_name}")
+        pipe.pipe.scheduler = scheduler
+    return scheduler_name
@@ -0,0 +1,74 @@
+# core/settings.py
+import logging
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# --- Runtime Settings ---
+# Defaults for the tunables of the core subsystems. `app.py` overrides these
+# from the command line before any UI is launched.
+settings = {
+    # Maximum number of jobs waiting in the generation queue.
+    "queue_size": 16,
+    # Maximum progress events per second delivered for each job.
+    "progress_rate": 10,
+    # Pipeline cache: VRAM/RAM budgets in GB (None = auto) and max resident pipelines.
+    "vram_budget_gb": None,
+    "ram_budget_gb": None,
+    "max_cached_pipelines": 3,
+    # Output image encoding: "png", "webp" or "jpeg", plus per-format levels.
+    "output_format": "png",
+    "png_compress_level": 6,
+    "jpeg_quality": 95,
+    "webp_quality": 90,
+    "webp_lossless": False,
+    # Live latent previews: every N sampling steps (0 = off), capped at this
+    # fraction of the measured step time.
+    "preview_interval": 4,
+    "preview_max_overhead": 0.03,
+    # LoRA hot-swap: host cache size for parsed LoRA files and the maximum
+    # number of adapters kept attached to one pipeline.
+    "lora_cache_mb": 2048,
+    "max_attached_loras": 4,
+    # Diffusers-format copies of single-file checkpoints for faster loads,
+    # and the disk budget in GB for them (None = unlimited).
+    "conversion_cache": True,
+    "conversion_cache_gb": 40,
+    # "lazy" loads diffusers-layout models one component at a time straight
+    # onto the device; "eager" builds the whole pipeline in host RAM first.
+    "load_mode": "lazy",
+    # Run a short dummy generation after each load so the first real one is fast.
+    "warmup": True,
+    # Snap requested sizes to the nearest canonical resolution bucket.
+    "snap_resolutions": False,
+    # Cross-request batching: queued generations with the same model, size,
+    # steps, sampler, guidance and LoRAs run together, up to this many at once,
+    # waiting at most this long for compatible requests to arrive.
+    "max_batch_size": 4,
+    "batch_window_ms": 50,
+    # Memory for cached prompt embeddings, kept on the device that made them.
+    "embedding_cache_mb": 256,
+    # Return the existing output for requests with identical parameters.
+    "result_cache": True,
+    # Device backend: "auto", "xpu", "cpu" or any other torch device type,
+    # and the CPU backend's thread count (None = one per physical core).
+    "device": "auto",
+    "cpu_threads": None,
+    # Worker processes for the web server: a count or a list such as
+    # "xpu:0,xpu:1" or "cpu:0-15,cpu:16-31" (None = run in this process).
+    "workers": None,
+    # Port of the /metrics side server in Gradio mode (None = UI port + 1).
+    "metrics_port": None,
+    # Capture a torch.profiler trace of 1 in N generations and loads (0 = off).
+    "profile_every": 0,
+}
+
+
+def update_settings(**overrides):
+    """Applies overrides to the runtime settings, ignoring unset (None) values."""
+    for key, value in overrides.items():
+        if key not in settings:
+            raise KeyError(f"Unknown setting: {key}")
+        if value is not None:
+            settings[key] = value
+    return settings
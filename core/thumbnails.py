@@ -0,0 +1,180 @@
+# core/thumbnails.py
+import glob
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PIL import Image, features
+
+from core.gallery import OUTPUTS_DIR, IMAGE_EXTENSIONS
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+THUMBNAILS_DIR = os.path.join("./cache", "thumbnails")
+THUMBNAIL_SIZES = (256, 512)
+# WebP is much smaller at equal quality; fall back to JPEG if Pillow lacks it.
+THUMBNAIL_FORMAT, THUMBNAIL_EXT = (
+    ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+)
+THUMBNAIL_QUALITY = 80
+
+
+class ThumbnailService:
+    """
+    Writes small previews of generated images to a cache directory on a
+    background pool, so galleries never have to download full-size originals.
+    """
+
+    def __init__(
+        self,
+        outputs_dir=OUTPUTS_DIR,
+        cache_dir=THUMBNAILS_DIR,
+        sizes=THUMBNAIL_SIZES,
+        max_workers=2,
+    ):
+        self.outputs_dir = outputs_dir
+        self.cache_dir = cache_dir
+        self.sizes = tuple(sorted(sizes, reverse=True))
+        self.max_workers = max_workers
+        self._executor = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="arttic-thumbs"
+            )
+        return self._executor
+
+    # --- Paths ---
+    def path_for(self, filename, size):
+        """
+        Thumbnail path of the current version of an output. The name keeps the
+        original's extension and adds its mtime and size, so `a.png` and
+        `a.jpg`, or an image regenerated under the same name, never collide.
+        Raises OSError if the original does not exist.
+        """
+        stat = os.stat(os.path.join(self.outputs_dir, filename))
+        version = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        return os.path.join(self.cache_dir, str(size), f"{filename}.{version}{THUMBNAIL_EXT}")
+
+    def _versions(self, filename, size):
+        """Thumbnails of every version of an output at one size."""
+        pattern = f"{glob.escape(filename)}.*{THUMBNAIL_EXT}"
+        return glob.glob(os.path.join(self.cache_dir, str(size), pattern))
+
+    def is_fresh(self, filename, size):
+        """True if a thumbnail of the original's current version exists."""
+        try:
+            return os.path.exists(self.path_for(filename, size))
+        except OSError:
+            return False
+
+    # --- Rendering ---
+    def render(self, filename):
+        """Writes every thumbnail size for one image. Runs on the pool."""
+        source = os.path.join(self.outputs_dir, filename)
+        with Image.open(source) as original:
+            image = original.convert("RGB")
+        # Downscale from the largest size to the smallest, reusing each result.
+        for size in self.sizes:
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            target = self.path_for(filename, size)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.tmp"
+            image.save(tmp_path, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+            os.replace(tmp_path, target)
+            for outdated in self._versions(filename, size):
+                if outdated != target:
+                    os.remove(outdated)
+
+    def schedule(self, filename):
+        """Queues thumbnail generation for an image; returns its Future."""
+        with self._lock:
+            future = self._inflight.get(filename)
+            if future is not None:
+                return future
+            future = self._pool().submit(self._render_logged, filename)
+            self._inflight[filename] = future
+        future.add_done_callback(lambda _: self._forget(filename))
+        return future
+
+    def ensure(self, filename, size):
+        """Returns the thumbnail path, rendering it now if it is missing or stale."""
+        if not self.is_fresh(filename, size):
+            self.schedule(filename).result()
+        return self.path_for(filename, size)
+
+    def path_or_original(self, filename, size):
+        """Thumbnail path if ready; otherwise schedules it and returns the original."""
+        if self.is_fresh(filename, size):
+            return self.path_for(filename, size)
+        self.schedule(filename)
+        return os.path.join(self.outputs_dir, filename)
+
+    # --- Invalidation & Backfill ---
+    def invalidate(self, filename):
+        """Deletes all cached thumbnails of an image, e.g. after it was deleted."""
+        for size in self.sizes:
+            for path in self._versions(filename, size):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def backfill(self, prune=True):
+        """
+        Renders thumbnails for every output that lacks a fresh one and, with
+        `prune`, removes thumbnails whose original no longer exists.
+        """
+        os.makedirs(self.outputs_dir, exist_ok=True)
+        originals = [
+            name
+            for name in os.listdir(self.outputs_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        stale = [
+            name
+            for name in originals
+            if not all(self.is_fresh(name, size) for size in self.sizes)
+        ]
+        logger.info(f"Backfilling thumbnails for {len(stale)} of {len(originals)} images...")
+        wait([self.schedule(name) for name in stale])
+
+        pruned = 0
+        if prune:
+            for size in self.sizes:
+                size_dir = os.path.join(self.cache_dir, str(size))
+                if not os.path.isdir(size_dir):
+                    continue
+                current = set()
+                for name in originals:
+                    try:
+                        current.add(os.path.basename(self.path_for(name, size)))
+                    except OSError:
+                        pass
+                # Thumbnails of deleted originals, of older versions and in the old naming.
+                for thumb in os.listdir(size_dir):
+                    if thumb not in current and not thumb.endswith(".tmp"):
+                        os.remove(os.path.join(size_dir, thumb))
+                        pruned += 1
+        logger.info(f"Thumbnail backfill done: {len(stale)} rendered, {pruned} pruned.")
+        return {"rendered": len(stale), "pruned": pruned}
+
+    # --- Internals ---
+    def _render_logged(self, filename):
+        try:
+            self.render(filename)
+        except Exception as e:
+            logger.warning(f"Could not create thumbnail for '{filename}': {e}")
+            raise
+
+    def _forget(self, filename):
+        with self._lock:
+            self._inflight.pop(filename, None)
+
+
+thumbnail_service = ThumbnailService()
@@ -0,0 +1,112 @@
+# core/warmup.py
+import json
+import logging
+import os
+import threading
+import time
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+KERNEL_CACHE_DIR = os.path.join("./cache", "kernels")
+WARM_SHAPES_PATH = os.path.join(KERNEL_CACHE_DIR, "warm_shapes.json")
+# Shapes warmed after a load: the default resolution plus the most recent ones used.
+MAX_WARMUP_SHAPES = 3
+WARMUP_STEPS = 2
+
+
+def configure_kernel_cache(cache_dir=KERNEL_CACHE_DIR):
+    """
+    Makes the SYCL runtime persist JIT-compiled kernels on disk. Must run before
+    torch / IPEX initialize the XPU; explicit environment settings win.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("SYCL_CACHE_PERSISTENT", "1")
+    os.environ.setdefault("SYCL_CACHE_DIR", os.path.abspath(cache_dir))
+
+
+class WarmShapes:
+    """
+    Manifest of the (model, dtype, width x height) combinations whose kernels
+    have been compiled into the persistent cache. Used to pick warmup shapes
+    after a restart and to tell whether a warmup should be cheap.
+    """
+
+    def __init__(self, path=WARM_SHAPES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    @staticmethod
+    def _key(model_key, dtype):
+        return f"{model_key}|{str(dtype).replace('torch.', '')}"
+
+    def shapes(self, model_key, dtype):
+        """Known shapes for a model, most recently used first."""
+        with self._lock:
+            entries = self._load().get(self._key(model_key, dtype), {})
+            ordered = sorted(entries.items(), key=lambda item: item[1], reverse=True)
+            return [tuple(int(v) for v in shape.split("x")) for shape, _ in ordered]
+
+    def contains(self, model_key, dtype, width, height):
+        with self._lock:
+            return f"{width}x{height}" in self._load().get(self._key(model_key, dtype), {})
+
+    def record(self, model_key, dtype, width, height):
+        with self._lock:
+            data = self._load()
+            data.setdefault(self._key(model_key, dtype), {})[f"{width}x{height}"] = time.time()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+
+warm_shapes = WarmShapes()
+
+
+def warm_up(pipe, model_key, default_shape, progress=None):
+    """
+    Runs short dummy generations on `pipe` for its default shape and the shapes
+    recently used with this model, so kernels are compiled and allocator pools
+    are primed before the first real request. Returns the warmup report.
+    """
+    shapes = [default_shape]
+    for shape in warm_shapes.shapes(model_key, pipe.dtype):
+        if shape not in shapes and len(shapes) < MAX_WARMUP_SHAPES:
+            shapes.append(shape)
+
+    report = {"seconds": 0.0, "shapes": []}
+    for i, (width, height) in enumerate(shapes):
+        if (width, height) in pipe.warm_shapes:
+            continue
+        cached = warm_shapes.contains(model_key, pipe.dtype, width, height)
+        if progress:
+            progress(
+                0.9 + 0.1 * i / len(shapes),
+                f"Warming up {width}x{height}{' (cached kernels)' if cached else ''}...",
+            )
+        start = time.perf_counter()
+        pipe.warmup(width, height, steps=WARMUP_STEPS)
+        seconds = time.perf_counter() - start
+        pipe.warm_shapes.add((width, height))
+        warm_shapes.record(model_key, pipe.dtype, width, height)
+        report["seconds"] += seconds
+        report["shapes"].append(
+            {"width": width, "height": height, "seconds": seconds, "kernel_cache": cached}
+        )
+        logger.info(
+            f"Warmed up {width}x{height} in {seconds:.1f}s"
+            f"{' using cached kernels' if cached else ''}."
+        )
+    return report
@@ -0,0 +1,636 @@
+# core/worker_pool.py
+import asyncio
+import atexit
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+from core.events import event_bus
+from core.jobs import FINISHED_JOBS_HISTORY, Job, QueueFullError
+from core.metrics import metrics
+from core.settings import settings, update_settings
+
+APP_LOGGER_NAME = "arttic_lab"
+logger = logging.getLogger(APP_LOGGER_NAME)
+
+# Dispatch cost of a worker besides its queue length: how much a model load
+# weighs against waiting behind one job there.
+AFFINITY_COST = {"current": 0.0, "resident": 0.5, "cold": 3.0}
+WORKER_START_TIMEOUT = 300
+# Actions that do not depend on which model a worker has loaded.
+BROADCAST_ACTIONS = ("unload_model",)
+
+
+# --- Worker Specs ---
+class WorkerSpec:
+    """Where one worker process runs: a device such as "xpu:1", or a set of CPU cores."""
+
+    def __init__(self, device, index=None, cores=None):
+        self.device = device
+        self.index = index
+        self.cores = cores
+
+    def environment(self):
+        """
+        Variables the worker must see before torch initializes: the runtime then
+        exposes just its device, as index 0.
+        """
+        if self.index is None:
+            return {}
+        if self.device == "xpu":
+            return {"ZE_AFFINITY_MASK": str(self.index)}
+        if self.device == "cuda":
+            return {"CUDA_VISIBLE_DEVICES": str(self.index)}
+        return {}
+
+    def apply(self):
+        """Pins the calling process to the spec's CPU cores, if any."""
+        if self.cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cores)
+
+    def setting_overrides(self):
+        overrides = {"device": self.device}
+        if self.cores:
+            overrides["cpu_threads"] = len(self.cores)
+        return overrides
+
+    def __repr__(self):
+        if self.cores:
+            return f"cpu[{min(self.cores)}-{max(self.cores)}]"
+        return self.device if self.index is None else f"{self.device}:{self.index}"
+
+
+def _parse_cores(text):
+    cores = set()
+    for part in text.split("+"):
+        first, _, last = part.partition("-")
+        cores.update(range(int(first), int(last or first) + 1))
+    return cores
+
+
+def _device_count(device):
+    import torch
+
+    module = getattr(torch, device, None)
+    try:
+        return module.device_count() if module is not None and module.is_available() else 0
+    except Exception:
+        return 0
+
+
+def parse_worker_specs(value):
+    """
+    Parses `settings["workers"]`: a number of workers, or a comma separated
+    list of "xpu:0", "cuda:1" or "cpu:0-15" (cores, "+" joins ranges). A bare
+    number uses one GPU each when enough are present and otherwise splits the
+    CPU cores evenly.
+    """
+    value = str(value).strip()
+    if value.isdigit():
+        count = int(value)
+        if count < 1:
+            raise ValueError("The worker count must be at least 1.")
+        for device in ("xpu", "cuda"):
+            if settings["device"] in ("auto", device) and _device_count(device) >= count:
+                return [WorkerSpec(device, index=i) for i in range(count)]
+        try:
+            available = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            available = list(range(os.cpu_count() or 1))
+        if len(available) < count:
+            raise ValueError(f"Cannot split {len(available)} CPU cores into {count} workers.")
+        share = len(available) // count
+        return [
+            WorkerSpec("cpu", cores=set(available[i * share : (i + 1) * share]))
+            for i in range(count)
+        ]
+
+    specs = []
+    for item in value.split(","):
+        device, _, detail = item.strip().partition(":")
+        if device == "cpu":
+            specs.append(WorkerSpec("cpu", cores=_parse_cores(detail) if detail else None))
+        elif detail:
+            specs.append(WorkerSpec(device, index=int(detail)))
+        else:
+            specs.append(WorkerSpec(device))
+    return specs
+
+
+# --- Image Transport ---
+def _export_image(image):
+    """Copies a PIL image into a new shared memory block; returns its descriptor."""
+    data = image.tobytes()
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[: len(data)] = data
+    descriptor = {"shm": block.name, "mode": image.mode, "size": image.size, "bytes": len(data)}
+    # The parent unlinks the block once it has read the image.
+    block.close()
+    return descriptor
+
+
+def _discard_image(descriptor):
+    """Unlinks the shared memory block of an image nobody will read."""
+    try:
+        block = shared_memory.SharedMemory(name=descriptor["shm"])
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _import_image(descriptor):
+    from PIL import Image
+
+    block = shared_memory.SharedMemory(name=descriptor["shm"])
+    try:
+        with block.buf[: descriptor["bytes"]] as view:
+            return Image.frombytes(descriptor["mode"], tuple(descriptor["size"]), view)
+    finally:
+        block.close()
+        block.unlink()
+
+
+# --- Worker Process ---
+def _worker_main(index, spec, settings_snapshot, tasks, events):
+    """
+    Entry point of a worker process. Runs its own `core.logic` with its own
+    job queue, so batching and coalescing work per worker. Tasks are
+    `("run", job_id, action, kwargs, load_args)`, `("cancel", job_id)` or
+    None to stop; every reply is `(kind, index, job_id, data)`.
+    """
+    spec.apply()
+    from core.warmup import configure_kernel_cache
+
+    configure_kernel_cache()
+    from helpers.cli_manager import setup_logging
+
+    setup_logging()
+    update_settings(**{**settings_snapshot, **spec.setting_overrides()})
+
+    from core import logic as core
+    from core.jobs import job_queue
+    from core.pipeline_cache import pipeline_cache
+
+    actions = {
+        "load_model": core.load_model,
+        "generate_image": core.generate_image,
+        "unload_model": core.unload_model,
+    }
+    # Internal load jobs report under the job that needed them.
+    owner = {}
+
+    def forward_event(event):
+        if event.kind in ("progress", "preview"):
+            events.put((event.kind, index, owner.get(event.job_id, event.job_id), event.data))
+
+    event_bus.subscribe(forward_event)
+
+    def resident_models():
+        return [entry["model"] for entry in pipeline_cache.stats()["entries"]]
+
+    # Load settings of the model the last queued job will run on.
+    state = {"load_args": None}
+
+    def on_done(job_id, action, load_args):
+        def callback(future):
+            owner.pop(f"{job_id}-load", None)
+            if future.cancelled():
+                events.put(("cancelled", index, job_id, None))
+                return
+            error = future.exception()
+            if error is not None:
+                if action == "load_model" and state["load_args"] == load_args:
+                    state["load_args"] = None
+                events.put(("error", index, job_id, {"message": str(error)}))
+                return
+            result = future.result()
+            if action == "generate_image" and "image" in result:
+                result = {**result, "image": _export_image(result["image"])}
+            events.put(("done", index, job_id, {"result": result, "resident": resident_models()}))
+
+        return callback
+
+    def submit(job_id, action, kwargs, load_args):
+        on_position = lambda job, position: events.put(("position", index, job_id, position))
+        if action == "generate_image" and load_args and load_args != state["load_args"]:
+            load_id = f"{job_id}-load"
+            owner[load_id] = job_id
+            load = job_queue.submit(
+                "load_model",
+                core.load_model,
+                job_id=load_id,
+                progress_callback=event_bus.progress_reporter(load_id),
+                **load_args,
+            )
+            load.future.add_done_callback(on_done(load_id, "load_model", load_args))
+            state["load_args"] = load_args
+        elif action == "load_model":
+            state["load_args"] = load_args
+        elif action == "unload_model":
+            state["load_args"] = None
+
+        extra = {}
+        if action == "generate_image":
+            # The parent writes the image, so the gallery stays in one process.
+            extra = {"save_image": False, "preview_callback": event_bus.preview_reporter(job_id)}
+        job = job_queue.submit(
+            action,
+            actions[action],
+            on_position=on_position,
+            job_id=job_id,
+            progress_callback=event_bus.progress_reporter(job_id),
+            **extra,
+            **kwargs,
+        )
+        job.future.add_done_callback(on_done(job_id, action, load_args))
+
+    events.put(("ready", index, None, {"pid": os.getpid(), "spec": repr(spec)}))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        if task[0] == "cancel":
+            job_queue.cancel(task[1])
+            continue
+        _, job_id, action, kwargs, load_args = task
+        try:
+            submit(job_id, action, kwargs, load_args)
+        except Exception as e:
+            events.put(("error", index, job_id, {"message": str(e)}))
+
+
+# --- Dispatcher ---
+class _Worker:
+    def __init__(self, index, spec, process, tasks):
+        self.index = index
+        self.spec = spec
+        self.process = process
+        self.tasks = tasks
+        self.pid = None
+        self.ready = threading.Event()
+        self.load_args = None
+        self.resident = set()
+        self.in_flight = {}
+
+    def cost(self, load_args):
+        if self.load_args == load_args:
+            affinity = AFFINITY_COST["current"]
+        elif load_args["model_name"] in self.resident:
+            affinity = AFFINITY_COST["resident"]
+        else:
+            affinity = AFFINITY_COST["cold"]
+        return len(self.in_flight) + affinity
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "spec": repr(self.spec),
+            "pid": self.pid,
+            "alive": self.process.is_alive(),
+            "model": self.load_args["model_name"] if self.load_args else None,
+            "resident": sorted(self.resident),
+            "jobs": [job.to_dict() for job in self.in_flight.values()],
+        }
+
+
+class WorkerPool:
+    """
+    Runs jobs on several worker processes, each pinned to a device or a CPU
+    core set and owning its own pipelines. Jobs go to the worker with the
+    lowest cost: its number of unfinished jobs plus a penalty when it does not
+    have the model loaded (model affinity). Each client session remembers its
+    last `load_model`, so a generation can be sent to any worker, which loads
+    the session's model first when needed. Progress and previews come back
+    over a queue and are republished on the local event bus; images come back
+    through shared memory and are written by this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = []
+        self._sessions = {}
+        self._jobs = OrderedDict()
+        self._events = None
+        self._listener = None
+        self._stopping = threading.Event()
+
+    @property
+    def enabled(self):
+        return bool(self._workers)
+
+    # --- Lifecycle ---
+    def start(self, specs):
+        """Spawns one worker per spec and waits until all of them are ready."""
+        if self._workers:
+            return
+        context = mp.get_context("spawn")
+        self._events = context.Queue()
+        snapshot = dict(settings)
+        for index, spec in enumerate(specs):
+            tasks = context.Queue()
+            process = context.Process(
+                target=_worker_main,
+                args=(index, spec, snapshot, tasks, self._events),
+                name=f"arttic-worker-{index}",
+                daemon=True,
+            )
+            # Device visibility is read when torch initializes, which happens
+            # while the child imports its main module; set it before spawning.
+            environment = spec.environment()
+            saved = {key: os.environ.get(key) for key in environment}
+            os.environ.update(environment)
+            try:
+                process.start()
+            finally:
+                for key, value in saved.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+            self._workers.append(_Worker(index, spec, process, tasks))
+
+        # Replaces the in-process queue depth; timings of the workers stay in them.
+        metrics.gauge(
+            "queue_depth",
+            "Unfinished jobs on the worker processes.",
+            lambda: sum(len(w.in_flight) for w in self._workers),
+        )
+        metrics.gauge(
+            "workers_alive",
+            "Worker processes that are running.",
+            lambda: sum(w.process.is_alive() for w in self._workers),
+        )
+        self._listener = threading.Thread(
+            target=self._listen, name="arttic-worker-pool", daemon=True
+        )
+        self._listener.start()
+        # Also on Ctrl+C: stop the workers and free images still in shared memory.
+        atexit.register(self.shutdown)
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        for worker in self._workers:
+            if not worker.ready.wait(max(deadline - time.monotonic(), 0)):
+                raise RuntimeError(f"Worker {worker.index} ({worker.spec!r}) did not start.")
+        logger.info(
+            f"Worker pool ready: {', '.join(repr(w.spec) for w in self._workers)}."
+        )
+
+    def shutdown(self):
+        """
+        Stops the worker processes and unlinks the shared memory of images
+        they sent that were never read. Safe to call more than once.
+        """
+        if not self._workers or self._stopping.is_set():
+            return
+        self._stopping.set()
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._listener.join(timeout=5)
+
+        discarded = 0
+        while True:
+            try:
+                kind, _, _, data = self._events.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                break
+            image = data["result"].get("image") if kind == "done" else None
+            if image is not None:
+                _discard_image(image)
+                discarded += 1
+        if discarded:
+            logger.info(f"Freed {discarded} unread image(s) in shared memory.")
+        logger.info("Worker pool stopped.")
+
+    # --- Submission ---
+    def submit(self, kind, on_position=None, job_id=None, session=None, **kwargs):
+        """
+        Dispatches an action ("load_model", "generate_image", "unload_model")
+        and returns its Job. `session` identifies the client whose loaded model
+        a generation uses.
+        """
+        # Callbacks cannot cross the process boundary; events arrive on the bus instead.
+        kwargs.pop("progress_callback", None)
+        kwargs.pop("preview_callback", None)
+        job = Job(kind, None, (), kwargs, on_position=on_position, job_id=job_id)
+
+        if kind in BROADCAST_ACTIONS:
+            return self._broadcast(job, kwargs, session)
+
+        with self._lock:
+            if kind == "load_model":
+                load_args = kwargs
+                self._sessions[session] = load_args
+            else:
+                load_args = self._sessions.get(session)
+                if load_args is None:
+                    raise ConnectionAbortedError("Cannot generate, no model is loaded.")
+            queued = sum(len(w.in_flight) for w in self._workers)
+            if queued >= settings["queue_size"] * len(self._workers):
+                raise QueueFullError(
+                    f"The generation queue is full ({queued} jobs). Try again shortly."
+                )
+            workers = [w for w in self._workers if w.process.is_alive()]
+            if not workers:
+                raise RuntimeError("No worker process is running.")
+            worker = min(workers, key=lambda w: w.cost(load_args))
+            worker.load_args = load_args
+            worker.in_flight[job.id] = job
+            self._remember(job)
+
+        logger.info(f"Dispatching {kind} job {job.id[:8]} to worker {worker.index}.")
+        worker.tasks.put(("run", job.id, kind, kwargs, load_args))
+        return job
+
+    async def run(self, kind, on_position=None, job_id=None, session=None, **kwargs):
+        """Async bridge: submits a job and awaits its result without blocking the loop."""
+        job = self.submit(kind, on_position=on_position, job_id=job_id, session=session, **kwargs)
+        return await asyncio.wrap_future(job.future)
+
+    def _broadcast(self, job, kwargs, session):
+        """
+        Runs `job` on every live worker; it resolves with the first result.
+        Only `session` forgets its model: other sessions keep theirs, and the
+        workers load it again before their next generation.
+        """
+        with self._lock:
+            self._sessions.pop(session, None)
+            workers = [w for w in self._workers if w.process.is_alive()]
+            parts = []
+            for worker in workers:
+                # Worker job ids are per worker, so each part can report under the job's id.
+                part = Job(job.kind, None, (), kwargs, job_id=job.id)
+                worker.load_args = None
+                worker.in_flight[part.id] = part
+                parts.append(part)
+            self._remember(job)
+
+        def settle(_):
+            if all(part.future.done() for part in parts) and not job.future.done():
+                job.status = "done"
+                job.finished_at = time.time()
+                for part in parts:
+                    if part.future.exception() is not None:
+                        job.status = "failed"
+                        job.future.set_exception(part.future.exception())
+                        return
+                job.future.set_result(parts[0].future.result() if parts else {})
+
+        job.status = "running"
+        job.started_at = time.time()
+        for worker, part in zip(workers, parts):
+            part.future.add_done_callback(settle)
+            worker.tasks.put(("run", part.id, job.kind, kwargs, None))
+        if not parts:
+            settle(None)
+        return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            workers = [w for w in self._workers if job_id in w.in_flight]
+        for worker in workers:
+            worker.tasks.put(("cancel", job_id))
+        return bool(workers)
+
+    def end_session(self, session):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    # --- Introspection ---
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers": [worker.to_dict() for worker in self._workers],
+                "sessions": len(self._sessions),
+                "max_size": settings["queue_size"] * len(self._workers),
+            }
+
+    # --- Replies ---
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                kind, index, job_id, data = self._events.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            else:
+                try:
+                    self._handle(self._workers[index], kind, job_id, data)
+                except Exception as e:
+                    logger.error(f"Worker pool failed to handle '{kind}': {e}", exc_info=True)
+            self._reap()
+
+    def _handle(self, worker, kind, job_id, data):
+        if kind == "ready":
+            worker.pid = data["pid"]
+            worker.ready.set()
+            logger.info(f"Worker {worker.index} ({data['spec']}) started, pid {worker.pid}.")
+            return
+        if kind in ("progress", "preview"):
+            event_bus.publish(job_id, kind, data, final=kind == "progress" and data["progress"] >= 1)
+            return
+
+        with self._lock:
+            job = worker.in_flight.get(job_id)
+        if job is None:
+            return  # An internal load job; its outcome shows in the job that needed it.
+        if kind == "position":
+            if data == 0:
+                job.status = "running"
+                job.started_at = time.time()
+            self._report_position(job, data)
+            return
+
+        with self._lock:
+            worker.in_flight.pop(job_id, None)
+        job.finished_at = time.time()
+        event_bus.finish(job_id)
+        if kind == "cancelled":
+            job.status = "cancelled"
+            job.future.cancel()
+        elif kind == "error":
+            job.status = "failed"
+            job.error = data["message"]
+            job.future.set_exception(RuntimeError(data["message"]))
+        else:
+            worker.resident = set(data["resident"])
+            result = data["result"]
+            if job.kind == "generate_image" and "image" in result:
+                result = self._save(worker, job, result)
+            job.status = "done"
+            job.future.set_result(result)
+
+    @staticmethod
+    def _save(worker, job, result):
+        """Reads a generated image out of shared memory and writes it here."""
+        from core import logic as core
+
+        image = _import_image(result["image"])
+        result = {key: value for key, value in result.items() if key != "image"}
+        if job.kwargs.get("return_image"):
+            result["image"] = image
+        if result.get("cached") or result.get("coalesced"):
+            return result  # Already written under this filename.
+        filename = result["image_filename"]
+        if core.image_writer.pending(filename) is not None or os.path.exists(
+            os.path.join(core.OUTPUTS_DIR, filename)
+        ):
+            # Two workers finished the same seed on the same model in the same second.
+            stem, extension = os.path.splitext(filename)
+            filename = f"{stem}_w{worker.index}{extension}"
+            result["image_filename"] = filename
+        core.save_output(image, filename, result.get("param_hash"))
+        return result
+
+    def _reap(self):
+        """Fails the jobs of workers that died."""
+        for worker in self._workers:
+            if worker.process.is_alive() or not worker.in_flight:
+                continue
+            with self._lock:
+                jobs = list(worker.in_flight.values())
+                worker.in_flight.clear()
+                worker.load_args = None
+                worker.resident = set()
+            message = f"Worker {worker.index} exited with code {worker.process.exitcode}."
+            logger.error(message)
+            for job in jobs:
+                job.status = "failed"
+                job.error = message
+                job.finished_at = time.time()
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError(message))
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > FINISHED_JOBS_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+
+    @staticmethod
+    def _report_position(job, position):
+        if job.on_position is None:
+            return
+        try:
+            job.on_position(job, position)
+        except Exception as e:
+            logger.warning(f"Queue position callback failed for job {job.id[:8]}: {e}")
+
+
+worker_pool = WorkerPool()
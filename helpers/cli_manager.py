@@ -1,6 +1,7 @@
 # helpers/cli_manager.py
 import logging
 import sys
+import time
 
 APP_LOGGER_NAME = "arttic_lab"
 APP_VERSION = "2.0.0"  # Version bump for new UI
@@ -31,10 +32,34 @@ class CustomFormatter(logging.Formatter):
         return formatter.format(record)
 
 
+class ProgressLogger:
+    """Event-bus subscriber that mirrors job progress to the terminal."""
+
+    def __init__(self, interval=2.0):
+        # Terminal output is much calmer than the UI: one line per `interval` seconds.
+        self.interval = interval
+        self._last_logged = {}
+
+    def __call__(self, event):
+        if event.kind != "progress":
+            return
+        now = time.monotonic()
+        if not event.final and now - self._last_logged.get(event.job_id, 0.0) < self.interval:
+            return
+        if event.final:
+            self._last_logged.pop(event.job_id, None)
+        else:
+            self._last_logged[event.job_id] = now
+        percent = int(event.data["progress"] * 100)
+        logging.getLogger(APP_LOGGER_NAME).info(
+            f"  [{event.job_id[:8]}] {percent:3d}% {event.data['description']}"
+        )
+
+
 def log_system_info():
     import torch
-    import intel_extension_for_pytorch as ipex
     import diffusers
+    from pipelines.devices import ipex, get_backend
 
     logger = logging.getLogger(APP_LOGGER_NAME)
 
@@ -59,17 +84,26 @@ def log_system_info():
         f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
     )
     logger.info(
-        f"  Python: {py_version}, Torch: {torch.__version__}, IPEX: {ipex.__version__}, Diffusers: {diffusers.__version__}"
+        f"  Python: {py_version}, Torch: {torch.__version__}, "
+        f"IPEX: {ipex.__version__ if ipex is not None else 'not installed'}, "
+        f"Diffusers: {diffusers.__version__}"
     )
 
-    if torch.xpu.is_available():
+    if hasattr(torch, "xpu") and torch.xpu.is_available():
         gpu_name = torch.xpu.get_device_name(0)
         # GPU name now uses the bright cyan color
         logger.info(
             f"  Intel GPU: {CustomFormatter.CYAN_BRIGHT}{gpu_name}{CustomFormatter.RESET} (Detected)"
         )
     else:
-        logger.error("  Intel GPU: Not Detected! The application may not work.")
+        logger.warning("  Intel GPU: Not Detected.")
+    try:
+        backend = get_backend()
+        logger.info(
+            f"  Device: {CustomFormatter.CYAN_BRIGHT}{backend.describe()}{CustomFormatter.RESET}"
+        )
+    except RuntimeError as e:
+        logger.error(f"  Device: {e} The application may not work.")
 
     logger.info("-" * 60)
 
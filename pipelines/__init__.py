@@ -1,11 +1,12 @@
 # pipelines/__init__.py
 import os
-from safetensors import safe_open
 from .sd15_pipeline import SD15Pipeline
 from .sd2_pipeline import SD2Pipeline
 from .sdxl_pipeline import SDXLPipeline
 from .sd3_pipeline import SD3Pipeline
 from .flux_pipeline import ArtTicFLUXPipeline
+from .model_index import model_index
+from .conversion_cache import conversion_cache
 import logging
 
 logger = logging.getLogger("arttic_lab")
@@ -13,22 +14,9 @@ logger = logging.getLogger("arttic_lab")
 MODELS_DIR = "./models"
 
 
-def _is_xl(keys):
-    """Checks for the second text encoder unique to SDXL."""
-    return any(k.startswith("conditioner.embedders.1") for k in keys)
-
-
-def _is_v2(keys):
-    """Checks for a specific transformer block key present in SD 2.x."""
-    return (
-        "model.diffusion_model.input_blocks.8.1.transformer_blocks.0.attn2.to_k.weight"
-        in keys
-    )
-
-
-def _is_sd3(keys):
-    """Checks for the plural 'text_encoders' key, which is unique to SD3."""
-    return any(k.startswith("text_encoders.") for k in keys)
+def describe_model(model_name):
+    """Returns the cached header metadata (architecture, dtype, size, hash) of a model."""
+    return model_index.describe(os.path.join(MODELS_DIR, f"{model_name}.safetensors"))
 
 
 def get_pipeline_for_model(model_name):
@@ -55,23 +43,28 @@ def get_pipeline_for_model(model_name):
             )
             return ArtTicFLUXPipeline(model_path, is_schnell=False)
 
-    # If not a FLUX model by filename, proceed with key-based detection for others.
+    # If not a FLUX model by filename, use the header index (parsed once per file).
     try:
-        with safe_open(model_path, framework="pt", device="cpu") as f:
-            keys = list(f.keys())
+        architecture = model_index.describe(model_path)["architecture"]
     except Exception as e:
         logger.error(
             f"Could not inspect model '{model_name}': {e}. Assuming SD 1.5 as fallback."
         )
         return SD15Pipeline(model_path)
 
-    if _is_sd3(keys):
+    if architecture == "sd3":
         logger.info(f"Model '{model_name}' detected as SD3.")
         return SD3Pipeline(model_path)
-    elif _is_xl(keys):
+    elif architecture in ("flux-dev", "flux-schnell"):
+        is_schnell = architecture == "flux-schnell"
+        logger.info(
+            f"Model '{model_name}' detected as FLUX.1 {'Schnell' if is_schnell else 'DEV'}."
+        )
+        return ArtTicFLUXPipeline(model_path, is_schnell=is_schnell)
+    elif architecture == "sdxl":
         logger.info(f"Model '{model_name}' detected as SDXL.")
         return SDXLPipeline(model_path)
-    elif _is_v2(keys):
+    elif architecture == "sd2":
         logger.info(f"Model '{model_name}' detected as SD 2.x.")
         return SD2Pipeline(model_path)
     else:
@@ -1,38 +1,253 @@
 # pipelines/base_pipeline.py
 import torch
-import intel_extension_for_pytorch as ipex
 import logging
+import os
+import time
+from collections import OrderedDict
+
+from core.settings import settings
+from .component_store import component_store, TEXT_ENCODERS, touches_text_encoders
+from .conversion_cache import conversion_cache
+from .devices import get_backend
+from .embedding_cache import embedding_cache, encoder_token, renew_encoder_token
+from .loading import load_components_lazily
+from .model_index import model_index
 
 logger = logging.getLogger("arttic_lab")
 
 class ArtTicPipeline:
-    def __init__(self, model_path, dtype=torch.bfloat16):
-        if not torch.xpu.is_available():
-            raise RuntimeError("Intel ARC GPU (XPU) not detected.")
+    # Key into core.previews.LATENT_RGB_FACTORS for live previews.
+    latent_format = "sd15"
+    # Key into core.buckets.ASPECT_RATIOS_BY_FAMILY for resolution buckets.
+    bucket_family = "sd15"
+    # Whether samplers from core.schedulers.SCHEDULER_MAP can be swapped in,
+    # and the step count suggested when the pipeline keeps its own scheduler.
+    scheduler_swappable = True
+    default_steps = 30
+    # Whether negative prompts are encoded for classifier-free guidance.
+    uses_negative_prompt = True
+
+    def __init__(self, model_path, dtype=None):
+        # Raises if the requested device is not available.
+        self.backend = get_backend()
         self.pipe = None
         self.model_path = model_path
-        self.dtype = dtype
+        self.dtype = dtype or self.backend.default_dtype
         self.is_optimized = False
         self.is_offloaded = False
+        self.is_parked = False
+        # LoRA name -> PEFT adapter name, least recently used first.
+        self.lora_adapters = OrderedDict()
+        # Adapters that carry the checkpoint itself (SD3/FLUX) and must stay active.
+        self.base_adapters = []
+        self.loras_enabled = True
+        # (name, weight) pairs currently fused into the base weights, if any.
+        self.fused_loras = None
+        # (name, weight) pairs currently active, and the LoRAs that patch text encoders.
+        self.active_loras = ()
+        self.text_encoder_loras = set()
+        # Measured seconds per sampling step: (width, height, batch) -> "fused"/"unfused" -> s.
+        self.step_seconds = {}
+        # Sampler instances by name, built from the scheduler config loaded with the model.
+        self.schedulers = {}
+        self.base_scheduler_config = None
+        # Where lazily loaded components are materialized ("cpu" for CPU offload).
+        self.load_device = self.backend.device
+        # Identity under which this pipeline holds shared components.
+        self.owner_id = f"{os.path.basename(model_path)}@{id(self):x}"
+        # (width, height) shapes already run in this process since the load.
+        self.warm_shapes = set()
+        # VAE slicing and tiling; set on the VAE for each call since it may be shared.
+        self.vae_tiling = False
 
     def load_pipeline(self, progress):
         raise NotImplementedError("Subclasses must implement load_pipeline")
 
+    def _load_pretrained(self, pipeline_class, source, progress, component_hashes=None, **kwargs):
+        """
+        Loads a diffusers-layout folder or repo, component by component straight
+        onto `self.load_device` when `settings["load_mode"]` is "lazy".
+        Components listed in `component_hashes` that are already resident in
+        the component store are reused instead of loaded again.
+        """
+        if not self.shares_components():
+            component_hashes = None
+        shared = {}
+        for name, component_hash in (component_hashes or {}).items():
+            module = component_store.acquire(self._store_key(component_hash), self.owner_id)
+            if module is not None:
+                shared[name] = module
+        if shared:
+            logger.info(f"Reusing resident components: {', '.join(shared)}.")
+
+        try:
+            if settings["load_mode"] == "lazy":
+                self.pipe = load_components_lazily(
+                    pipeline_class,
+                    source,
+                    self.dtype,
+                    self.load_device,
+                    progress,
+                    use_safetensors=True,
+                    **shared,
+                    **kwargs,
+                )
+            else:
+                self.pipe = pipeline_class.from_pretrained(
+                    source, torch_dtype=self.dtype, use_safetensors=True, **shared, **kwargs
+                )
+        except Exception:
+            self.release_components()
+            raise
+        # Components reused above are already acquired; register the fresh ones.
+        self._share_components(
+            {name: h for name, h in (component_hashes or {}).items() if name not in shared}
+        )
+
+    def _load_single_file(self, pipeline_class, progress, desc, **kwargs):
+        """
+        Loads a single-file checkpoint, using the diffusers-format conversion
+        cache when possible and filling it after a fresh conversion.
+        """
+        cache_key = None
+        if settings["conversion_cache"]:
+            model_hash = model_index.describe(self.model_path)["hash"]
+            cache_key = conversion_cache.make_key(model_hash, pipeline_class, self.dtype)
+            cached_dir = conversion_cache.lookup(cache_key)
+            if cached_dir:
+                progress(0.2, desc=f"{desc} (cached conversion)")
+                start = time.perf_counter()
+                self._load_pretrained(
+                    pipeline_class,
+                    cached_dir,
+                    progress,
+                    component_hashes=conversion_cache.component_hashes(cache_key),
+                    **kwargs,
+                )
+                conversion_cache.record_load(cache_key, time.perf_counter() - start)
+                return
+
+        progress(0.2, desc=desc)
+        start = time.perf_counter()
+        self.pipe = pipeline_class.from_single_file(
+            self.model_path, torch_dtype=self.dtype, use_safetensors=True, **kwargs
+        )
+        convert_seconds = time.perf_counter() - start
+        logger.info(f"Converted single-file checkpoint in {convert_seconds:.1f}s.")
+
+        if cache_key:
+            progress(0.4, desc="Caching converted model for faster loads...")
+            try:
+                conversion_cache.store(cache_key, self.pipe, self.model_path, convert_seconds)
+                self._share_components(conversion_cache.component_hashes(cache_key))
+            except Exception as e:
+                logger.warning(f"Could not cache the converted model: {e}")
+
+    # --- Shared components ---
+    def shares_components(self):
+        """
+        Whether this pipeline takes part in the component store. CPU offload
+        installs accelerate hooks on the modules themselves, one set per
+        pipeline, so offloaded pipelines keep their components to themselves.
+        """
+        return self.load_device == self.backend.device
+
+    def _store_key(self, component_hash):
+        return f"{component_hash}-{self.load_device}"
+
+    def _share_components(self, component_hashes):
+        """Registers this pipeline's components in the store, adopting identical resident ones."""
+        if not self.shares_components():
+            return
+        for name, component_hash in component_hashes.items():
+            module = getattr(self.pipe, name, None)
+            if module is None:
+                continue
+            key = self._store_key(component_hash)
+            resident = component_store.acquire(key, self.owner_id)
+            if resident is None:
+                component_store.register(key, module, self.owner_id, name)
+            elif resident is not module:
+                # Drop our freshly loaded duplicate in favour of the resident copy.
+                self.pipe.register_modules(**{name: resident})
+
+    def make_text_encoders_private(self, keys):
+        """Copy-on-write before weights with these keys patch the text encoders."""
+        if not self.pipe or not touches_text_encoders(keys):
+            return
+        for name in TEXT_ENCODERS:
+            module = getattr(self.pipe, name, None)
+            if module is not None:
+                private = component_store.make_private(module, self.owner_id)
+                if private is not module:
+                    self.pipe.register_modules(**{name: private})
+                # Its outputs are about to change; cached embeddings no longer apply.
+                renew_encoder_token(private)
+
+    def release_components(self):
+        """Drops this pipeline's references to shared components."""
+        return component_store.release(self.owner_id)
+
     def place_on_device(self, use_cpu_offload=False):
         if not self.pipe:
             raise RuntimeError("Pipeline must be loaded before placing on device.")
         
-        if use_cpu_offload:
+        if use_cpu_offload and self.backend.supports_offload():
             logger.info("Enabling Model CPU Offload for low VRAM usage.")
-            self.pipe.enable_model_cpu_offload()
+            self.pipe.enable_model_cpu_offload(device=self.backend.device)
             self.is_offloaded = True
         else:
-            logger.info("Moving model to XPU (ARC GPU) for maximum performance.")
-            self.pipe.to("xpu")
+            logger.info(f"Moving model to {self.backend.describe()} for maximum performance.")
+            self.pipe.to(self.backend.device)
             self.is_offloaded = False
 
-    def optimize_with_ipex(self, progress):
-        if self.is_optimized:
+    def park(self):
+        """
+        Moves the pipeline to host RAM so it stays warm without using VRAM.
+        Components shared with other pipelines stay on the device.
+        """
+        if not self.pipe or self.is_offloaded or self.is_parked:
+            return
+        if not self.backend.supports_offload():
+            return  # Already in host RAM.
+        for component in self.pipe.components.values():
+            if isinstance(component, torch.nn.Module) and component_store.refcount(component) <= 1:
+                component.to("cpu")
+        self.is_parked = True
+
+    def unpark(self):
+        """Moves a parked pipeline back onto the device."""
+        if not self.pipe or not self.is_parked:
+            return
+        self.pipe.to(self.backend.device)
+        self.is_parked = False
+
+    def memory_footprint(self):
+        """Returns the size in bytes of all parameters and buffers of the pipeline."""
+        return sum(self.component_footprints().values())
+
+    def component_footprints(self):
+        """
+        Size in bytes of each component module, keyed by `id(module)` so
+        components shared with other pipelines can be counted once.
+        """
+        if not self.pipe:
+            return {}
+        footprints = {}
+        for component in self.pipe.components.values():
+            if isinstance(component, torch.nn.Module):
+                footprints[id(component)] = sum(
+                    tensor.numel() * tensor.element_size()
+                    for tensor in list(component.parameters()) + list(component.buffers())
+                )
+        return footprints
+
+    def optimize_with_ipex(self, progress, force=False):
+        """
+        Prepares the denoiser and VAE for inference on the device backend
+        (IPEX on XPU; IPEX/oneDNN and channels-last on CPU).
+        """
+        if self.is_optimized and not force:
             logger.info("Model is already optimized.")
             return
         if self.is_offloaded:
@@ -40,25 +255,113 @@ class ArtTicPipeline:
             return
         if not self.pipe:
             raise RuntimeError("Pipeline must be loaded before optimization.")
-            
-        progress(0.8, desc="Optimizing model with IPEX...")
-        
-        if hasattr(self.pipe, 'unet'):
-            self.pipe.unet = ipex.optimize(self.pipe.unet.eval(), dtype=self.dtype, inplace=True)
-            logger.info("U-Net optimized with IPEX.")
-        elif hasattr(self.pipe, 'transformer'):
-            self.pipe.transformer = ipex.optimize(self.pipe.transformer.eval(), dtype=self.dtype, inplace=True)
-            logger.info("Transformer optimized with IPEX.")
+
+        progress(0.8, desc=f"Optimizing model for {self.backend.device}...")
+
+        self.optimize_denoiser()
 
         if hasattr(self.pipe, 'vae'):
-            self.pipe.vae = ipex.optimize(self.pipe.vae.eval(), dtype=self.dtype, inplace=True)
-            logger.info("VAE optimized with IPEX.")
-            
+            if getattr(self.pipe.vae, "_arttic_ipex_optimized", False):
+                logger.info("VAE is shared and already optimized.")
+            else:
+                self.pipe.vae = self.backend.optimize(self.pipe.vae, self.dtype)
+                self.pipe.vae._arttic_ipex_optimized = True
+                logger.info("VAE optimized.")
+
         self.is_optimized = True
 
+    def optimize_denoiser(self):
+        """Prepares only the U-Net or transformer, e.g. after its weights changed in place."""
+        if hasattr(self.pipe, 'unet'):
+            self.pipe.unet = self.backend.optimize(self.pipe.unet, self.dtype)
+            logger.info("U-Net optimized.")
+        elif hasattr(self.pipe, 'transformer'):
+            self.pipe.transformer = self.backend.optimize(self.pipe.transformer, self.dtype)
+            logger.info("Transformer optimized.")
+
+    def warmup(self, width, height, steps=2):
+        """
+        Runs a tiny generation (text encoder, denoiser and VAE) at the given
+        shape so kernels are compiled and memory pools are allocated.
+        """
+        if not self.pipe:
+            raise RuntimeError("Pipeline not loaded.")
+        with torch.no_grad():
+            self.generate(
+                prompt="warmup",
+                num_inference_steps=steps,
+                width=width,
+                height=height,
+                output_type="np",
+            )
+        self.backend.synchronize()
+
+    # --- Prompt encoding ---
+    def encode_prompts(self, prompts, negative_prompts=None):
+        """
+        Returns `prompt_embeds` (and pooled / negative) keyword arguments for a
+        batch of prompts, reusing cached embeddings for texts seen before.
+        Pass `negative_prompts` (None entries allowed) when guidance is on.
+        """
+        if not self.pipe:
+            raise RuntimeError("Pipeline not loaded.")
+        positives = [self._cached_embeds(prompt) for prompt in prompts]
+        kwargs = self._concat_embeds(positives)
+        if negative_prompts is not None and self.uses_negative_prompt:
+            negatives = [
+                self._cached_embeds(negative) if negative else self._empty_negative(positive)
+                for negative, positive in zip(negative_prompts, positives)
+            ]
+            kwargs.update(
+                {f"negative_{name}": value for name, value in self._concat_embeds(negatives).items()}
+            )
+        return kwargs
+
+    def _cached_embeds(self, text):
+        encoders = tuple(
+            encoder_token(module)
+            for module in (getattr(self.pipe, name, None) for name in TEXT_ENCODERS)
+            if module is not None
+        )
+        loras = tuple(lora for lora in self.active_loras if lora[0] in self.text_encoder_loras)
+        return embedding_cache.get_or_encode(
+            (encoders, loras, text), lambda: self._encode_text(text)
+        )
+
+    def _encode_text(self, text):
+        with torch.no_grad(), self.backend.autocast(self.dtype):
+            return self._run_text_encoders(text)
+
+    def _run_text_encoders(self, text):
+        """Encodes one prompt; subclasses return every embedding their pipeline takes."""
+        prompt_embeds, _ = self.pipe.encode_prompt(
+            text, self.pipe._execution_device, 1, False
+        )
+        return {"prompt_embeds": prompt_embeds}
+
+    def _empty_negative(self, positive):
+        """Embeddings used for a missing negative prompt."""
+        return self._cached_embeds("")
+
+    @staticmethod
+    def _concat_embeds(embeds):
+        return {name: torch.cat([e[name] for e in embeds]) for name in embeds[0]}
+
+    def _apply_vae_tiling(self):
+        vae = getattr(self.pipe, "vae", None)
+        if vae is None or not hasattr(vae, "enable_tiling"):
+            return
+        if self.vae_tiling:
+            vae.enable_slicing()
+            vae.enable_tiling()
+        else:
+            vae.disable_slicing()
+            vae.disable_tiling()
+
     def generate(self, *args, **kwargs):
         if not self.pipe:
             raise RuntimeError("Pipeline not loaded.")
-        # Autocast is still beneficial even with offloading, as the active module is on XPU
-        with torch.xpu.amp.autocast(enabled=True, dtype=self.dtype):
+        self._apply_vae_tiling()
+        # Autocast is still beneficial even with offloading, as the active module is on the device
+        with self.backend.autocast(self.dtype):
             return self.pipe(*args, **kwargs)
\ No newline at end of file
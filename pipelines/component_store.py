@@ -0,0 +1,132 @@
+# pipelines/component_store.py
+import copy
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger("arttic_lab")
+
+# Components that fine-tunes commonly ship unchanged and that can be shared.
+SHAREABLE_COMPONENTS = ("vae", "text_encoder", "text_encoder_2", "text_encoder_3")
+TEXT_ENCODERS = ("text_encoder", "text_encoder_2", "text_encoder_3")
+# Key prefixes of LoRA / checkpoint tensors that patch a text encoder.
+TEXT_ENCODER_KEY_PREFIXES = (
+    "lora_te",
+    "te_",
+    "te1_",
+    "te2_",
+    "text_encoder",
+    "text_encoders.",
+    "cond_stage_model.",
+    "conditioner.",
+)
+HASH_CHUNK = 8 * 1024**2
+
+
+def hash_component_dir(path):
+    """SHA-256 over the safetensors weights of one diffusers component folder."""
+    digest = hashlib.sha256()
+    files = sorted(name for name in os.listdir(path) if name.endswith(".safetensors"))
+    if not files:
+        return None
+    for name in files:
+        digest.update(name.encode())
+        with open(os.path.join(path, name), "rb") as f:
+            while chunk := f.read(HASH_CHUNK):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def repo_component_keys(repo_id):
+    """Store keys for the shareable components of a Hugging Face base repo."""
+    return {name: f"{repo_id}/{name}" for name in SHAREABLE_COMPONENTS}
+
+
+def touches_text_encoders(keys):
+    return any(key.startswith(TEXT_ENCODER_KEY_PREFIXES) for key in keys)
+
+
+class ComponentStore:
+    """
+    Content-addressed registry of resident VAEs and text encoders. A pipeline
+    whose component hash matches an entry reuses that module instead of loading
+    a duplicate; entries are reference counted by owning pipeline and dropped
+    when the last owner releases them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.reused = 0
+
+    def acquire(self, key, owner):
+        """Returns the resident module for `key` and adds `owner` as a reference, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry["owners"].add(owner)
+            self.reused += 1
+            return entry["module"]
+
+    def register(self, key, module, owner, name):
+        with self._lock:
+            entry = self._entries.setdefault(
+                key, {"module": module, "name": name, "owners": set()}
+            )
+            entry["owners"].add(owner)
+
+    def release(self, owner):
+        """Drops every reference held by `owner`; returns the keys that were freed."""
+        freed = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                entry["owners"].discard(owner)
+                if not entry["owners"]:
+                    del self._entries[key]
+                    freed.append(key)
+        return freed
+
+    def refcount(self, module):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["module"] is module:
+                    return len(entry["owners"])
+        return 0
+
+    def make_private(self, module, owner):
+        """
+        Copy-on-write for a module about to be modified in place (e.g. a text
+        encoder receiving LoRA layers). Returns a module only `owner` uses.
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["module"] is not module:
+                    continue
+                entry["owners"].discard(owner)
+                if not entry["owners"]:
+                    # Sole owner: keep the module but stop offering it for reuse.
+                    del self._entries[key]
+                    return module
+                break
+            else:
+                return module
+        logger.info(f"Copying shared '{entry['name']}' before modifying it.")
+        return copy.deepcopy(module)
+
+    def refcounts(self):
+        """Per-component reference counts, e.g. for reporting on unload."""
+        with self._lock:
+            return [
+                {
+                    "key": key[:16],
+                    "component": entry["name"],
+                    "refs": len(entry["owners"]),
+                    "owners": sorted(entry["owners"]),
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+component_store = ComponentStore()
@@ -0,0 +1,190 @@
+# pipelines/conversion_cache.py
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from core.settings import settings
+from .component_store import SHAREABLE_COMPONENTS, hash_component_dir
+
+logger = logging.getLogger("arttic_lab")
+
+CONVERSION_CACHE_DIR = os.path.join("./cache", "converted")
+META_FILENAME = "arttic_conversion.json"
+GB = 1024**3
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ConversionCache:
+    """
+    Stores single-file checkpoints converted to the diffusers layout (one bf16
+    safetensors file plus config per component), keyed by the checkpoint's
+    content hash. Later loads use `from_pretrained` on the cached folder and
+    skip the LDM key remapping. The cache is bounded by
+    `settings["conversion_cache_gb"]`, evicting least recently used entries.
+    """
+
+    def __init__(self, cache_dir=CONVERSION_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_hash, pipeline_class, dtype):
+        dtype_name = str(dtype).replace("torch.", "")
+        return f"{model_hash[:32]}-{pipeline_class.__name__}-{dtype_name}"
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    # --- Lookup ---
+    def lookup(self, key):
+        """Returns the folder of a complete cached conversion, or None."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        meta["last_used"] = time.time()
+        self._write_meta(key, meta)
+        return self.path_for(key)
+
+    def record_load(self, key, load_seconds):
+        """Logs a cached load against the original conversion time."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return
+        convert_seconds = meta.get("convert_seconds")
+        meta["load_seconds"] = load_seconds
+        self._write_meta(key, meta)
+        if convert_seconds:
+            logger.info(
+                f"Loaded from conversion cache in {load_seconds:.1f}s "
+                f"(single-file load took {convert_seconds:.1f}s, "
+                f"{convert_seconds / max(load_seconds, 1e-6):.1f}x faster)."
+            )
+
+    def component_hashes(self, key):
+        """
+        Content hashes of the shareable components (VAE, text encoders) of a
+        cached conversion, computed once and kept in the entry's metadata.
+        """
+        meta = self._read_meta(key)
+        if meta is None:
+            return {}
+        if "components" not in meta:
+            folder = self.path_for(key)
+            hashes = {}
+            for name in SHAREABLE_COMPONENTS:
+                component_dir = os.path.join(folder, name)
+                if os.path.isdir(component_dir):
+                    component_hash = hash_component_dir(component_dir)
+                    if component_hash:
+                        hashes[name] = component_hash
+            meta["components"] = hashes
+            self._write_meta(key, meta)
+        return meta["components"]
+
+    # --- Insertion ---
+    def store(self, key, pipe, source_path, convert_seconds):
+        """Writes a freshly converted pipeline to the cache, then enforces the size limit."""
+        target = self.path_for(key)
+        tmp_dir = f"{target}.{os.getpid()}.tmp"
+        start = time.perf_counter()
+        with self._lock:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            pipe.save_pretrained(tmp_dir, safe_serialization=True)
+            size = _dir_size(tmp_dir)
+            meta = {
+                "source": os.path.abspath(source_path),
+                "created": time.time(),
+                "last_used": time.time(),
+                "bytes": size,
+                "convert_seconds": convert_seconds,
+            }
+            with open(os.path.join(tmp_dir, META_FILENAME), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp_dir, target)
+        logger.info(
+            f"Cached diffusers conversion ({size / GB:.1f} GB) in "
+            f"{time.perf_counter() - start:.1f}s."
+        )
+        self.evict(keep=key)
+
+    # --- Maintenance ---
+    def entries(self):
+        """Returns `{key: meta}` for every complete cache entry."""
+        if not os.path.isdir(self.cache_dir):
+            return {}
+        result = {}
+        for key in os.listdir(self.cache_dir):
+            if key.endswith(".tmp"):
+                continue  # A conversion still being written.
+            meta = self._read_meta(key)
+            if meta is not None:
+                result[key] = meta
+        return result
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache fits its budget."""
+        limit = settings["conversion_cache_gb"]
+        if limit is None:
+            return []
+        entries = self.entries()
+        total = sum(meta["bytes"] for meta in entries.values())
+        evicted = []
+        for key, meta in sorted(entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= limit * GB:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            total -= meta["bytes"]
+            evicted.append(key)
+        return evicted
+
+    def remove(self, key):
+        with self._lock:
+            shutil.rmtree(self.path_for(key), ignore_errors=True)
+        logger.info(f"Evicted '{key}' from the conversion cache.")
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "bytes": sum(meta["bytes"] for meta in entries.values()),
+            "limit_bytes": (
+                int(settings["conversion_cache_gb"] * GB)
+                if settings["conversion_cache_gb"] is not None
+                else None
+            ),
+            "entries": entries,
+        }
+
+    # --- Internals ---
+    def _read_meta(self, key):
+        try:
+            with open(os.path.join(self.path_for(key), META_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        path = os.path.join(self.path_for(key), META_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, path)
+
+
+conversion_cache = ConversionCache()
@@ -0,0 +1,259 @@
+# pipelines/devices.py
+import contextlib
+import logging
+import os
+
+import torch
+
+from core.settings import settings
+
+try:
+    import intel_extension_for_pytorch as ipex
+except ImportError:  # Optional: only needed for XPU and the optimized CPU path.
+    ipex = None
+
+logger = logging.getLogger("arttic_lab")
+
+
+class DeviceBackend:
+    """
+    Everything device specific the pipelines need: where tensors live, how to
+    autocast, seed, synchronize and free memory, and how to optimize modules.
+    Subclasses cover XPU and CPU; any other torch device uses this generic one.
+    """
+
+    name = None
+    # Lay out conv-heavy modules (UNet, VAE) as NHWC after loading.
+    channels_last = False
+
+    def __init__(self, device=None):
+        self.device = device or self.name
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @property
+    def default_dtype(self):
+        return torch.float16
+
+    def autocast(self, dtype):
+        try:
+            return torch.autocast(self.device, dtype=dtype)
+        except RuntimeError:
+            return contextlib.nullcontext()
+
+    def generator(self, seed):
+        return torch.Generator(self.device).manual_seed(int(seed))
+
+    def synchronize(self):
+        module = getattr(torch, self.device, None)
+        if module is not None and hasattr(module, "synchronize"):
+            module.synchronize()
+
+    def empty_cache(self):
+        module = getattr(torch, self.device, None)
+        if module is not None and hasattr(module, "empty_cache"):
+            module.empty_cache()
+
+    def total_memory(self):
+        """Device memory in bytes, or None when it is not known."""
+        try:
+            return getattr(torch, self.device).get_device_properties(0).total_memory
+        except Exception:
+            return None
+
+    def memory_allocated(self):
+        """Bytes currently allocated by tensors on the device, or None."""
+        try:
+            return getattr(torch, self.device).memory_allocated()
+        except Exception:
+            return None
+
+    def supports_offload(self):
+        """Whether model CPU offload makes sense, i.e. the device is not the host."""
+        return True
+
+    def optimize(self, module, dtype):
+        """Returns `module` prepared for fast inference on this device."""
+        return module.eval()
+
+    def configure(self):
+        """One-time process setup, called when the backend is first selected."""
+
+    def describe(self):
+        return self.device
+
+
+class XPUBackend(DeviceBackend):
+    """Intel Arc GPUs through IPEX."""
+
+    name = "xpu"
+
+    @classmethod
+    def is_available(cls):
+        return hasattr(torch, "xpu") and torch.xpu.is_available()
+
+    @property
+    def default_dtype(self):
+        return torch.bfloat16
+
+    def autocast(self, dtype):
+        return torch.xpu.amp.autocast(enabled=True, dtype=dtype)
+
+    def optimize(self, module, dtype):
+        if ipex is None:
+            return module.eval()
+        return ipex.optimize(module.eval(), dtype=dtype, inplace=True)
+
+    def describe(self):
+        return f"xpu ({torch.xpu.get_device_name(0)})"
+
+
+class CPUBackend(DeviceBackend):
+    """
+    Host inference: bf16 autocast on CPUs with native bf16 (AVX-512 BF16 /
+    AMX), float32 otherwise; oneDNN graph optimization through IPEX when it
+    is installed; channels-last convolutions; and intra-/inter-op threads
+    sized to the physical cores.
+    """
+
+    name = "cpu"
+    channels_last = True
+
+    @staticmethod
+    def _cpu_flags():
+        try:
+            with open("/proc/cpuinfo", "r") as f:
+                for line in f:
+                    if line.startswith("flags"):
+                        return set(line.split(":", 1)[1].split())
+        except OSError:
+            pass
+        return set()
+
+    @classmethod
+    def native_bf16(cls):
+        flags = cls._cpu_flags()
+        return bool(flags & {"avx512_bf16", "amx_bf16"})
+
+    @staticmethod
+    def physical_cores():
+        """Physical cores available to this process (hyper-threads excluded)."""
+        try:
+            allowed = os.sched_getaffinity(0)
+        except AttributeError:
+            allowed = set(range(os.cpu_count() or 1))
+        cores = set()
+        try:
+            with open("/proc/cpuinfo", "r") as f:
+                processor = physical_id = None
+                for line in f:
+                    key, _, value = line.partition(":")
+                    key, value = key.strip(), value.strip()
+                    if key == "processor":
+                        processor = int(value)
+                    elif key == "physical id":
+                        physical_id = value
+                    elif key == "core id" and processor in allowed:
+                        cores.add((physical_id, value))
+        except (OSError, ValueError):
+            pass
+        return len(cores) or len(allowed)
+
+    @property
+    def default_dtype(self):
+        return torch.bfloat16 if self.native_bf16() else torch.float32
+
+    def autocast(self, dtype):
+        if dtype == torch.float32:
+            return contextlib.nullcontext()
+        return torch.autocast("cpu", dtype=dtype)
+
+    def generator(self, seed):
+        return torch.Generator("cpu").manual_seed(int(seed))
+
+    def synchronize(self):
+        pass
+
+    def empty_cache(self):
+        pass
+
+    def total_memory(self):
+        return None
+
+    def memory_allocated(self):
+        return None
+
+    def supports_offload(self):
+        return False
+
+    def optimize(self, module, dtype):
+        module = module.eval()
+        if self.channels_last:
+            module = module.to(memory_format=torch.channels_last)
+        if ipex is None:
+            return module
+        return ipex.optimize(
+            module, dtype=dtype if dtype != torch.float32 else None, inplace=True
+        )
+
+    def configure(self):
+        threads = settings["cpu_threads"] or self.physical_cores()
+        torch.set_num_threads(threads)
+        try:
+            # Denoising is one big graph at a time; a single inter-op thread
+            # avoids oversubscribing the cores the intra-op pool already uses.
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already fixed once parallel work has started.
+        logger.info(
+            f"CPU backend: {threads} threads, "
+            f"{'bf16' if self.default_dtype == torch.bfloat16 else 'float32'}, "
+            f"IPEX {'on' if ipex is not None else 'off'}."
+        )
+
+    def describe(self):
+        return f"cpu ({self.physical_cores()} cores)"
+
+
+BACKENDS = {"xpu": XPUBackend, "cpu": CPUBackend}
+# Auto-detection order; "cpu" always works.
+AUTO_ORDER = ("xpu", "cuda", "mps", "cpu")
+
+_backend = None
+
+
+def _generic_available(name):
+    if name == "mps":
+        return hasattr(torch.backends, "mps") and torch.backends.mps.is_available()
+    module = getattr(torch, name, None)
+    return module is not None and hasattr(module, "is_available") and module.is_available()
+
+
+def get_backend():
+    """
+    The process-wide device backend for `settings["device"]`: "auto" picks
+    the first available of XPU, CUDA, MPS and CPU.
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    requested = settings["device"]
+    candidates = AUTO_ORDER if requested == "auto" else (requested,)
+    for name in candidates:
+        backend_class = BACKENDS.get(name)
+        if backend_class is not None:
+            available = backend_class.is_available()
+        else:
+            available = _generic_available(name)
+        if available:
+            _backend = (backend_class or DeviceBackend)(name)
+            break
+    else:
+        raise RuntimeError(f"Device '{requested}' is not available.")
+
+    _backend.configure()
+    logger.info(f"Using device backend: {_backend.describe()}")
+    return _backend
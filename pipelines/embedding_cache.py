@@ -0,0 +1,92 @@
+# pipelines/embedding_cache.py
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+
+from core.settings import settings
+
+logger = logging.getLogger("arttic_lab")
+
+MB = 1024**2
+_tokens = itertools.count(1)
+
+
+def encoder_token(module):
+    """
+    Identity of a text encoder's current weights. Unlike `id()` it is never
+    reused, and `renew_encoder_token` gives a module a fresh one before its
+    weights are patched in place.
+    """
+    token = getattr(module, "_arttic_embedding_token", None)
+    if token is None:
+        token = renew_encoder_token(module)
+    return token
+
+
+def renew_encoder_token(module):
+    token = next(_tokens)
+    module._arttic_embedding_token = token
+    return token
+
+
+class EmbeddingCache:
+    """
+    LRU cache of text-encoder outputs for single prompts, keyed by the
+    identity of the encoders that produced them, the text-encoder LoRAs in
+    effect and the prompt text. Values are dicts of batch-1 tensors (e.g.
+    `prompt_embeds`, `pooled_prompt_embeds`) kept where they were computed,
+    bounded by `settings["embedding_cache_mb"]`. Encoders shared between
+    pipelines share their cache entries too.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_encode(self, key, encode):
+        """Returns the cached embeddings for `key`, calling `encode()` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry["embeds"]
+            self.misses += 1
+
+        embeds = encode()
+        size = sum(t.numel() * t.element_size() for t in embeds.values())
+        budget = settings["embedding_cache_mb"] * MB
+        if size > budget:
+            return embeds
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = {"embeds": embeds, "bytes": size}
+                self._bytes += size
+            while self._bytes > budget:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old["bytes"]
+        return embeds
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "limit_bytes": settings["embedding_cache_mb"] * MB,
+            }
+
+
+embedding_cache = EmbeddingCache()
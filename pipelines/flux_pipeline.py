@@ -5,6 +5,8 @@ import logging
 from diffusers import FluxPipeline
 from huggingface_hub.errors import GatedRepoError
 from .base_pipeline import ArtTicPipeline
+from .component_store import repo_component_keys
+from .model_index import read_safetensors_header
 
 logger = logging.getLogger("arttic_lab")
 
@@ -16,9 +18,16 @@ FLUX_SCHNELL_BASE_REPO = "black-forest-labs/FLUX.1-schnell"
 class ArtTicFLUXPipeline(ArtTicPipeline):
     """A unified pipeline for both FLUX.1 DEV and FLUX.1 Schnell models."""
 
-    def __init__(self, model_path, dtype=torch.bfloat16, is_schnell=False):
+    latent_format = "flux"
+    bucket_family = "xl"
+    scheduler_swappable = False
+    # Guidance is distilled into the model; there is no negative branch.
+    uses_negative_prompt = False
+
+    def __init__(self, model_path, dtype=None, is_schnell=False):
         super().__init__(model_path, dtype)
         self.is_schnell = is_schnell
+        self.default_steps = 4 if is_schnell else 28
 
     def load_pipeline(self, progress):
         if self.is_schnell:
@@ -33,10 +42,12 @@ class ArtTicFLUXPipeline(ArtTicPipeline):
             # CORRECTED: Removed the 'variant' and 'source_pt_format' arguments
             # as the official FLUX repos do not use them. The 'torch_dtype'
             # parameter is sufficient for loading in the correct precision.
-            self.pipe = FluxPipeline.from_pretrained(
+            self._load_pretrained(
+                FluxPipeline,
                 repo_id,
-                torch_dtype=self.dtype,
-                use_safetensors=True,
+                progress,
+                # Every model built on this repo shares its VAE and text encoders.
+                component_hashes=repo_component_keys(repo_id),
             )
         except GatedRepoError as e:
             logger.error(
@@ -55,12 +66,23 @@ class ArtTicFLUXPipeline(ArtTicPipeline):
             )
 
         progress(0.5, desc="Injecting local model weights...")
-        self.pipe.load_lora_weights(self.model_path)
+        self.make_text_encoders_private(read_safetensors_header(self.model_path)[0].keys())
+        self.pipe.load_lora_weights(self.model_path, adapter_name="base")
+        self.base_adapters.append("base")
         model_type = "Schnell" if self.is_schnell else "DEV"
         logger.info(
             f"Successfully injected FLUX {model_type} weights from '{self.model_path}'"
         )
 
+    def _run_text_encoders(self, text):
+        prompt_embeds, pooled_prompt_embeds, _ = self.pipe.encode_prompt(
+            prompt=text,
+            prompt_2=text,
+            device=self.pipe._execution_device,
+            num_images_per_prompt=1,
+        )
+        return {"prompt_embeds": prompt_embeds, "pooled_prompt_embeds": pooled_prompt_embeds}
+
     def generate(self, *args, **kwargs):
         if self.is_schnell and "negative_prompt" in kwargs:
             logger.info(
@@ -0,0 +1,156 @@
+# pipelines/loading.py
+import importlib
+import json
+import logging
+import os
+import resource
+import threading
+import time
+
+import torch
+
+logger = logging.getLogger("arttic_lab")
+
+LOAD_STATS_PATH = os.path.join("./cache", "load_stats.json")
+GB = 1024**3
+
+# model_index.json libraries whose entries are weight-carrying modules.
+MODEL_LIBRARIES = ("diffusers", "transformers")
+
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux), or None."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakRSSSampler:
+    """
+    Context manager that samples the process RSS on a background thread and
+    records the peak, so the memory cost of a single load can be measured.
+    """
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            # No /proc: fall back to the lifetime peak (ru_maxrss is in KiB on Linux).
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+
+class LoadStats:
+    """Persists the latest wall time and peak RSS of each (pipeline class, load mode)."""
+
+    def __init__(self, path=LOAD_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, pipeline_name, mode, seconds, sampler):
+        entry = {"seconds": seconds, "peak_rss_bytes": sampler.peak}
+        if sampler.baseline is not None and sampler.peak is not None:
+            entry["rss_increase_bytes"] = sampler.peak - sampler.baseline
+        with self._lock:
+            stats = self._read()
+            stats.setdefault(pipeline_name, {})[mode] = entry
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+        peak = f"{sampler.peak / GB:.2f} GB" if sampler.peak is not None else "n/a"
+        logger.info(f"{pipeline_name} loaded ({mode}) in {seconds:.1f}s, peak RSS {peak}.")
+        other = stats[pipeline_name].get("eager" if mode == "lazy" else "lazy")
+        if other and other.get("peak_rss_bytes") and sampler.peak:
+            logger.info(
+                f"  vs. last {'eager' if mode == 'lazy' else 'lazy'} load: "
+                f"{other['seconds']:.1f}s, peak RSS {other['peak_rss_bytes'] / GB:.2f} GB."
+            )
+
+    def all(self):
+        with self._lock:
+            return self._read()
+
+
+load_stats = LoadStats()
+
+
+def _component_class(library, class_name):
+    try:
+        module = importlib.import_module(library)
+        return getattr(module, class_name)
+    except (ImportError, AttributeError):
+        return None
+
+
+def load_components_lazily(pipeline_class, source, dtype, device, progress=None, **kwargs):
+    """
+    Builds a diffusers pipeline from a diffusers-layout folder or repo one
+    component at a time. Each model is materialized from the memory-mapped
+    safetensors straight into `dtype` on `device` before the next is read, so
+    peak host RAM stays near the largest single component.
+    """
+    config = pipeline_class.load_config(source)
+    names = [
+        name
+        for name, value in config.items()
+        if not name.startswith("_")
+        and isinstance(value, (list, tuple))
+        and value[0] in MODEL_LIBRARIES
+        and name not in kwargs
+    ]
+
+    components = {}
+    for i, name in enumerate(names):
+        library, class_name = config[name]
+        cls = _component_class(library, class_name)
+        if cls is None or not issubclass(cls, torch.nn.Module):
+            continue  # Tokenizers, schedulers etc. are loaded by from_pretrained below.
+        if progress:
+            progress(0.2 + 0.4 * i / max(len(names), 1), desc=f"Loading {name}...")
+        load_kwargs = {"subfolder": name, "torch_dtype": dtype, "low_cpu_mem_usage": True}
+        if device != "cpu":
+            try:
+                components[name] = cls.from_pretrained(
+                    source, device_map={"": device}, **load_kwargs
+                )
+                continue
+            except (TypeError, ValueError, NotImplementedError) as e:
+                logger.debug(f"Direct-to-device load of '{name}' unsupported ({e}).")
+        components[name] = cls.from_pretrained(source, **load_kwargs).to(device)
+
+    return pipeline_class.from_pretrained(
+        source, torch_dtype=dtype, **components, **kwargs
+    )
@@ -0,0 +1,179 @@
+# pipelines/model_index.py
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from collections import Counter
+
+logger = logging.getLogger("arttic_lab")
+
+INDEX_PATH = os.path.join("./cache", "model_index.json")
+INDEX_VERSION = 1
+
+# Content hash: the header plus this many evenly spaced samples of the file body.
+HASH_SAMPLES = 16
+HASH_SAMPLE_SIZE = 1024 * 1024
+
+SD2_MARKER_KEY = (
+    "model.diffusion_model.input_blocks.8.1.transformer_blocks.0.attn2.to_k.weight"
+)
+
+
+def read_safetensors_header(path):
+    """Reads only the JSON header of a .safetensors file (no tensor data)."""
+    with open(path, "rb") as f:
+        (length,) = struct.unpack("<Q", f.read(8))
+        header_bytes = f.read(length)
+    return json.loads(header_bytes), header_bytes
+
+
+def detect_architecture(keys):
+    """
+    Single pass over the tensor names that returns one of "sd3", "flux-dev",
+    "flux-schnell", "sdxl", "sd2" or "sd15". `keys` should support fast
+    membership tests (a dict or set).
+    """
+    is_xl = is_flux = has_guidance = False
+    for key in keys:
+        if key.startswith("text_encoders."):
+            return "sd3"
+        if key.startswith("conditioner.embedders.1"):
+            is_xl = True
+        elif "double_blocks." in key:
+            is_flux = True
+        elif "guidance_in." in key:
+            has_guidance = True
+    if is_flux:
+        return "flux-dev" if has_guidance else "flux-schnell"
+    if is_xl:
+        return "sdxl"
+    if SD2_MARKER_KEY in keys:
+        return "sd2"
+    return "sd15"
+
+
+def _summarize(header):
+    """Dominant dtype and total parameter count from a parsed header."""
+    dtype_params = Counter()
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        count = 1
+        for dim in info["shape"]:
+            count *= dim
+        dtype_params[info["dtype"]] += count
+    parameters = sum(dtype_params.values())
+    dtype = dtype_params.most_common(1)[0][0] if dtype_params else None
+    return dtype, parameters
+
+
+def _content_hash(path, header_bytes, size):
+    """
+    Cheap, stable fingerprint of a checkpoint: SHA-256 over the header and
+    evenly spaced 1 MiB samples of the tensor data. Reading ~16 MiB instead of
+    the whole file keeps it fast on network storage.
+    """
+    digest = hashlib.sha256()
+    digest.update(struct.pack("<Q", size))
+    digest.update(header_bytes)
+    data_start = 8 + len(header_bytes)
+    data_size = size - data_start
+    with open(path, "rb") as f:
+        if data_size <= HASH_SAMPLES * HASH_SAMPLE_SIZE:
+            f.seek(data_start)
+            digest.update(f.read())
+        else:
+            stride = (data_size - HASH_SAMPLE_SIZE) // (HASH_SAMPLES - 1)
+            for i in range(HASH_SAMPLES):
+                f.seek(data_start + i * stride)
+                digest.update(f.read(HASH_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+class ModelIndex:
+    """
+    On-disk cache of checkpoint metadata keyed by path and validated by size and
+    mtime. Files already seen cost one `os.stat`; new or changed files cost one
+    header read plus the sampled content hash.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self._entries = data.get("entries", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Model index at '{self.path}' is unreadable, rebuilding: {e}")
+
+    def save(self):
+        """Writes the index atomically if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "entries": self._entries}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def describe(self, model_path, save=True):
+        """Returns the (cached) metadata entry for a checkpoint."""
+        abs_path = os.path.abspath(model_path)
+        stat = os.stat(abs_path)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(abs_path)
+            if (
+                entry
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+            ):
+                return entry
+
+        header, header_bytes = read_safetensors_header(abs_path)
+        dtype, parameters = _summarize(header)
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "architecture": detect_architecture(header),
+            "dtype": dtype,
+            "parameters": parameters,
+            "tensors": len(header) - (1 if "__metadata__" in header else 0),
+            "hash": _content_hash(abs_path, header_bytes, stat.st_size),
+            "metadata": header.get("__metadata__", {}),
+        }
+        with self._lock:
+            self._entries[abs_path] = entry
+            self._dirty = True
+        if save:
+            self.save()
+        return entry
+
+    def prune(self):
+        """Forgets entries whose files no longer exist."""
+        with self._lock:
+            self._load()
+            missing = [p for p in self._entries if not os.path.exists(p)]
+            for path in missing:
+                del self._entries[path]
+            if missing:
+                self._dirty = True
+        self.save()
+
+
+model_index = ModelIndex()
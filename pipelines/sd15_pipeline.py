@@ -3,11 +3,12 @@ from diffusers import StableDiffusionPipeline
 from .base_pipeline import ArtTicPipeline
 
 class SD15Pipeline(ArtTicPipeline):
+    latent_format = "sd15"
+
     def load_pipeline(self, progress):
-        progress(0.2, desc="Loading StableDiffusionPipeline...")
-        self.pipe = StableDiffusionPipeline.from_single_file(
-            self.model_path,
-            torch_dtype=self.dtype,
-            use_safetensors=True,
-            safety_checker=None
-        )
\ No newline at end of file
+        self._load_single_file(
+            StableDiffusionPipeline,
+            progress,
+            "Loading StableDiffusionPipeline...",
+            safety_checker=None,
+        )
@@ -3,11 +3,13 @@ from diffusers import StableDiffusionPipeline
 from .base_pipeline import ArtTicPipeline
 
 class SD2Pipeline(ArtTicPipeline):
+    latent_format = "sd15"
+    bucket_family = "sd2"
+
     def load_pipeline(self, progress):
-        progress(0.2, desc="Loading StableDiffusionPipeline (v2)...")
-        self.pipe = StableDiffusionPipeline.from_single_file(
-            self.model_path,
-            torch_dtype=self.dtype,
-            use_safetensors=True,
-            safety_checker=None
-        )
\ No newline at end of file
+        self._load_single_file(
+            StableDiffusionPipeline,
+            progress,
+            "Loading StableDiffusionPipeline (v2)...",
+            safety_checker=None,
+        )
@@ -2,6 +2,8 @@
 import torch
 from diffusers import StableDiffusion3Pipeline
 from .base_pipeline import ArtTicPipeline
+from .component_store import repo_component_keys
+from .model_index import read_safetensors_header
 import logging
 
 logger = logging.getLogger("arttic_lab")
@@ -9,18 +11,37 @@ logger = logging.getLogger("arttic_lab")
 SD3_BASE_MODEL_REPO = "stabilityai/stable-diffusion-3-medium-diffusers"
 
 class SD3Pipeline(ArtTicPipeline):
+    latent_format = "sd3"
+    bucket_family = "xl"
+    scheduler_swappable = False
+    default_steps = 28
+
     def load_pipeline(self, progress):
         progress(0.2, desc="Loading base SD3 components from Hugging Face...")
         try:
-            self.pipe = StableDiffusion3Pipeline.from_pretrained(
+            self._load_pretrained(
+                StableDiffusion3Pipeline,
                 SD3_BASE_MODEL_REPO,
-                torch_dtype=self.dtype,
-                use_safetensors=True,
+                progress,
+                # Every model built on this repo shares its VAE and text encoders.
+                component_hashes=repo_component_keys(SD3_BASE_MODEL_REPO),
             )
         except Exception as e:
             logger.error(f"Failed to download SD3 base model. Check internet connection. Error: {e}")
             raise RuntimeError("Could not download base SD3 components from Hugging Face.")
 
         progress(0.5, desc="Injecting local model weights...")
-        self.pipe.load_lora_weights(self.model_path)
-        logger.info(f"Successfully injected weights from '{self.model_path}'")
\ No newline at end of file
+        self.make_text_encoders_private(read_safetensors_header(self.model_path)[0].keys())
+        self.pipe.load_lora_weights(self.model_path, adapter_name="base")
+        self.base_adapters.append("base")
+        logger.info(f"Successfully injected weights from '{self.model_path}'")
+    def _run_text_encoders(self, text):
+        prompt_embeds, _, pooled_prompt_embeds, _ = self.pipe.encode_prompt(
+            prompt=text,
+            prompt_2=text,
+            prompt_3=text,
+            device=self.pipe._execution_device,
+            num_images_per_prompt=1,
+            do_classifier_free_guidance=False,
+        )
+        return {"prompt_embeds": prompt_embeds, "pooled_prompt_embeds": pooled_prompt_embeds}
@@ -1,14 +1,31 @@
 # pipelines/sdxl_pipeline.py
+import torch
 from diffusers import StableDiffusionXLPipeline
 from .base_pipeline import ArtTicPipeline
 
 class SDXLPipeline(ArtTicPipeline):
+    latent_format = "sdxl"
+    bucket_family = "xl"
+
     def load_pipeline(self, progress):
-        progress(0.2, desc="Loading StableDiffusionXLPipeline...")
-        self.pipe = StableDiffusionXLPipeline.from_single_file(
-            self.model_path,
-            torch_dtype=self.dtype,
-            use_safetensors=True,
-            variant="fp16",
-            safety_checker=None
-        )
\ No newline at end of file
+        self._load_single_file(
+            StableDiffusionXLPipeline,
+            progress,
+            "Loading StableDiffusionXLPipeline...",
+            safety_checker=None,
+        )
+
+    def _run_text_encoders(self, text):
+        prompt_embeds, _, pooled_prompt_embeds, _ = self.pipe.encode_prompt(
+            text,
+            device=self.pipe._execution_device,
+            num_images_per_prompt=1,
+            do_classifier_free_guidance=False,
+        )
+        return {"prompt_embeds": prompt_embeds, "pooled_prompt_embeds": pooled_prompt_embeds}
+
+    def _empty_negative(self, positive):
+        # SDXL checkpoints are trained with zeroed embeddings for "no negative prompt".
+        if self.pipe.config.force_zeros_for_empty_prompt:
+            return {name: torch.zeros_like(value) for name, value in positive.items()}
+        return super()._empty_negative(positive)
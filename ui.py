@@ -1,24 +1,7 @@
 # ui.py
 import gradio as gr
 
-ASPECT_RATIOS_SD15 = {
-    "1:1": (512, 512),
-    "4:3": (576, 448),
-    "3:2": (608, 416),
-    "16:9": (672, 384),
-}
-ASPECT_RATIOS_SD2 = {
-    "1:1": (768, 768),
-    "4:3": (864, 640),
-    "3:2": (960, 640),
-    "16:9": (1024, 576),
-}
-ASPECT_RATIOS_SDXL_SD3_FLUX = {
-    "1:1": (1024, 1024),
-    "4:3": (1152, 896),
-    "3:2": (1216, 832),
-    "16:9": (1344, 768),
-}  # Renamed for clarity
+from core.buckets import ASPECT_RATIOS_SD15, ASPECT_RATIOS_SD2, ASPECT_RATIOS_SDXL_SD3_FLUX
 
 
 def create_ui(available_models, available_loras, schedulers_list, handlers):
@@ -188,6 +171,9 @@ def create_ui(available_models, available_loras, schedulers_list, handlers):
             outputs=[width_slider, height_slider],
         )
         randomize_seed_btn.click(fn=handlers["randomize_seed"], outputs=seed)
+        scheduler_dropdown.change(
+            fn=handlers["recommended_steps"], inputs=scheduler_dropdown, outputs=steps
+        )
         unload_model_btn.click(fn=handlers["unload_model"], outputs=status_text)
         vae_tiling_checkbox.change(
             fn=handlers["toggle_vae_tiling"], inputs=vae_tiling_checkbox
@@ -216,6 +202,8 @@ def create_ui(available_models, available_loras, schedulers_list, handlers):
             width_slider,
             height_slider,
             lora_weight_slider,
+            lora_dropdown,
+            scheduler_dropdown,
         ]
         generate_btn.click(
             fn=handlers["generate_image"],
@@ -1,11 +1,20 @@
 # web/server.py
 import asyncio
 import logging
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
+import os
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from jinja2 import Environment, FileSystemLoader
 from core import logic as core
+from core.events import event_bus
+from core.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from core.profiling import profiler, PROFILES_DIR, PROFILES_URL
+from core.jobs import job_queue, new_job_id, QueueFullError
+from core.worker_pool import worker_pool
+from core.thumbnails import THUMBNAIL_SIZES
+from core.image_writer import image_writer
+from core.previews import encode_preview_frame
 
 # --- Setup ---
 APP_LOGGER_NAME = "arttic_lab"
@@ -16,11 +25,46 @@ app = FastAPI()
 # Mount static files (CSS, JS, assets)
 app.mount("/static", StaticFiles(directory="web/static"), name="static")
 app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
+os.makedirs(PROFILES_DIR, exist_ok=True)
+app.mount(PROFILES_URL, StaticFiles(directory=PROFILES_DIR), name="profiles")
 
 # Setup Jinja2 for HTML templating
 env = Environment(loader=FileSystemLoader("web/templates"))
 index_template = env.get_template("index.html")
 
+# Actions that run on the generation worker, and the message type of their result.
+JOB_ACTIONS = {
+    "load_model": (core.load_model, "model_loaded"),
+    "generate_image": (core.generate_image, "generation_complete"),
+    "unload_model": (core.unload_model, "model_unloaded"),
+}
+
+
+def job_runner():
+    """The worker pool when it is running, otherwise the in-process job queue."""
+    return worker_pool if worker_pool.enabled else job_queue
+
+
+def submit_job(action, session, **kwargs):
+    """Submits an action to the worker pool or the job queue and returns the Job."""
+    func, _ = JOB_ACTIONS[action]
+    if worker_pool.enabled:
+        return worker_pool.submit(action, session=session, **kwargs)
+    return job_queue.submit(action, func, **kwargs)
+
+
+@app.on_event("shutdown")
+def stop_worker_pool():
+    """Stops the worker processes (if any) together with the server."""
+    worker_pool.shutdown()
+
+
+async def wait_for_image_file(result):
+    """Waits (without blocking the loop) until a generated image is on disk."""
+    write_future = image_writer.pending(result.get("image_filename", ""))
+    if write_future is not None:
+        await asyncio.wrap_future(write_future)
+
 
 # --- HTML Serving ---
 @app.get("/", response_class=HTMLResponse)
@@ -31,11 +75,103 @@ async def read_root():
 
 # --- REST API Endpoints ---
 @app.get("/api/config")
-async def get_initial_config():
+def get_initial_config():
     """Provides initial configuration data to the frontend."""
+    # Declared sync so FastAPI runs the directory scans in its threadpool.
     return core.get_config()
 
 
+@app.get("/api/gallery")
+def get_gallery(after: str = None, limit: int = 60, refresh: bool = False):
+    """Returns one page of the gallery, newest first; pass `next` back as `after`."""
+    return core.get_gallery_page(after=after, limit=limit, refresh=refresh)
+
+
+@app.get("/thumbnails/{size}/{filename}")
+def get_thumbnail(size: int, filename: str):
+    """Serves a cached thumbnail of an output image, rendering it on first request."""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=404, detail="Unknown thumbnail size.")
+    try:
+        path = core.get_thumbnail_path(filename, size)
+    except (FileNotFoundError, ValueError):
+        raise HTTPException(status_code=404, detail="Image not found.")
+    except (OSError, SyntaxError):
+        # Not a decodable image, e.g. a corrupt or truncated file.
+        raise HTTPException(status_code=415, detail="The image could not be read.")
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=86400"})
+
+
+@app.get("/api/models")
+def get_models():
+    """Lists models together with their indexed architecture, dtype and hash."""
+    return core.get_available_models(with_metadata=True)
+
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Returns hit/miss statistics and residency of the pipeline cache."""
+    return core.get_cache_stats()
+
+
+@app.get("/api/queue")
+async def get_queue():
+    """Returns the running job and the jobs waiting in the generation queue."""
+    return job_runner().snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus scrape endpoint: stage timings, queue depth, models and memory."""
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/api/profiles")
+def get_profiles():
+    """Lists captured profiles, newest first; `"profile": true` in a payload captures one."""
+    return profiler.list()
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Returns the status of a single job."""
+    job = job_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    if worker_pool.enabled:
+        return job.to_dict()
+    return {**job.to_dict(), "position": job_queue.position(job_id)}
+
+
+@app.post("/api/jobs")
+async def run_job(request: dict):
+    """Submits an action to the generation queue and waits for its result."""
+    action = request.get("action")
+    if action not in JOB_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action: {action}")
+    job_id = new_job_id()
+    try:
+        job = submit_job(
+            action,
+            # REST callers share one session: a load applies to later generations.
+            None,
+            job_id=job_id,
+            progress_callback=event_bus.progress_reporter(job_id),
+            **request.get("payload", {}),
+        )
+        result = await asyncio.wrap_future(job.future)
+        if action == "generate_image":
+            await wait_for_image_file(result)
+        return result
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        # Invalid parameters, e.g. a non-positive size or too many LoRAs.
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # --- WebSocket Communication ---
 class ConnectionManager:
     """Manages active WebSocket connections."""
@@ -48,80 +184,135 @@ class ConnectionManager:
         self.active_connections.append(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
 
     async def broadcast(self, message: dict):
         """Sends a message to all connected clients."""
-        for connection in self.active_connections:
-            await connection.send_json(message)
+        with metrics.timer("websocket_broadcast_seconds"):
+            for connection in list(self.active_connections):
+                try:
+                    await connection.send_json(message)
+                except Exception:
+                    self.disconnect(connection)
 
 
 manager = ConnectionManager()
+metrics.histogram(
+    "websocket_broadcast_seconds",
+    "Time to send one message to every connected WebSocket client.",
+)
+metrics.gauge(
+    "websocket_connections",
+    "Connected WebSocket clients.",
+    lambda: len(manager.active_connections),
+)
+# Strong references to in-flight action tasks so they are not garbage collected.
+background_tasks = set()
+
+
+async def handle_job_action(websocket: WebSocket, action, payload, job_ids):
+    """Runs one action on the generation worker and reports back to the client."""
+    loop = asyncio.get_running_loop()
+    _, result_type = JOB_ACTIONS[action]
+
+    def send_threadsafe(message):
+        # Called from the worker thread; hand the send over to the event loop.
+        asyncio.run_coroutine_threadsafe(websocket.send_json(message), loop)
+
+    def forward_event(event):
+        # Bus events are already throttled, so each one becomes one message.
+        if event.kind == "progress":
+            send_threadsafe({"type": "progress_update", "data": event.data})
+        elif event.kind == "preview":
+            # Previews go out as binary frames to avoid base64 overhead.
+            frame = encode_preview_frame(
+                event.job_id, event.data["step"], event.data["total"], event.data["image"]
+            )
+            asyncio.run_coroutine_threadsafe(websocket.send_bytes(frame), loop)
+
+    def position_callback(job, position):
+        send_threadsafe(
+            {
+                "type": "job_queued",
+                "data": {"job_id": job.id, "action": action, "position": position},
+            }
+        )
+
+    job = None
+    job_id = new_job_id()
+    token = event_bus.subscribe(forward_event, job_id=job_id)
+    extra = {}
+    if action == "generate_image":
+        extra["preview_callback"] = event_bus.preview_reporter(job_id)
+    try:
+        job = submit_job(
+            action,
+            websocket,
+            on_position=position_callback,
+            job_id=job_id,
+            progress_callback=event_bus.progress_reporter(job_id),
+            **extra,
+            **payload,
+        )
+        job_ids.add(job.id)
+        result = await asyncio.wrap_future(job.future)
+        if action == "generate_image":
+            # The worker has moved on; the file is still being encoded in the background.
+            await wait_for_image_file(result)
+        await websocket.send_json({"type": result_type, "data": result})
+
+        if action == "generate_image" and not (result.get("cached") or result.get("coalesced")):
+            # After generation, send everyone just the new gallery entry
+            await manager.broadcast(
+                {
+                    "type": "gallery_item_added",
+                    "data": {"image": result["image_filename"]},
+                }
+            )
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing action '{action}': {e}", exc_info=True)
+        try:
+            await websocket.send_json({"type": "error", "data": {"message": str(e)}})
+        except Exception:
+            pass
+    finally:
+        event_bus.unsubscribe(token)
+        if job is not None:
+            job_ids.discard(job.id)
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """The main WebSocket endpoint for real-time communication."""
     await manager.connect(websocket)
+    job_ids = set()
     try:
         while True:
             data = await websocket.receive_json()
             action = data.get("action")
             payload = data.get("payload", {})
 
-            # Create a callback function to send progress updates over WebSocket
-            async def progress_callback(progress, desc):
-                await websocket.send_json(
-                    {
-                        "type": "progress_update",
-                        "data": {"progress": progress, "description": desc},
-                    }
-                )
-
-            try:
-                if action == "load_model":
-                    # The core.load_model function now expects lora_name.
-                    # The payload from JS will provide it.
-                    result = core.load_model(
-                        **payload, progress_callback=progress_callback
-                    )
-                    await websocket.send_json({"type": "model_loaded", "data": result})
-
-                elif action == "generate_image":
-                    # The core.generate_image function now expects lora_weight.
-                    # The payload from JS will provide it.
-                    result = core.generate_image(
-                        **payload, progress_callback=progress_callback
-                    )
-                    await websocket.send_json(
-                        {"type": "generation_complete", "data": result}
-                    )
-                    # After generation, update everyone's gallery
-                    await manager.broadcast(
-                        {
-                            "type": "gallery_updated",
-                            "data": {"images": core.get_output_images()},
-                        }
-                    )
-
-                elif action == "unload_model":
-                    result = core.unload_model()
-                    await websocket.send_json(
-                        {"type": "model_unloaded", "data": result}
-                    )
-
-                else:
-                    logger.warning(f"Unknown WebSocket action received: {action}")
-
-            except Exception as e:
-                logger.error(f"Error processing action '{action}': {e}", exc_info=True)
-                await websocket.send_json(
-                    {"type": "error", "data": {"message": str(e)}}
+            if action in JOB_ACTIONS:
+                # The job runs on the worker thread; this loop keeps serving the socket.
+                task = asyncio.create_task(
+                    handle_job_action(websocket, action, payload, job_ids)
                 )
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+            else:
+                logger.warning(f"Unknown WebSocket action received: {action}")
 
     except WebSocketDisconnect:
         logger.info("Client disconnected.")
-        manager.disconnect(websocket)
     except Exception as e:
         logger.error(f"An unexpected error occurred in WebSocket: {e}", exc_info=True)
+    finally:
         manager.disconnect(websocket)
+        # Drop work nobody is waiting for anymore.
+        for job_id in list(job_ids):
+            job_runner().cancel(job_id)
+        if worker_pool.enabled:
+            worker_pool.end_session(websocket)
@@ -7,7 +7,10 @@ document.addEventListener("DOMContentLoaded", () => {
     isBusy: false,
     modelType: "SD 1.5",
     socket: null,
+    galleryNext: null,
+    previewUrl: null,
   };
+  const PREVIEW_FRAME_KIND = 1;
   const ASPECT_RATIOS = {
     "SD 1.5": {
       "1:1": [512, 512],
@@ -110,6 +113,7 @@ document.addEventListener("DOMContentLoaded", () => {
       grid: document.getElementById("gallery-grid"),
       placeholder: document.getElementById("gallery-placeholder"),
       refreshBtn: document.getElementById("refresh-gallery-btn"),
+      loadMoreBtn: document.getElementById("load-more-gallery-btn"),
     },
     lightbox: {
       container: document.getElementById("lightbox"),
@@ -125,9 +129,14 @@ document.addEventListener("DOMContentLoaded", () => {
       window.location.host
     }/ws`;
     state.socket = new WebSocket(url);
+    state.socket.binaryType = "arraybuffer";
     state.socket.onopen = () =>
       updateConnectionStatus("Connected", "connected");
     state.socket.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        handleBinaryFrame(event.data);
+        return;
+      }
       const { type, data } = JSON.parse(event.data);
       handleWebSocketMessage(type, data);
     };
@@ -154,9 +163,14 @@ document.addEventListener("DOMContentLoaded", () => {
       state.modelType = data.model_type;
       updateStatus(data.status_message, "ready");
       setDimensions(data.width, data.height);
+      setSteps(data.recommended_steps);
       setBusyState(false);
     },
     generation_complete: (data) => {
+      if (state.previewUrl) {
+        URL.revokeObjectURL(state.previewUrl);
+        state.previewUrl = null;
+      }
       const imageUrl = `/outputs/${data.image_filename}?t=${Date.now()}`;
       ui.generate.outputImage.src = imageUrl;
       ui.generate.downloadBtn.href = imageUrl;
@@ -178,13 +192,43 @@ document.addEventListener("DOMContentLoaded", () => {
       ui.progress.percent.textContent = `${percent}%`;
       ui.progress.barFill.style.width = `${percent}%`;
     },
-    gallery_updated: (data) => populateGallery(data.images),
+    job_queued: (data) => {
+      // Position 0 means the job has started; progress updates take over from here.
+      if (data.position > 0) {
+        showProgressBar(true);
+        ui.progress.label.textContent = `Queued... position ${data.position}`;
+        ui.progress.percent.textContent = "0%";
+        ui.progress.barFill.style.width = "0%";
+      }
+    },
+    gallery_item_added: (data) => prependGalleryItem(data.image),
     error: (data) => {
       alert(`An error occurred: ${data.message}`);
       setBusyState(false);
     },
   };
 
+  // Binary frame: kind (u8), job id length (u8), job id, step (u16), total (u16), JPEG.
+  function handleBinaryFrame(buffer) {
+    const view = new DataView(buffer);
+    if (view.getUint8(0) !== PREVIEW_FRAME_KIND) return;
+    const idLength = view.getUint8(1);
+    const offset = 2 + idLength;
+    const step = view.getUint16(offset);
+    const total = view.getUint16(offset + 2);
+    showLatentPreview(new Blob([buffer.slice(offset + 4)], { type: "image/jpeg" }), step, total);
+  }
+
+  function showLatentPreview(blob, step, total) {
+    if (!state.isBusy) return; // A late preview must not replace the final image.
+    if (state.previewUrl) URL.revokeObjectURL(state.previewUrl);
+    state.previewUrl = URL.createObjectURL(blob);
+    ui.generate.outputImage.src = state.previewUrl;
+    ui.generate.outputImage.classList.remove("hidden");
+    ui.generate.imagePlaceholder.classList.add("hidden");
+    ui.generate.infoText.textContent = `Preview at step ${step}/${total}`;
+  }
+
   function handleWebSocketMessage(type, data) {
     (
       messageHandlers[type] ||
@@ -235,6 +279,12 @@ document.addEventListener("DOMContentLoaded", () => {
     ui.params.heightSlider.dispatchEvent(new Event("input"));
   }
 
+  function setSteps(steps) {
+    if (!steps) return;
+    ui.params.stepsSlider.value = steps;
+    ui.params.stepsSlider.dispatchEvent(new Event("input"));
+  }
+
   // --- Custom Components ---
   function createCustomDropdown(container, options, onSelect) {
     const initialValue = options[0] || "No options";
@@ -271,23 +321,45 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 
-  function populateGallery(images) {
-    ui.gallery.grid.innerHTML = "";
-    const hasImages = images?.length > 0;
-    ui.gallery.placeholder.classList.toggle("hidden", hasImages);
-    if (hasImages) {
-      images.forEach((imageFile) => {
-        const item = document.createElement("div");
-        item.className = "gallery-item";
-        const imageUrl = `/outputs/${imageFile}`;
-        item.innerHTML = `<img src="${imageUrl}" alt="${imageFile}" class="gallery-item-image" loading="lazy"><div class="image-actions-overlay"><a href="${imageUrl}" download class="image-action-btn" title="Download Image"><span class="material-symbols-outlined">download</span></a><a href="${imageUrl}" target="_blank" class="image-action-btn" title="Open in New Tab"><span class="material-symbols-outlined">open_in_new</span></a></div>`;
-        item
-          .querySelector(".image-actions-overlay")
-          .addEventListener("click", (e) => e.stopPropagation());
-        item.addEventListener("click", () => openLightbox(imageUrl, imageFile));
-        ui.gallery.grid.appendChild(item);
-      });
-    }
+  function createGalleryItem(imageFile) {
+    const item = document.createElement("div");
+    item.className = "gallery-item";
+    const imageUrl = `/outputs/${imageFile}`;
+    const thumbnailUrl = `/thumbnails/256/${imageFile}`;
+    item.innerHTML = `<img src="${thumbnailUrl}" alt="${imageFile}" class="gallery-item-image" loading="lazy"><div class="image-actions-overlay"><a href="${imageUrl}" download class="image-action-btn" title="Download Image"><span class="material-symbols-outlined">download</span></a><a href="${imageUrl}" target="_blank" class="image-action-btn" title="Open in New Tab"><span class="material-symbols-outlined">open_in_new</span></a></div>`;
+    item
+      .querySelector(".image-actions-overlay")
+      .addEventListener("click", (e) => e.stopPropagation());
+    item.addEventListener("click", () => openLightbox(imageUrl, imageFile));
+    return item;
+  }
+
+  function populateGallery(images, next = null, append = false) {
+    if (!append) ui.gallery.grid.innerHTML = "";
+    images?.forEach((imageFile) =>
+      ui.gallery.grid.appendChild(createGalleryItem(imageFile))
+    );
+    state.galleryNext = next;
+    ui.gallery.loadMoreBtn.classList.toggle("hidden", !next);
+    ui.gallery.placeholder.classList.toggle(
+      "hidden",
+      ui.gallery.grid.children.length > 0
+    );
+  }
+
+  function prependGalleryItem(imageFile) {
+    ui.gallery.grid.prepend(createGalleryItem(imageFile));
+    ui.gallery.placeholder.classList.add("hidden");
+  }
+
+  async function fetchGalleryPage({ after = null, refresh = false } = {}) {
+    const params = new URLSearchParams();
+    if (after) params.set("after", after);
+    if (refresh) params.set("refresh", "true");
+    const response = await fetch(`/api/gallery?${params}`);
+    if (!response.ok) throw new Error("Failed to fetch gallery");
+    const page = await response.json();
+    populateGallery(page.images, page.next, Boolean(after));
   }
 
   function openLightbox(src, caption) {
@@ -366,6 +438,14 @@ document.addEventListener("DOMContentLoaded", () => {
         width: parseInt(ui.params.widthSlider.value),
         height: parseInt(ui.params.heightSlider.value),
         lora_weight: parseFloat(ui.lora.weightSlider.value),
+        scheduler_name: ui.model.samplerDropdown.dataset.value,
+        // LoRAs are hot-swapped per generation; no model reload needed.
+        loras: [
+          {
+            name: ui.lora.dropdown.dataset.value,
+            weight: parseFloat(ui.lora.weightSlider.value),
+          },
+        ],
       });
     });
 
@@ -412,9 +492,14 @@ document.addEventListener("DOMContentLoaded", () => {
     ui.lora.refreshBtn.addEventListener("click", () => refreshHandler("loras"));
 
     ui.gallery.refreshBtn.addEventListener("click", () =>
-      fetch("/api/config")
-        .then((res) => res.json())
-        .then((config) => populateGallery(config.gallery_images))
+      fetchGalleryPage({ refresh: true }).catch((error) =>
+        console.error("Failed to refresh gallery:", error)
+      )
+    );
+    ui.gallery.loadMoreBtn.addEventListener("click", () =>
+      fetchGalleryPage({ after: state.galleryNext }).catch((error) =>
+        console.error("Failed to load more images:", error)
+      )
     );
 
     ui.lightbox.closeBtn.addEventListener("click", () =>
@@ -434,9 +519,12 @@ document.addEventListener("DOMContentLoaded", () => {
         throw new Error(`HTTP error! status: ${response.status}`);
       const config = await response.json();
       createCustomDropdown(ui.model.dropdown, config.models);
-      createCustomDropdown(ui.model.samplerDropdown, config.schedulers);
+      // The sampler is applied per generation; suggest its usual step count.
+      createCustomDropdown(ui.model.samplerDropdown, config.schedulers, (name) =>
+        setSteps(config.scheduler_steps?.[name])
+      );
       createCustomDropdown(ui.lora.dropdown, ["None", ...config.loras]);
-      populateGallery(config.gallery_images);
+      populateGallery(config.gallery_images, config.gallery_next);
       setBusyState(false);
     } catch (error) {
       console.error("Failed to fetch initial config:", error);